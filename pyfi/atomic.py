@@ -0,0 +1,36 @@
+"""Replacing files so that readers only ever see the old or the new version.
+
+Used for everything pyfi writes over: scifi_data.csv (upsert.py), the build's
+outputs (build.py) and the watch date cache (watch_dates.py).
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w', **kwargs):
+    """Open a temp file that replaces ``path`` only if the block finishes.
+
+    The temp file is next to ``path``, so the rename stays on one filesystem,
+    and is on disk before it is renamed. It takes the mode of the file it
+    replaces, or 0644 for a new file (these are served to browsers).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        else:
+            os.chmod(tmp, 0o644)  # mkstemp makes it private
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Build the files derived from the catalog, rebuilding only what is out of date.
+
+Each stage declares the files it reads and writes. A stage runs when one of
+its outputs is missing, or when its inputs, its outputs or its own code have
+changed since it last ran (by SHA-256, recorded in data/.build_state.json).
+Stages that read another stage's outputs wait for it; the rest run in
+parallel. Every stage writes its outputs atomically, through a temp file.
+Stages that need an optional package are skipped, with a note, without it.
+
+    python build.py              # whatever is out of date
+    python build.py web_catalog  # just these stages (and what they need)
+    python build.py --force      # everything
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+import stats
+import watch_dates as dates
+from atomic import atomic_write
+from columns import typed_rows
+from upsert import upsert
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DATA = os.path.join(ROOT, 'data')
+STATE = os.path.join(DATA, '.build_state.json')
+
+CATALOG = os.path.join(ROOT, 'scifi_data.csv')
+WATCHED = os.path.join(ROOT, 'watched_films.csv')
+# Typed, columnar copy of the catalog for Python; see columns.read_columnar()
+COLUMNAR = os.path.join(DATA, 'catalog.arrow')
+# Names the current content-hashed JSON export of the catalog, see web_catalog()
+MANIFEST = os.path.join(DATA, 'catalog.json')
+# What stats.html shows, and the sums it is computed from; see stats.py
+STATS = os.path.join(DATA, 'stats.json')
+STATS_CACHE = os.path.join(DATA, '.stats_cache.json')
+# Observed and estimated watch dates, next to watched_films.csv; see watch_dates.py
+WATCH_DATES = dates.cache_path(WATCHED)
+
+STAGES = {}  # name -> (function, inputs, outputs, packages it requires)
+
+
+def stage(inputs, outputs, requires=()):
+    """Register a build stage reading ``inputs`` and writing ``outputs``."""
+    def register(function):
+        STAGES[function.__name__] = (function, inputs, outputs, requires)
+        return function
+    return register
+
+
+# Stages
+
+@stage(inputs=[CATALOG], outputs=[CATALOG])
+def catalog():
+    # Drops repeated imdbIDs; what clean_db.py does, in place
+    upsert({}, CATALOG)
+
+
+@stage(inputs=[CATALOG], outputs=[COLUMNAR], requires=['pyarrow'])
+def columnar():
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(pd.read_csv(CATALOG, index_col=0), preserve_index=False)
+    # Uncompressed Arrow IPC, so read_columnar() can map it instead of reading it
+    with atomic_write(COLUMNAR, 'wb') as f, pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+
+
+@stage(inputs=[CATALOG], outputs=[MANIFEST])
+def web_catalog():
+    # Minified JSON, named after a hash of its content so it can be cached forever,
+    # with .gz and .br copies for servers that send precompressed files. Clients
+    # (and the vote server) find the current name in the manifest.
+    films = typed_rows(CATALOG)
+    body = json.dumps(films, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    name = f'films.{hashlib.sha256(body).hexdigest()[:12]}.json'
+    path = os.path.join(DATA, name)
+    variants = {'': body, '.gz': gzip.compress(body, 9, mtime=0)}
+    if importlib.util.find_spec('brotli'):
+        import brotli
+
+        variants['.br'] = brotli.compress(body, quality=11)
+    for suffix, content in variants.items():
+        with atomic_write(path + suffix, 'wb') as f:
+            f.write(content)
+    with atomic_write(MANIFEST, encoding='utf-8') as f:
+        json.dump({'films': name, 'count': len(films), 'encodings': [s[1:] for s in variants if s]}, f)
+    # Exports of older versions of the catalog
+    for old in glob.glob(os.path.join(DATA, 'films.*.json*')):
+        if not old.startswith(path):
+            os.remove(old)
+
+
+# Reads the columnar copy. stats.py is an input too, so changing how the stats
+# are computed rebuilds them
+@stage(inputs=[COLUMNAR, WATCHED, stats.__file__], outputs=[STATS], requires=['pyarrow'])
+def site_stats():
+    content, cache, mode = stats.compute(COLUMNAR, WATCHED, stats.load_cache(STATS_CACHE))
+    with atomic_write(STATS, encoding='utf-8') as f:
+        json.dump(content, f, separators=(',', ':'), ensure_ascii=False)
+    with atomic_write(STATS_CACHE, encoding='utf-8') as f:
+        json.dump(cache, f)
+    print(f'{"site_stats":>14}: {mode} update')
+
+
+@stage(inputs=[WATCHED, dates.__file__], outputs=[WATCH_DATES])
+def watch_dates():
+    dates.refresh(WATCHED)
+
+
+# Running them
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_hash(function):
+    return hashlib.sha256(inspect.getsource(function).encode()).hexdigest()
+
+
+def fingerprint(name):
+    function, inputs, outputs, _ = STAGES[name]
+    return {
+        'code': code_hash(function),
+        'inputs': {os.path.relpath(p, ROOT): file_hash(p) for p in inputs},
+        'outputs': {os.path.relpath(p, ROOT): file_hash(p) for p in outputs},
+    }
+
+
+def dependencies(name):
+    """Stages whose outputs ``name`` reads (other than itself)."""
+    inputs = set(STAGES[name][1])
+    return {other for other, (_, _, outputs, _) in STAGES.items() if other != name and inputs & set(outputs)}
+
+
+def with_dependencies(names):
+    needed, todo = set(), list(names)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(dependencies(name))
+    return needed
+
+
+def load_state():
+    try:
+        with open(STATE, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def missing_packages(name):
+    return [package for package in STAGES[name][3] if importlib.util.find_spec(package) is None]
+
+
+def run_stage(name):
+    start = time.perf_counter()
+    STAGES[name][0]()
+    return time.perf_counter() - start
+
+
+def build(names, force=False, jobs=None):
+    """Run the stale stages among ``names`` and what they depend on. Returns False if one failed."""
+    state = load_state()
+    pending = with_dependencies(names)
+    done, failed, running = set(), set(), {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(jobs) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                deps = dependencies(name) & (pending | set(running.values()) | failed)
+                if deps & failed:
+                    pending.discard(name)
+                    failed.add(name)
+                    print(f'{name:>14}: skipped, {", ".join(sorted(deps & failed))} failed')
+                elif not deps:
+                    pending.discard(name)
+                    missing = missing_packages(name)
+                    # Checked only now, once anything it reads has been rebuilt
+                    if missing:
+                        done.add(name)
+                        print(f'{name:>14}: skipped, needs {", ".join(missing)}')
+                    elif not force and state.get(name) == fingerprint(name):
+                        done.add(name)
+                        print(f'{name:>14}: up to date')
+                    else:
+                        running[pool.submit(run_stage, name)] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    failed.add(name)
+                    print(f'{name:>14}: FAILED: {e!r}')
+                    continue
+                done.add(name)
+                # Inputs are hashed after the run too, so in-place stages count as up to date
+                state[name] = fingerprint(name)
+                print(f'{name:>14}: built in {seconds:.3f}s')
+    state = {name: entry for name, entry in state.items() if name in STAGES}
+    with atomic_write(STATE, encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    print(f'{len(done)} stages done, {len(failed)} failed, in {time.perf_counter() - start:.3f}s')
+    return not failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('stages', nargs='*', help=f'stages to build (default: all): {", ".join(STAGES)}')
+    parser.add_argument('--force', action='store_true', help='rebuild even if up to date')
+    parser.add_argument('--jobs', type=int, default=None, help='stages to run at once')
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f'unknown stages: {", ".join(sorted(unknown))}')
+    sys.exit(0 if build(args.stages or list(STAGES), args.force, args.jobs) else 1)
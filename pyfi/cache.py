@@ -0,0 +1,52 @@
+"""On-disk cache of raw OMDb and TMDb responses, so reruns don't refetch everything.
+
+Responses are kept in SQLite, one row per (imdbID, source), with the time they
+were fetched. Callers say how old a response may be when they ask for it, so
+different uses can apply different TTLs to the same rows: see field_groups() in
+films.py, where ratings expire much sooner than plots and posters.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(self, path):
+        # Shared by the fetcher's worker threads, one statement at a time
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                imdb_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                body TEXT NOT NULL,
+                PRIMARY KEY (imdb_id, source)
+            )
+        ''')
+
+    def get(self, imdb_id, source, max_age=None):
+        """The cached response, or None if there is none younger than ``max_age`` seconds."""
+        with self.lock:
+            row = self.db.execute('SELECT fetched_at, body FROM responses WHERE imdb_id = ? AND source = ?',
+                                  (imdb_id, source)).fetchone()
+        if row is None or (max_age is not None and time.time() - row[0] > max_age):
+            return None
+        return json.loads(row[1])
+
+    def put(self, imdb_id, source, data):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                            (imdb_id, source, time.time(), json.dumps(data)))
+
+    def fetched_at(self, source):
+        """{imdb_id: time fetched} for every cached response from ``source``."""
+        with self.lock:
+            return dict(self.db.execute('SELECT imdb_id, fetched_at FROM responses WHERE source = ?', (source,)))
+
+    def close(self):
+        self.db.close()
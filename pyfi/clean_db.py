@@ -1,8 +1,7 @@
 #%%
-import pandas as pd
-df = pd.read_csv('../scifi_data.csv')
-df
-df_clean=df.drop_duplicates(subset='imdbID').iloc[:,1:]
-df_clean
-df_clean.to_csv('../scifi_data.csv')
+# Drop films listed more than once (by imdbID), keeping the first row of each.
+# add_films_to_csv.py and refresh_stale.py already do this as they write.
+from upsert import upsert
+
+upsert({})
 # %%
@@ -0,0 +1,36 @@
+"""How the catalog's columns are typed, for everything that reads scifi_data.csv.
+
+Shared by pyfi/build.py, which writes the typed copies of the catalog, and by
+the vote server (vote/catalog.py), which reads the CSV itself only when those
+copies haven't been built. Only the standard library is needed to import it.
+"""
+
+import csv
+
+# Columns parsed as numbers, matching what PapaParse's dynamicTyping gives the browser
+NUMERIC_COLUMNS = ('Season', 'Year', 'Runtime', 'BoxOffice', 'IMDb', 'RT', 'Meta')
+
+
+def parse_number(value):
+    if value == '':
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return value  # e.g. a Year like "2019–2020"
+    return int(number) if number.is_integer() else number
+
+
+def typed_rows(path):
+    """The rows of the CSV at ``path`` as dicts, numbers parsed, without the pandas index column."""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [{key: parse_number(value) if key in NUMERIC_COLUMNS else value
+                 for key, value in row.items() if key}
+                for row in csv.DictReader(f)]
+
+
+def read_columnar(path):
+    """The Arrow IPC file at ``path`` (see build.py's columnar stage) as a memory-mapped pyarrow Table."""
+    import pyarrow as pa
+
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
@@ -0,0 +1,161 @@
+"""Fetch film data from OMDb and TMDb, many films at a time.
+
+One requests.Session per fetcher keeps connections alive between calls, with
+a pool as large as the number of worker threads. Every request goes through a
+shared rate limit, has a timeout, and is retried with exponential backoff
+(plus jitter) on connection errors, timeouts, 429s and 5xx responses, honouring
+Retry-After when the API sends one. Other errors fail that film only.
+
+The base URLs can be pointed at a local mock server, e.g. ``omdb_url`` and
+``tmdb_url`` in .env.
+
+With a ResponseCache (see cache.py), raw responses are kept on disk and reused
+until they are older than ``max_age[source]`` seconds.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OMDB_URL = 'http://www.omdbapi.com/'
+TMDB_URL = 'https://api.themoviedb.org/3'
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    pass
+
+
+def omdb_found(data):
+    # OMDb answers 200 with {"Response": "False"} for films it doesn't have (yet)
+    return data.get('Response') != 'False'
+
+
+def tmdb_answered(data):
+    # An empty movie_results is an answer (TMDb doesn't know the film); no movie_results is an error
+    return isinstance(data.get('movie_results'), list)
+
+
+class RateLimiter:
+    """Spaces out calls to wait() so that at most ``per_second`` return each second."""
+
+    def __init__(self, per_second):
+        self.interval = 1 / per_second if per_second else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class FilmFetcher:
+    def __init__(self, omdb_api_key, tmdb_auth, concurrency=8, rate=10, retries=4, backoff=0.5,
+                 timeout=10, omdb_url=OMDB_URL, tmdb_url=TMDB_URL, cache=None, max_age=None):
+        self.omdb_api_key = omdb_api_key
+        self.tmdb_headers = {'accept': 'application/json', 'Authorization': 'Bearer ' + tmdb_auth}
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.omdb_url = omdb_url
+        self.tmdb_url = tmdb_url.rstrip('/')
+        self.cache = cache
+        self.max_age = max_age or {}  # source -> seconds a cached response stays usable
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, url, params=None, headers=None):
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    if not response.ok:
+                        raise FetchError(f'{url} returned {response.status_code}')
+                    return response.json()
+                error = f'status {response.status_code}'
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+            if attempt < self.retries:
+                time.sleep(delay)
+        raise FetchError(f'{url} failed after {self.retries + 1} attempts: {error}')
+
+    def cached(self, source, imdb_id, max_age, fetch, valid):
+        """The response for ``imdb_id`` from ``source``, from the cache if it is fresh enough.
+
+        Only responses that pass ``valid`` are cached, so an error body is
+        never replayed from the cache: the next call asks the API again.
+        """
+        if self.cache is None:
+            return fetch()
+        if max_age is None:
+            max_age = self.max_age.get(source)
+        data = self.cache.get(imdb_id, source, max_age)
+        if data is None or not valid(data):
+            data = fetch()
+            if valid(data):
+                self.cache.put(imdb_id, source, data)
+        return data
+
+    def omdb(self, imdb_id, max_age=None):
+        data = self.cached('omdb', imdb_id, max_age, lambda: self.get_json(
+            self.omdb_url, params={'apikey': self.omdb_api_key, 'i': imdb_id}), omdb_found)
+        if not omdb_found(data):
+            raise FetchError(f"OMDb has no {imdb_id}: {data.get('Error')}")
+        return data
+
+    def tmdb(self, imdb_id, max_age=None):
+        """The TMDb movie for ``imdb_id``, or None if TMDb doesn't know it."""
+        data = self.cached('tmdb', imdb_id, max_age, lambda: self.get_json(
+            f'{self.tmdb_url}/find/{imdb_id}', params={'external_source': 'imdb_id'}, headers=self.tmdb_headers),
+            tmdb_answered)
+        if not tmdb_answered(data):
+            raise FetchError(f"TMDb find failed for {imdb_id}: {data.get('status_message')}")
+        results = data['movie_results']
+        return results[0] if results else None
+
+    def both(self, imdb_id, max_age=None):
+        return self.omdb(imdb_id, max_age), self.tmdb(imdb_id, max_age)
+
+    def fetch_many(self, imdb_ids, fetch=None):
+        """Run ``fetch`` (default both()) for every ID on the worker threads.
+
+        Returns {imdb_id: result} and {imdb_id: exception} for the ones that failed.
+        """
+        fetch = fetch or self.both
+
+        def attempt(imdb_id):
+            try:
+                return imdb_id, fetch(imdb_id), None
+            except Exception as e:  # One film's failure, whatever it is, mustn't abort the others
+                return imdb_id, None, e
+
+        results, failures = {}, {}
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for imdb_id, result, error in pool.map(attempt, imdb_ids):
+                if error is None:
+                    results[imdb_id] = result
+                else:
+                    failures[imdb_id] = error
+        return results, failures
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,118 @@
+"""Turning OMDb and TMDb responses into rows of scifi_data.csv.
+
+Shared by add_films_to_csv.py (new films) and refresh_stale.py (existing ones).
+"""
+
+import numpy as np
+
+from cache import ResponseCache
+from fetch import FilmFetcher, OMDB_URL, TMDB_URL
+
+DAY = 24 * 3600
+
+# Columns that rarely change, and those worth refreshing regularly. Title and
+# Season are ours to edit, so a refresh leaves them alone.
+STATIC_FIELDS = ['Year', 'Rated', 'Director', 'Actors', 'Language', 'Plot', 'IMDb_link', 'Runtime',
+                 'poster_path', 'backdrop_path']
+VOLATILE_FIELDS = ['BoxOffice', 'IMDb', 'RT', 'Meta']
+# Columns that come from TMDb rather than OMDb
+TMDB_FIELDS = ['poster_path', 'backdrop_path']
+# Columns pandas writes as floats, because some films have no value
+FLOAT_FIELDS = ['Season', 'BoxOffice', 'IMDb', 'RT', 'Meta']
+
+
+def field_groups(config):
+    """group -> (columns, sources they come from, days before they are stale), TTLs from .env."""
+    return {
+        'static': (STATIC_FIELDS, ('omdb', 'tmdb'), float(config.get('cache_static_ttl_days', 180))),
+        'volatile': (VOLATILE_FIELDS, ('omdb',), float(config.get('cache_volatile_ttl_days', 14))),
+    }
+
+
+def open_fetcher(config):
+    """A FilmFetcher set up from .env, caching responses in ``cache_path`` (responses.db)."""
+    groups = field_groups(config)
+    # New films may reuse any response still fresh enough for every group it feeds
+    max_age = {source: min(days for _, sources, days in groups.values() if source in sources) * DAY
+               for source in ('omdb', 'tmdb')}
+    return FilmFetcher(
+        config['omdb_api_key'], config['tmdb_auth'],
+        concurrency=int(config.get('fetch_concurrency', 8)),
+        rate=float(config.get('fetch_rate', 10)),  # requests per second, across both APIs
+        retries=int(config.get('fetch_retries', 4)),
+        timeout=float(config.get('fetch_timeout', 10)),
+        omdb_url=config.get('omdb_url', OMDB_URL),
+        tmdb_url=config.get('tmdb_url', TMDB_URL),
+        cache=ResponseCache(config.get('cache_path', 'responses.db')),
+        max_age=max_age,
+    )
+
+
+def get_scores(omdb_ratings):
+    sources = ['Internet Movie Database', 'Rotten Tomatoes', 'Metacritic']
+
+    def get_score(ratingslist, source):
+        scores = {}
+        for rating in ratingslist:
+            scores[rating['Source']] = rating['Value']
+        if source in scores.keys():
+            score = scores[source]
+            # print(score)
+            if source == sources[0]:
+                # print("IMDB")
+                score = float(score[:-3])
+            elif source == sources[1]:
+                # print("RT",score)
+                score = int(score[:-1])
+            elif source == sources[2]:
+                # print("Meta", score)
+                score = int(score[:-4])
+        else:
+            score = np.nan
+        # [ for rating in ratingslist]
+        return score
+    IMDb = get_score(omdb_ratings, 'Internet Movie Database')
+    RT = get_score(omdb_ratings, 'Rotten Tomatoes')
+    Metacritic = get_score(omdb_ratings, 'Metacritic')
+    return (IMDb, RT, Metacritic)
+
+
+def buildFilmDat(omdbDat, tmdbDat, season):
+    imdb_link = 'https://www.imdb.com/title/' + omdbDat['imdbID']
+    runtime = int(omdbDat['Runtime'][:-4])
+
+    boStr = omdbDat['BoxOffice']
+    if boStr == 'N/A':
+        boxoffice = None
+    else:
+        boxoffice = omdbDat['BoxOffice'][1:].replace(',', '')
+
+    IMDb, RT, Metacritic = get_scores(omdbDat['Ratings'])
+
+    fields = ['Title', 'imdbID', 'Year', 'Rated', 'Director',
+              'Actors', 'Language', 'Plot',]
+    out = {}
+    for field in fields:
+        out[field] = omdbDat[field]
+
+    out['IMDb_link'] = imdb_link
+    out['Runtime'] = runtime
+    out['BoxOffice'] = boxoffice
+    out['IMDb'] = IMDb
+    out['RT'] = RT
+    out['Meta'] = Metacritic
+    # TMDb doesn't know every film; leave its images empty rather than fail
+    out['poster_path'] = tmdbDat['poster_path'] if tmdbDat else None
+    out['backdrop_path'] = tmdbDat['backdrop_path'] if tmdbDat else None
+    out['Watched'] = ''
+    out['Season'] = season
+    return out
+
+
+def csv_value(field, value):
+    """``value`` as it appears in scifi_data.csv, written the way pandas writes it."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if field in FLOAT_FIELDS:
+        return str(float(value))
+    return str(value)
@@ -0,0 +1,54 @@
+# %%
+# Refresh the films in ../scifi_data.csv whose data has expired, and only those.
+# Ratings and box office go stale after cache_volatile_ttl_days (14), plots,
+# posters and the rest after cache_static_ttl_days (180), going by when their
+# OMDb/TMDb responses were last fetched (see cache.py). Expired responses are
+# fetched again and only the stale columns of those films are updated.
+import time
+
+from dotenv import dotenv_values
+
+from films import DAY, TMDB_FIELDS, buildFilmDat, csv_value, field_groups, open_fetcher
+from upsert import read_ids, upsert
+
+config = dotenv_values(".env")
+fetcher = open_fetcher(config)
+groups = field_groups(config)
+imdbIDs = read_ids()
+
+# %%
+now = time.time()
+fetched_at = {source: fetcher.cache.fetched_at(source) for source in ('omdb', 'tmdb')}
+stale = {}  # imdbID -> names of its stale field groups
+for imdbID in imdbIDs:
+    for name, (_, sources, days) in groups.items():
+        if any(now - fetched_at[source].get(imdbID, 0) > days * DAY for source in sources):
+            stale.setdefault(imdbID, []).append(name)
+print(len(stale), 'of', len(imdbIDs), 'films have expired data')
+
+
+# %%
+def refetch(imdbID):
+    # Fetch again only what the stale groups come from; the rest may come from the cache
+    sources = {source for name in stale[imdbID] for source in groups[name][1]}
+    omdbDat = fetcher.omdb(imdbID, max_age=0 if 'omdb' in sources else None)
+    tmdbDat = fetcher.tmdb(imdbID, max_age=0 if 'tmdb' in sources else None)
+    return buildFilmDat(omdbDat, tmdbDat, None), tmdbDat is not None
+
+
+refreshed, failed = fetcher.fetch_many(list(stale), refetch)
+for imdbID, error in failed.items():
+    print('Failed to refresh', imdbID, error)
+
+updates = {}
+for imdbID, (filmDat, in_tmdb) in refreshed.items():
+    fields = [field for name in stale[imdbID] for field in groups[name][0]]
+    if not in_tmdb:
+        # No TMDb match this time; keep the images we already have
+        fields = [field for field in fields if field not in TMDB_FIELDS]
+    updates[imdbID] = {field: csv_value(field, filmDat[field]) for field in fields}
+
+# %%
+# Rows that don't change are copied through exactly as they were
+_, changed = upsert(updates)
+print('Refreshed', len(refreshed), 'films,', changed, 'changed')
@@ -0,0 +1,168 @@
+"""The aggregates stats.html shows, computed once here instead of in every browser.
+
+The catalog is read from its memory-mapped Arrow copy (data/catalog.arrow),
+with its columns already typed, rather than parsed from scifi_data.csv.
+
+Everything on the page is a count or a sum over films, per season and over
+the whole catalog, split by whether the film has been watched. aggregate() computes those sums for a set of films in
+one vectorized groupby per dimension; render() turns them into stats.json.
+
+build.py keeps the sums, with what they were computed from, in a cache next
+to stats.json. Watching a film only moves it from the unwatched sums to the
+watched ones, so when the catalog is unchanged and watched_films.csv has
+only had rows appended, compute() reads just the new rows and adds their
+delta instead of starting over.
+"""
+
+import hashlib
+import io
+import json
+
+import pandas as pd
+
+from columns import read_columnar
+
+# Bump when aggregate() or render() change, to discard cached sums
+VERSION = 2
+
+# Summed per group; missing values count as 0, as stats.js always did
+VALUES = ['Runtime', 'IMDb', 'RT', 'Year']
+# dimension -> column of the films frame it groups by
+DIMENSIONS = {'total': 'total', 'season': 'Season'}
+SUMS_INDEX = ['dimension', 'key', 'watched']
+
+
+def read_films(columnar_path):
+    films = read_columnar(columnar_path).to_pandas()
+    year = pd.to_numeric(films['Year'].astype(str).str[:4], errors='coerce')  # "2019–2020" -> 2019
+    return pd.DataFrame({
+        'imdbID': films['imdbID'],
+        'total': 'all',
+        'Season': films['Season'].astype('Int64').astype(str),
+        'Runtime': films['Runtime'],
+        'IMDb': films['IMDb'],
+        'RT': films['RT'],
+        'Year': year,
+    }).fillna({column: 0 for column in VALUES})
+
+
+def read_watched_ids(data):
+    """The imdbIDs listed in the bytes of a watched_films.csv."""
+    watched = pd.read_csv(io.BytesIO(data), dtype=str, usecols=['imdbID'])
+    return set(watched['imdbID'].dropna())
+
+
+def aggregate(films, watched):
+    """Film counts ('n') and sums of VALUES by (dimension, key, watched).
+
+    The sums are linear in ``films``, so the sums for a set of films can be
+    added to or subtracted from another's.
+    """
+    films = films.assign(n=1, watched=watched)
+    parts = []
+    for dimension, column in DIMENSIONS.items():
+        rows = films[films[column].notna() & (films[column] != '') & (films[column] != '<NA>')]
+        part = rows.groupby([column, 'watched'])[['n'] + VALUES].sum()
+        part.index = pd.MultiIndex.from_arrays(
+            [[dimension] * len(part), part.index.get_level_values(0), part.index.get_level_values(1)],
+            names=SUMS_INDEX)
+        parts.append(part)
+    return pd.concat(parts)
+
+
+def split(sums, dimension):
+    """For each key of ``dimension``: sums over all films, and the watched films' count."""
+    part = sums.xs(dimension, level='dimension')
+    totals = part.groupby(level='key').sum()
+    watched = part['n'].unstack('watched', fill_value=0).reindex(columns=[True], fill_value=0)[True]
+    return totals, watched.reindex(totals.index, fill_value=0)
+
+
+def averages(n, n_watched, sums):
+    """One row of the season table, as stats.js lays it out."""
+    return {
+        'nFilms': int(n),
+        'nWatched': int(n_watched),
+        'nUnwatched': int(n - n_watched),
+        'complete': round(100 * n_watched / n, 2) if n else 0,
+        'runtime': round(sums['Runtime'] / n, 2) if n else 0,
+        'imdb': round(sums['IMDb'] / n, 2) if n else 0,
+        'rt': round(sums['RT'] / n, 2) if n else 0,
+        'year': round(sums['Year'] / n, 2) if n else 0,
+    }
+
+
+def render(sums):
+    """The contents of stats.json."""
+    seasons, season_watched = split(sums, 'season')
+    order = sorted(seasons.index, key=float)
+    table = {season: averages(seasons.at[season, 'n'], season_watched[season], seasons.loc[season])
+             for season in order}
+
+    total = sums.xs('total', level='dimension').droplevel('key')
+    both = total.sum()
+    watched = total.loc[True] if True in total.index else both * 0
+    unwatched = total.loc[False] if False in total.index else both * 0
+    table['Not'] = averages(unwatched['n'], 0, unwatched)
+    table['Watched'] = averages(watched['n'], watched['n'], watched)
+    table['Total'] = averages(both['n'], watched['n'], both)
+    return {
+        'version': VERSION,
+        'seasons': table,
+        'minutesWatched': int(watched['Runtime']),
+    }
+
+
+def load_cache(path):
+    """The cache compute() returned last time, if it is still usable."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return cache if cache.get('version') == VERSION else None
+
+
+def compute(columnar_path, watched_path, cache=None):
+    """The contents of stats.json, the cache to keep for next time, and 'full' or 'incremental'.
+
+    ``columnar_path`` is the catalog's Arrow copy (build.py's columnar stage).
+    ``cache`` is what the last call returned (see load_cache()); it is used
+    when only watches have been appended since.
+    """
+    with open(columnar_path, 'rb') as f:
+        catalog_hash = hashlib.sha256(f.read()).hexdigest()
+    with open(watched_path, 'rb') as f:
+        watched_data = f.read()
+
+    size = cache and cache['watched_size']
+    appended = (cache is not None and cache['catalog'] == catalog_hash
+                and len(watched_data) >= size and watched_data[size - 1:size] == b'\n'
+                and hashlib.sha256(watched_data[:size]).hexdigest() == cache['watched_sha256'])
+
+    films = read_films(columnar_path)
+    if appended:
+        mode = 'incremental'
+        header = watched_data[:watched_data.index(b'\n') + 1]
+        seen = set(cache['watched_ids'])
+        new_ids = read_watched_ids(header + watched_data[size:]) - seen
+        newly = films[films['imdbID'].isin(new_ids)]
+        sums = (pd.DataFrame(cache['sums']).set_index(SUMS_INDEX)
+                .add(aggregate(newly, True), fill_value=0)
+                .sub(aggregate(newly, False), fill_value=0))
+        sums = sums[sums['n'] > 0]
+        watched_ids = seen | new_ids
+    else:
+        mode = 'full'
+        watched_ids = read_watched_ids(watched_data)
+        sums = aggregate(films, films['imdbID'].isin(watched_ids))
+
+    cache = {
+        'version': VERSION,
+        'catalog': catalog_hash,
+        'watched_size': len(watched_data),
+        'watched_sha256': hashlib.sha256(watched_data).hexdigest(),
+        'watched_ids': sorted(watched_ids),
+        'sums': sums.reset_index().to_dict('records'),
+    }
+    return render(sums), cache, mode
@@ -0,0 +1,138 @@
+"""FilmFetcher against a local mock of the OMDb and TMDb APIs.
+
+    cd pyfi && python -m pytest test_fetch.py
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from cache import ResponseCache
+from fetch import FetchError, FilmFetcher
+
+
+class MockAPI(BaseHTTPRequestHandler):
+    # The server (see api()) has .failures, {imdbID: 503s left}, and logs .requests, [(time, imdbID)]
+    protocol_version = 'HTTP/1.1'  # Keep-alive, as the real APIs
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/find/'):
+            imdb_id = url.path.rsplit('/', 1)[1]
+            if imdb_id == 'tt_tmdb_broken':
+                body = {'status_message': 'Something went wrong'}
+            elif imdb_id == 'tt_tmdb_unknown':
+                body = {'movie_results': []}
+            else:
+                body = {'movie_results': [{'poster_path': f'/{imdb_id}.jpg', 'backdrop_path': None}]}
+        else:
+            imdb_id = parse_qs(url.query)['i'][0]
+            if imdb_id == 'tt_omdb_unknown':
+                body = {'Response': 'False', 'Error': 'Incorrect IMDb ID.'}
+            else:
+                body = {'Response': 'True', 'imdbID': imdb_id, 'Title': 'Film ' + imdb_id}
+        with self.server.lock:
+            self.server.requests.append((time.monotonic(), imdb_id))
+            failing = self.server.failures.get(imdb_id, 0)
+            if failing:
+                self.server.failures[imdb_id] = failing - 1
+        if failing:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockAPI)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.failures = {}
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_fetcher(api, **kwargs):
+    url = f'http://127.0.0.1:{api.server_address[1]}'
+    options = {'rate': 0, 'backoff': 0.02, 'timeout': 5, 'omdb_url': url + '/', 'tmdb_url': url}
+    options.update(kwargs)
+    return FilmFetcher('key', 'token', **options)
+
+
+def test_retries_with_backoff(api):
+    api.failures['tt1'] = 2
+    fetcher = make_fetcher(api, retries=3, backoff=0.05)
+    start = time.monotonic()
+    assert fetcher.omdb('tt1')['Title'] == 'Film tt1'
+    assert [imdb_id for _, imdb_id in api.requests] == ['tt1'] * 3
+    # At least backoff * (1 + 2) before the two retries
+    assert time.monotonic() - start >= 0.15
+
+
+def test_gives_up_after_retries(api):
+    api.failures['tt1'] = 10
+    fetcher = make_fetcher(api, retries=2)
+    with pytest.raises(FetchError, match='after 3 attempts'):
+        fetcher.omdb('tt1')
+    assert len(api.requests) == 3
+
+
+def test_rate_limit(api):
+    fetcher = make_fetcher(api, rate=20, concurrency=8)
+    results, failures = fetcher.fetch_many([f'tt{i}' for i in range(10)], fetcher.omdb)
+    assert len(results) == 10 and not failures
+    times = sorted(t for t, _ in api.requests)
+    # 10 requests at 20 a second, however many threads send them
+    assert times[-1] - times[0] >= 9 / 20 * 0.95
+
+
+def test_one_failure_does_not_abort_the_batch(api):
+    fetcher = make_fetcher(api, retries=1, concurrency=4)
+    api.failures['tt_flaky'] = 10
+
+    def fetch(imdb_id):
+        if imdb_id == 'tt_bug':
+            raise TypeError('parsing went wrong')
+        return fetcher.both(imdb_id)
+
+    ids = ['tt1', 'tt_omdb_unknown', 'tt_tmdb_broken', 'tt_flaky', 'tt_bug', 'tt_tmdb_unknown', 'tt2']
+    results, failures = fetcher.fetch_many(ids, fetch)
+    assert set(results) == {'tt1', 'tt_tmdb_unknown', 'tt2'}
+    assert results['tt_tmdb_unknown'][1] is None
+    assert set(failures) == {'tt_omdb_unknown', 'tt_tmdb_broken', 'tt_flaky', 'tt_bug'}
+    assert isinstance(failures['tt_bug'], TypeError)
+
+
+def test_error_bodies_are_not_cached(api, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.db'))
+    fetcher = make_fetcher(api, cache=cache, max_age={'omdb': 3600, 'tmdb': 3600})
+    fetcher.omdb('tt1')
+    for _ in range(2):
+        with pytest.raises(FetchError):
+            fetcher.omdb('tt_omdb_unknown')
+        with pytest.raises(FetchError):
+            fetcher.tmdb('tt_tmdb_broken')
+    fetcher.omdb('tt1')
+    # tt1 came from the cache the second time; the errors were asked for each time
+    assert [imdb_id for _, imdb_id in api.requests].count('tt1') == 1
+    assert len(api.requests) == 5
+    assert set(cache.fetched_at('omdb')) == {'tt1'}
+    assert not cache.fetched_at('tmdb')
@@ -0,0 +1,95 @@
+"""upsert() on small catalogs laid out like scifi_data.csv.
+
+    cd pyfi && python -m pytest test_upsert.py
+"""
+
+import csv
+import os
+import shutil
+
+import pytest
+
+from upsert import read_ids, upsert
+
+HEADER = ',Title,Season,imdbID,Year,IMDb\n'
+ROWS = [
+    '0,Alien,1.0,tt0078748,1979,8.5\n',
+    '1,Brazil,2.0,tt0088846,1985,7.9\n',
+    '2,"Solaris, The",3.0,tt0069293,1972,8.0\n',
+    '3,Zardoz,,tt0070948,1974,5.8\n',
+]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / 'scifi_data.csv'
+    path.write_text(HEADER + ''.join(ROWS), encoding='utf-8', newline='')
+    return str(path)
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_no_updates_leaves_the_file_byte_identical(catalog):
+    before = open(catalog, 'rb').read()
+    assert upsert({}, catalog) == (0, 0)
+    assert open(catalog, 'rb').read() == before
+
+
+def test_the_real_catalog_round_trips(tmp_path):
+    path = str(tmp_path / 'scifi_data.csv')
+    shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'scifi_data.csv'), path)
+    before = open(path, 'rb').read()
+    upsert({}, path)
+    assert open(path, 'rb').read() == before
+
+
+def test_new_films_are_inserted_in_title_order(catalog):
+    added, changed = upsert({
+        'tt0083658': {'Title': 'Blade Runner', 'Year': '1982', 'IMDb': '8.1'},
+        'tt0062622': {'Title': '2001: A Space Odyssey', 'Year': '1968'},
+        'tt9999999': {'Title': 'Zzz', 'NotAColumn': 'ignored'},
+    }, catalog)
+    assert (added, changed) == (3, 0)
+    rows = read_rows(catalog)
+    assert [row['Title'] for row in rows] == [
+        '2001: A Space Odyssey', 'Alien', 'Blade Runner', 'Brazil', 'Solaris, The', 'Zardoz', 'Zzz']
+    assert [row[''] for row in rows] == [str(i) for i in range(7)]
+    blade_runner = rows[2]
+    assert blade_runner['imdbID'] == 'tt0083658' and blade_runner['IMDb'] == '8.1'
+    assert blade_runner['Season'] == ''
+    assert 'NotAColumn' not in rows[-1]
+
+
+def test_existing_films_get_only_the_given_fields(catalog):
+    added, changed = upsert({
+        'tt0088846': {'IMDb': '8.0', 'Season': '2.0'},  # Season is unchanged
+        'tt0078748': {'IMDb': '8.5'},  # Nothing changes
+    }, catalog)
+    assert (added, changed) == (0, 1)
+    lines = open(catalog, encoding='utf-8').read().splitlines(keepends=True)
+    assert lines[2] == '1,Brazil,2.0,tt0088846,1985,8.0\n'
+    # Every other row is copied through untouched
+    assert lines[1:2] + lines[3:] == [ROWS[0]] + ROWS[2:]
+
+
+def test_repeated_imdb_ids_keep_their_first_row(catalog):
+    with open(catalog, 'a', encoding='utf-8', newline='') as f:
+        f.write('4,Alien,9.0,tt0078748,1979,1.0\n')
+        f.write('5,Zardoz again,,tt0070948,1974,5.8\n')
+    upsert({}, catalog)
+    rows = read_rows(catalog)
+    assert [row['Title'] for row in rows] == ['Alien', 'Brazil', 'Solaris, The', 'Zardoz']
+    assert rows[0]['Season'] == '1.0'
+    assert [row[''] for row in rows] == ['0', '1', '2', '3']
+    assert read_ids(catalog) == {'tt0078748', 'tt0088846', 'tt0069293', 'tt0070948'}
+
+
+def test_a_failed_run_leaves_the_catalog_alone(catalog):
+    before = open(catalog, 'rb').read()
+    with pytest.raises(TypeError):
+        upsert({'tt1': {'Title': None}}, catalog)  # Fails in the middle of the pass
+    assert open(catalog, 'rb').read() == before
+    assert os.listdir(os.path.dirname(catalog)) == ['scifi_data.csv']
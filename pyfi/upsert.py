@@ -0,0 +1,76 @@
+"""Add and update films in scifi_data.csv in one streaming pass, keyed by imdbID.
+
+The catalog is kept sorted by Title with a 0..n-1 index column, as pandas
+wrote it. upsert() reads it row by row and writes a new copy next to it:
+
+- rows for films being updated get just the fields that changed;
+- new films are merged in at their place in Title order;
+- a film listed twice keeps its first row (what clean_db.py used to do);
+- every other row is copied through untouched.
+
+The copy replaces the catalog with an atomic rename once it is complete and on
+disk, so an interrupted run leaves the old catalog as it was.
+"""
+
+import csv
+import heapq
+import os
+
+from atomic import atomic_write
+
+CATALOG = '../scifi_data.csv'
+
+
+def read_ids(path=CATALOG):
+    """The imdbIDs already in the catalog, without loading the rest of it."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['imdbID'] for row in csv.DictReader(f)}
+
+
+def upsert(updates, path=CATALOG):
+    """Apply ``updates``, {imdbID: {field: csv text}}, to the catalog at ``path``.
+
+    Films already in the catalog get the given fields; the others are added
+    and need at least a Title. Fields the catalog has no column for are
+    ignored. Returns (films added, films changed).
+    """
+    # New films have to be placed by Title before the pass reaches them, so
+    # first find out which films are new from a quick scan of the IDs
+    known = read_ids(path)
+    new = sorted((fields['Title'], 1, imdbID) for imdbID, fields in updates.items() if imdbID not in known)
+    n_changed = 0
+
+    # The catalog is closed before the copy replaces it (which Windows needs)
+    with atomic_write(path, newline='', encoding='utf-8') as out, open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        key, title = header.index('imdbID'), header.index('Title')
+        columns = {name: i for i, name in enumerate(header) if i}  # Column 0 is the index
+        existing = ((row[title], 0, row) for row in reader)
+
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(header)
+        seen = set()
+        # Both are in Title order; for equal titles existing rows come first
+        for _, is_new, item in heapq.merge(existing, new, key=lambda entry: entry[:2]):
+            if is_new:
+                imdbID, row = item, [''] * len(header)
+                row[key] = imdbID
+            else:
+                imdbID, row = item[key], item
+                if imdbID in seen:
+                    continue  # A duplicate; the first row wins
+            seen.add(imdbID)
+            changed = False
+            for name, value in updates.get(imdbID, {}).items():
+                i = columns.get(name)
+                if i is not None and row[i] != value:
+                    row[i] = value
+                    changed = True
+            if changed and not is_new:
+                n_changed += 1
+            row[0] = str(len(seen) - 1)
+            writer.writerow(row)
+    return len(new), n_changed
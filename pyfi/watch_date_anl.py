@@ -1,43 +1,29 @@
 #%%
 import matplotlib.dates as mdates
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 
-df = pd.read_csv(
-    'watched_films.csv',
-    comment='/',
-    dtype=str
-)
+from watch_dates import load
 
-# df=df[df['Title']=='']
+# Observed and estimated watch dates, cached next to watched_films.csv
+df = load()
+orig_mask = df['provenance'] == 'observed'
 
-# 2) Normalize empty strings to NA and remember which rows originally had a Date
-df = df.replace({'': pd.NA})
-orig_mask = df['Date'].notna()
-
-# 3) Fill missing Date from Date1, then parse
-# df['Date'] = df['Date'].fillna(df.get('Date1'))
-# df['Date'] = pd.to_datetime(df['Date'], dayfirst=True, errors='coerce')
-
-# 4) Assign row numbers
+# Assign row numbers
 df['RowNum'] = df.index + 1
-# 5) Convert dates to datetime, interpolate
-df['Date_dt']=pd.to_datetime(df['Date'],format="%d-%m-%y")
-df['estDate_dt'] = df['Date_dt'].interpolate()
 
-# 6) Plot: dates on x-axis, row number on y-axis
+# Plot: dates on x-axis, row number on y-axis
 fig,ax=plt.subplots(figsize=(12, 6))
 
-# unfilled markers for interpolated
-ax.scatter(df.loc[~orig_mask, 'estDate_dt'],
+# unfilled markers for estimated
+ax.scatter(df.loc[~orig_mask, 'date'],
            df.loc[~orig_mask, 'RowNum'],
            label='Interpolated Date',
            facecolors='none',
            edgecolors='red',
            marker='o')
 # filled markers for actual dates
-ax.scatter(df.loc[orig_mask, 'Date_dt'],
+ax.scatter(df.loc[orig_mask, 'date'],
             df.loc[orig_mask, 'RowNum'],
             label='Original Date',
             color='blue',
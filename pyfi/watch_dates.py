@@ -0,0 +1,132 @@
+"""Watch dates for every film in watched_films.csv, observed or estimated.
+
+Only some rows of watched_films.csv have a Date (or, failing that, a Date1).
+The rest are estimated from their place in the list, in one vectorized pass
+over it:
+
+- between two dated films, linearly by position ("interpolated");
+- before the first or after the last dated film, one film every STEP_DAYS
+  ("extrapolated").
+
+The results are cached in watch_dates.json next to the CSV, with a hash of the
+CSV they came from, and served from there: script.js reads that file, the
+plots call load(), and the vote server serves the file as it is. Nothing else
+estimates the dates. ``python build.py watch_dates`` or any load() refreshes
+it when the CSV has changed.
+"""
+
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from atomic import atomic_write
+
+WATCHED = '../watched_films.csv'
+CACHE_NAME = 'watch_dates.json'
+# Bump when the estimates or the cache's layout change, to discard old caches
+VERSION = 2
+
+# Where a film's observed date is read from, first one first
+DATE_COLUMNS = ['Date', 'Date1']
+# Days between films outside the dated range
+STEP_DAYS = 14
+
+
+def cache_path(path=WATCHED):
+    return os.path.join(os.path.dirname(path), CACHE_NAME)
+
+
+def read_watched(data):
+    """The films in the bytes of a watched_films.csv, in the order they were watched."""
+    columns = ['Title', 'imdbID'] + DATE_COLUMNS
+    # Date1 may be missing from the header altogether
+    watched = pd.read_csv(io.BytesIO(data), dtype=str, usecols=lambda column: column in columns)
+    watched = watched.reindex(columns=columns)
+    watched = watched[watched['imdbID'].notna() & ~watched['Title'].fillna('').str.startswith('//')]
+    return watched.reset_index(drop=True)
+
+
+def estimate(dates, step_days=STEP_DAYS):
+    """Fill the NaT gaps in ``dates`` (in watch order). Returns (dates, provenance).
+
+    Provenance is "observed", "interpolated", "extrapolated", or "unknown" when
+    there are fewer than two dates to estimate from.
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    observed = ~np.isnat(dates)
+    provenance = np.where(observed, 'observed', 'unknown').astype(object)
+    if observed.sum() < 2:
+        return dates, provenance
+
+    positions = np.arange(len(dates))
+    known = positions[observed]
+    days = dates[observed].astype(np.int64)
+    # Rounded down to whole days; the epsilon keeps exact days from flooring to the one before
+    estimated = np.floor(np.interp(positions, known, days) + 1e-9).astype(np.int64)
+    before, after = positions < known[0], positions > known[-1]
+    estimated[before] = days[0] - (known[0] - positions[before]) * step_days
+    estimated[after] = days[-1] + (positions[after] - known[-1]) * step_days
+    estimated[observed] = days
+
+    provenance[~observed] = 'interpolated'
+    provenance[before | after] = 'extrapolated'
+    return estimated.astype('datetime64[D]'), provenance
+
+
+def compute(data):
+    """imdbID, Title, date and provenance of each row of a watched_films.csv's bytes."""
+    watched = read_watched(data)
+    observed = pd.to_datetime(watched['Date'].fillna(watched['Date1']), format='%d-%m-%y', errors='coerce')
+    dates, provenance = estimate(observed)
+    return pd.DataFrame({
+        'imdbID': watched['imdbID'].str.strip(),
+        'Title': watched['Title'],
+        'date': pd.to_datetime(dates).astype('datetime64[ns]'),
+        'provenance': provenance,
+    })
+
+
+def to_json(dates, source):
+    return {
+        'version': VERSION,
+        'source': source,
+        'films': [{'imdbID': imdb_id, 'Title': title,
+                   'date': None if pd.isna(date) else date.strftime('%Y-%m-%d'), 'provenance': provenance}
+                  for imdb_id, title, date, provenance in dates.itertuples(index=False)],
+    }
+
+
+def from_json(cache):
+    films = pd.DataFrame(cache['films'], columns=['imdbID', 'Title', 'date', 'provenance'])
+    films['date'] = pd.to_datetime(films['date'], format='%Y-%m-%d').astype('datetime64[ns]')
+    return films
+
+
+def refresh(path=WATCHED, data=None):
+    """Recompute the watch dates from the CSV at ``path`` and rewrite its cache."""
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    dates = compute(data)
+    with atomic_write(cache_path(path), encoding='utf-8') as f:
+        json.dump(to_json(dates, hashlib.sha256(data).hexdigest()), f, separators=(',', ':'))
+    return dates
+
+
+def load(path=WATCHED):
+    """The watch dates as a DataFrame, from the cache if it matches the CSV (else refreshing it)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        with open(cache_path(path), encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = None
+    if (cache is not None and cache.get('version') == VERSION
+            and cache.get('source') == hashlib.sha256(data).hexdigest()):
+        return from_json(cache)
+    return refresh(path, data)
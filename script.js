@@ -3,245 +3,36 @@ let filmsData = []; // Store loaded films data globally
 let watchedFilms = []; // Store watched films data globally
 let urlBase = window.location.pathname;
 
-// Helper function to estimate missing dates based on known dates
-function estimateMissingDates(orderedFilms, watchDates) {
-    // Find films with actual dates to use as reference points
-    const filmsWithDates = orderedFilms.filter(film => film.hasDate);
-    
-    if (filmsWithDates.length < 2) {
-        console.log('Not enough dated films for interpolation');
-        return; // Not enough reference points for interpolation
-    }
-    
-    // Find sequences of films with missing dates
-    let currentStartIndex = 0;
-    
-    while (currentStartIndex < orderedFilms.length) {
-        // Find the next sequence of films without dates
-        let sequenceStart = -1;
-        let sequenceEnd = -1;
-        
-        // Find start of sequence (first film without a date)
-        for (let i = currentStartIndex; i < orderedFilms.length; i++) {
-            if (!orderedFilms[i].hasDate) {
-                sequenceStart = i;
-                break;
-            }
-        }
-        
-        // If no more sequences found, we're done
-        if (sequenceStart === -1) break;
-        
-        // Find end of sequence (next film with a date, or end of list)
-        for (let i = sequenceStart + 1; i < orderedFilms.length; i++) {
-            if (orderedFilms[i].hasDate) {
-                sequenceEnd = i - 1;
-                break;
-            }
-        }
-        
-        // If reached end of list without finding another date
-        if (sequenceEnd === -1) sequenceEnd = orderedFilms.length - 1;
-        
-        // Find reference dates before and after the sequence
-        let beforeDate = null;
-        let afterDate = null;
-        let beforeIndex = -1;
-        let afterIndex = -1;
-        
-        // Find the dated film before the sequence
-        for (let i = sequenceStart - 1; i >= 0; i--) {
-            if (orderedFilms[i].hasDate) {
-                beforeDate = orderedFilms[i].date;
-                beforeIndex = i;
-                break;
-            }
-        }
-        
-        // Find the dated film after the sequence
-        for (let i = sequenceEnd + 1; i < orderedFilms.length; i++) {
-            if (orderedFilms[i].hasDate) {
-                afterDate = orderedFilms[i].date;
-                afterIndex = i;
-                break;
-            }
-        }
-        
-        // Interpolate dates if we have before and after references
-        if (beforeDate && afterDate) {
-            // Parse the dates
-            const parseDate = dateStr => {
-                const [day, month, year] = dateStr.split('-').map(Number);
-                // Convert 2-digit year to 4-digit (assuming 20xx for reasonable dates)
-                const fullYear = year + (year < 50 ? 2000 : 1900);
-                return new Date(fullYear, month - 1, day);
-            };
-            
-            const beforeTime = parseDate(beforeDate).getTime();
-            const afterTime = parseDate(afterDate).getTime();
-            
-            // Calculate time difference
-            const totalDiff = afterTime - beforeTime;
-            const totalPositions = afterIndex - beforeIndex;
-            
-            // Interpolate for each position
-            for (let i = sequenceStart; i <= sequenceEnd; i++) {
-                const film = orderedFilms[i];
-                
-                // Calculate proportional date based on position
-                const positionRatio = (i - beforeIndex) / totalPositions;
-                const estimatedTime = beforeTime + (totalDiff * positionRatio);
-                const estimatedDate = new Date(estimatedTime);
-                
-                // Convert to dd-mm-yy format
-                const day = String(estimatedDate.getDate()).padStart(2, '0');
-                const month = String(estimatedDate.getMonth() + 1).padStart(2, '0');
-                const year = String(estimatedDate.getFullYear() % 100).padStart(2, '0');
-                const formattedDate = `${day}-${month}-${year}`;
-                
-                // Store the estimated date
-                watchDates.set(film.imdbID, { date: formattedDate, isEstimated: true });
-            }
-        } 
-        // Special case: we're at the beginning with no before reference
-        else if (!beforeDate && afterDate) {
-            // Assume films are watched roughly every 2 weeks before the first dated film
-            const parseDate = dateStr => {
-                const [day, month, year] = dateStr.split('-').map(Number);
-                const fullYear = year + (year < 50 ? 2000 : 1900);
-                return new Date(fullYear, month - 1, day);
-            };
-            
-            const afterDateTime = parseDate(afterDate);
-            
-            // Work backwards from the first dated film
-            for (let i = sequenceEnd; i >= sequenceStart; i--) {
-                const film = orderedFilms[i];
-                
-                // Subtract roughly 2 weeks per film (14 days)
-                const estimatedTime = new Date(afterDateTime.getTime() - ((afterIndex - i) * 14 * 24 * 60 * 60 * 1000));
-                
-                // Convert to dd-mm-yy format
-                const day = String(estimatedTime.getDate()).padStart(2, '0');
-                const month = String(estimatedTime.getMonth() + 1).padStart(2, '0');
-                const year = String(estimatedTime.getFullYear() % 100).padStart(2, '0');
-                const formattedDate = `${day}-${month}-${year}`;
-                
-                // Store the estimated date
-                watchDates.set(film.imdbID, { date: formattedDate, isEstimated: true });
-            }
-        } 
-        // Special case: we're at the end with no after reference
-        else if (beforeDate && !afterDate) {
-            // Assume films are watched roughly every 2 weeks after the last dated film
-            const parseDate = dateStr => {
-                const [day, month, year] = dateStr.split('-').map(Number);
-                const fullYear = year + (year < 50 ? 2000 : 1900);
-                return new Date(fullYear, month - 1, day);
-            };
-            
-            const beforeDateTime = parseDate(beforeDate);
-            
-            // Work forwards from the last dated film
-            for (let i = sequenceStart; i <= sequenceEnd; i++) {
-                const film = orderedFilms[i];
-                
-                // Add roughly 2 weeks per film (14 days)
-                const estimatedTime = new Date(beforeDateTime.getTime() + ((i - beforeIndex) * 14 * 24 * 60 * 60 * 1000));
-                
-                // Convert to dd-mm-yy format
-                const day = String(estimatedTime.getDate()).padStart(2, '0');
-                const month = String(estimatedTime.getMonth() + 1).padStart(2, '0');
-                const year = String(estimatedTime.getFullYear() % 100).padStart(2, '0');
-                const formattedDate = `${day}-${month}-${year}`;
-                
-                // Store the estimated date
-                watchDates.set(film.imdbID, { date: formattedDate, isEstimated: true });
-            }
-        }
-        
-        // Move to next potential sequence
-        currentStartIndex = sequenceEnd + 1;
-    }
-}
-
-// Load watched films list from CSV
-function loadWatchedFilmsCSV() {
-    return fetch('watched_films.csv')
+// Load watched films and their watch dates, observed or estimated, from
+// watch_dates.json. pyfi/watch_dates.py derives it from watched_films.csv, and
+// the build refreshes it whenever the CSV changes
+function loadWatchDates() {
+    return fetch('watch_dates.json', { cache: 'no-cache' })
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error! Status: ${response.status}`);
             }
-            return response.text();
+            return response.json();
         })
         .then(data => {
-            // Parse CSV data
-            const lines = data.split('\n');
-            
-            if (lines.length === 0) {
-                console.error('CSV file is empty');
-                return new Set();
-            }
-            
-            const headers = lines[0].split(',');
-            
-            // Clean headers to remove any carriage returns
-            const cleanHeaders = headers.map(header => header.trim().replace(/\r$/, ''));
-            console.log('Cleaned headers:', cleanHeaders);
-            
-            // Find the index positions for Title, imdbID, and Date
-            const titleIndex = cleanHeaders.indexOf('Title');
-            const imdbIDIndex = cleanHeaders.indexOf('imdbID');
-            const dateIndex = cleanHeaders.indexOf('Date');
-            
-            if (titleIndex === -1 || imdbIDIndex === -1) {
-                console.error('CSV headers not found:', cleanHeaders);
-                return { watchedIDs: new Set(), watchDates: new Map(), orderedFilms: [] };
-            }
-            
-            // Process each line (skip header)
             const watchedIDs = new Set();
             const watchDates = new Map(); // Map to store imdbID -> watch date
-            const orderedFilms = []; // Store films in order for date interpolation
-            
-            for (let i = 1; i < lines.length; i++) {
-                if (lines[i].trim() === '') continue; // Skip empty lines
-                
-                const values = lines[i].split(',');
-                if (values.length > imdbIDIndex) {
-                    // Clean the imdbID value to remove any carriage returns or whitespace
-                    const cleanImdbID = values[imdbIDIndex].trim().replace(/\r$/, '');
-                    if (cleanImdbID) {
-                        watchedIDs.add(cleanImdbID);
-                        
-                        // Create film entry with id and position
-                        const filmEntry = {
-                            imdbID: cleanImdbID,
-                            position: orderedFilms.length, // Store position for interpolation
-                            hasDate: false
-                        };
-                        
-                        // Store watch date if available
-                        if (dateIndex !== -1 && values.length > dateIndex) {
-                            const watchDate = values[dateIndex]?.trim().replace(/\r$/, '');
-                            if (watchDate) {
-                                watchDates.set(cleanImdbID, { date: watchDate, isEstimated: false });
-                                filmEntry.hasDate = true;
-                                filmEntry.date = watchDate;
-                            }
-                        }
-                        
-                        orderedFilms.push(filmEntry);
-                    }
+
+            data.films.forEach(film => {
+                watchedIDs.add(film.imdbID);
+                if (film.date) {
+                    // From yyyy-mm-dd to the dd-mm-yy the rest of the page uses
+                    const [year, month, day] = film.date.split('-');
+                    watchDates.set(film.imdbID, {
+                        date: `${day}-${month}-${year.slice(2)}`,
+                        isEstimated: film.provenance !== 'observed'
+                    });
                 }
-            }
-            
-            // Interpolate missing dates
-            estimateMissingDates(orderedFilms, watchDates);
-            
+            });
+
             console.log('Watched IDs found:', watchedIDs.size);
             console.log('Watch dates found:', watchDates.size);
-            return { watchedIDs, watchDates, orderedFilms };
+            return { watchedIDs, watchDates };
         });
 }
 
@@ -416,10 +207,9 @@ function displayFilms(films) {
     });
 }
 
-// Function to load films from CSV and populate the film list
-function loadFilms() {
-    // Fetch scifi_data.csv
-    fetch('scifi_data.csv')
+// Function to fetch and parse scifi_data.csv, when the JSON export isn't available
+function loadFilmsCSV() {
+    return fetch('scifi_data.csv')
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error! Status: ${response.status}`);
@@ -433,19 +223,49 @@ function loadFilms() {
                     skipEmptyLines: true,
                     dynamicTyping: true,
                     complete: function(results) {
-                        filmsData = results.data;
-                        console.log('Films data loaded:', filmsData.length, 'films');
-                        resolve(filmsData);
+                        resolve(results.data);
                     },
                     error: function(error) {
                         reject(error);
                     }
                 });
             });
+        });
+}
+
+// Function to fetch the catalog as built by pyfi/build.py: the small manifest is
+// revalidated every time, the content-hashed JSON it names can come from the cache
+function loadFilmsJSON() {
+    return fetch('data/catalog.json', { cache: 'no-cache' })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! Status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(manifest => fetch(`data/${manifest.films}`))
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! Status: ${response.status}`);
+            }
+            return response.json();
+        });
+}
+
+// Function to load films and populate the film list
+function loadFilms() {
+    loadFilmsJSON()
+        .catch(error => {
+            console.warn('No catalog export, parsing scifi_data.csv instead:', error);
+            return loadFilmsCSV();
+        })
+        .then(films => {
+            filmsData = films;
+            console.log('Films data loaded:', filmsData.length, 'films');
         })
         .then(() => {
-            // Then fetch watched_films.csv
-            return loadWatchedFilmsCSV();
+            // Then fetch the watched films and their dates
+            return loadWatchDates();
         })
         .then(result => {
             if (!result || !result.watchedIDs) {
@@ -454,7 +274,7 @@ function loadFilms() {
                 return;
             }
             
-            const { watchedIDs, watchDates, orderedFilms } = result;
+            const { watchedIDs, watchDates } = result;
             
             // Store the watched IDs in our global watchedFilms array
             watchedFilms = Array.from(watchedIDs);
@@ -1,10 +1,37 @@
 const log = console.log
 document.addEventListener("DOMContentLoaded", () => {
-    loadAndProcessStats();
+    loadStats();
 });
 
+// The stats are precomputed by pyfi/build.py into data/stats.json; the CSVs are
+// only downloaded and crunched here if it isn't available
+async function loadStats() {
+    try {
+        const statsResponse = await fetch("data/stats.json", { cache: "no-cache" });
+        if (!statsResponse.ok) throw new Error("Failed to load data/stats.json");
+        const stats = await statsResponse.json();
+        displayStats(stats.seasons);
+        displayFooterStats(stats.minutesWatched);
+    } catch (error) {
+        console.warn("No precomputed stats, computing them from the CSVs:", error);
+        loadAndProcessStats();
+    }
+}
+
+// PapaParse is only needed for the fallback, so it is only downloaded then
+function loadPapaParse() {
+    return new Promise((resolve, reject) => {
+        const script = document.createElement("script");
+        script.src = "https://cdnjs.cloudflare.com/ajax/libs/PapaParse/5.3.2/papaparse.min.js";
+        script.onload = resolve;
+        script.onerror = () => reject(new Error("Failed to load PapaParse"));
+        document.head.appendChild(script);
+    });
+}
+
 async function loadAndProcessStats() {
     try {
+        const papaLoaded = loadPapaParse();
         const scifiDataResponse = await fetch("scifi_data.csv");
         if (!scifiDataResponse.ok) throw new Error("Failed to load scifi_data.csv");
         const scifiDataText = await scifiDataResponse.text();
@@ -12,6 +39,7 @@ async function loadAndProcessStats() {
         const watchedFilmsResponse = await fetch("watched_films.csv");
         if (!watchedFilmsResponse.ok) throw new Error("Failed to load watched_films.csv");
         const watchedFilmsCsvText = await watchedFilmsResponse.text();
+        await papaLoaded;
 
         Papa.parse(scifiDataText, {
             header: true,
@@ -59,7 +87,7 @@ async function loadAndProcessStats() {
             }
         });
     } catch (error) {
-        console.error("Error fetching CSV files:", error);
+        console.error("Error loading the CSV files or PapaParse:", error);
     }
 }
 
@@ -0,0 +1,408 @@
+"""Pub/sub and leases shared by the vote server's worker processes.
+
+Each session is owned by exactly one worker, the one holding the session's
+lease. Other workers relay their sockets' messages to the owner and its
+broadcasts back to their sockets over broker channels (see cluster.py).
+
+Backends:
+    LocalBroker   - in-process, for a single worker and for tests
+    SocketBroker  - talks to a BrokerServer over a local unix socket, so several
+                    workers on one machine can share it without Redis:
+                        python broker.py /tmp/vote-broker.sock
+    RedisBroker   - Redis (or anything speaking its protocol) for several hosts
+
+Messages are plain strings.
+"""
+
+import abc
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict
+
+log = logging.getLogger("vote.broker")
+
+# Seconds SocketBroker waits for the BrokerServer to answer a claim or release
+CALL_TIMEOUT = 3.0
+
+# Seconds RedisBroker waits before reconnecting a dropped pub/sub connection,
+# doubling after each failed attempt up to the maximum
+RECONNECT_BACKOFF = 0.1
+RECONNECT_BACKOFF_MAX = 5.0
+
+
+class BrokerError(Exception):
+    """The broker could not be reached, or did not answer in time."""
+
+
+class Subscription:
+    def __init__(self, queue, unsubscribe):
+        self.queue = queue
+        self._unsubscribe = unsubscribe
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    async def close(self):
+        await self._unsubscribe(self.queue)
+
+
+class Broker(abc.ABC):
+    """Interface shared by the broker backends."""
+
+    @abc.abstractmethod
+    async def publish(self, channel, message):
+        pass
+
+    @abc.abstractmethod
+    async def subscribe(self, channel):
+        """Return a Subscription yielding every message published to ``channel`` from now on."""
+
+    @abc.abstractmethod
+    async def claim(self, key, owner, ttl):
+        """Take or renew the lease on ``key`` for ``ttl`` seconds. True if ``owner`` now holds it."""
+
+    @abc.abstractmethod
+    async def release(self, key, owner):
+        pass
+
+    async def close(self):
+        pass
+
+
+class LocalBroker(Broker):
+    def __init__(self):
+        self.channels = defaultdict(set)  # channel -> subscriber queues
+        self.leases = {}                  # key -> (owner, expiry)
+
+    async def publish(self, channel, message):
+        for queue in self.channels.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel):
+        queue = asyncio.Queue()
+        self.channels[channel].add(queue)
+        return Subscription(queue, lambda q: self._unsubscribe(channel, q))
+
+    async def _unsubscribe(self, channel, queue):
+        subscribers = self.channels.get(channel)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.channels[channel]
+
+    async def claim(self, key, owner, ttl):
+        now = time.monotonic()
+        current = self.leases.get(key)
+        if current is not None and current[0] != owner and current[1] > now:
+            return False
+        self.leases[key] = (owner, now + ttl)
+        return True
+
+    async def release(self, key, owner):
+        current = self.leases.get(key)
+        if current is not None and current[0] == owner:
+            del self.leases[key]
+
+
+class BrokerServer:
+    """Serves a LocalBroker to other processes over a unix socket.
+
+    The protocol is one JSON object per line. Clients send ``sub``/``unsub``/
+    ``pub`` (no reply) and ``claim``/``release`` (answered with the same ``id``);
+    the server pushes ``{"channel": ..., "message": ...}`` for subscribed channels.
+    """
+
+    def __init__(self):
+        self.broker = LocalBroker()
+
+    async def serve(self, path):
+        server = await asyncio.start_unix_server(self.handle, path=path)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        subscriptions = {}  # channel -> (Subscription, forwarding task)
+
+        async def forward(channel, subscription):
+            async for message in subscription:
+                writer.write(json.dumps({"channel": channel, "message": message}).encode() + b"\n")
+
+        try:
+            async for line in reader:
+                request = json.loads(line)
+                op = request["op"]
+                if op == "pub":
+                    await self.broker.publish(request["channel"], request["message"])
+                elif op == "sub" and request["channel"] not in subscriptions:
+                    subscription = await self.broker.subscribe(request["channel"])
+                    task = asyncio.create_task(forward(request["channel"], subscription))
+                    subscriptions[request["channel"]] = (subscription, task)
+                elif op == "unsub" and request["channel"] in subscriptions:
+                    subscription, task = subscriptions.pop(request["channel"])
+                    task.cancel()
+                    await subscription.close()
+                elif op == "claim":
+                    result = await self.broker.claim(request["key"], request["owner"], request["ttl"])
+                    writer.write(json.dumps({"id": request["id"], "result": result}).encode() + b"\n")
+                elif op == "release":
+                    await self.broker.release(request["key"], request["owner"])
+                    writer.write(json.dumps({"id": request["id"], "result": None}).encode() + b"\n")
+                await writer.drain()
+        finally:
+            for subscription, task in subscriptions.values():
+                task.cancel()
+                await subscription.close()
+            writer.close()
+
+
+class SocketBroker(Broker):
+    """Client for a BrokerServer listening on a unix socket.
+
+    If the connection drops, calls waiting on it fail with BrokerError and the
+    next request reconnects, subscribing again to the channels still in use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.channels = defaultdict(set)  # channel -> local subscriber queues
+        self.requests = {}                # request id -> Future
+        self.ids = itertools.count()
+        self.connecting = None
+
+    async def _connect(self):
+        if self.connecting is None:
+            self.connecting = asyncio.create_task(self._open())
+        try:
+            await self.connecting
+        except OSError as e:
+            self.connecting = None  # Let the next request try again
+            raise BrokerError(f"Could not connect to the broker at {self.path}: {e!r}") from e
+
+    async def _open(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        for channel in self.channels:
+            writer.write(json.dumps({"op": "sub", "channel": channel}).encode() + b"\n")
+        self.writer = writer
+        asyncio.create_task(self._read(reader, writer))
+
+    async def _read(self, reader, writer):
+        try:
+            async for line in reader:
+                reply = json.loads(line)
+                if "channel" in reply:
+                    for queue in self.channels.get(reply["channel"], ()):
+                        queue.put_nowait(reply["message"])
+                else:
+                    future = self.requests.pop(reply["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(reply["result"])
+        except OSError:
+            pass
+        finally:
+            # No answers will come on this connection; fail whoever is waiting for one
+            if self.writer is writer:
+                self.writer = None
+                self.connecting = None
+            writer.close()
+            requests, self.requests = self.requests, {}
+            for future in requests.values():
+                if not future.done():
+                    future.set_exception(BrokerError("Connection to the broker closed"))
+
+    async def _send(self, request):
+        await self._connect()
+        if self.writer is None:
+            raise BrokerError("Connection to the broker closed")
+        try:
+            self.writer.write(json.dumps(request).encode() + b"\n")
+            await self.writer.drain()
+        except OSError as e:
+            raise BrokerError(f"Could not send to the broker: {e!r}") from e
+
+    async def _call(self, request):
+        request["id"] = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.requests[request["id"]] = future
+        try:
+            await self._send(request)
+            return await asyncio.wait_for(future, CALL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise BrokerError(f"No answer from the broker to {request['op']} within {CALL_TIMEOUT}s") from None
+        finally:
+            self.requests.pop(request["id"], None)
+
+    async def publish(self, channel, message):
+        await self._send({"op": "pub", "channel": channel, "message": message})
+
+    async def subscribe(self, channel):
+        queue = asyncio.Queue()
+        if not self.channels[channel]:
+            await self._send({"op": "sub", "channel": channel})
+        self.channels[channel].add(queue)
+        return Subscription(queue, lambda q: self._unsubscribe(channel, q))
+
+    async def _unsubscribe(self, channel, queue):
+        subscribers = self.channels.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self.channels[channel]
+            await self._send({"op": "unsub", "channel": channel})
+
+    async def claim(self, key, owner, ttl):
+        return await self._call({"op": "claim", "key": key, "owner": owner, "ttl": ttl})
+
+    async def release(self, key, owner):
+        await self._call({"op": "release", "key": key, "owner": owner})
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# Renew the lease only if we still hold it, otherwise take it only if it is free
+CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if current then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBroker(Broker):
+    """Shares one Redis pub/sub connection between all of a worker's subscriptions.
+
+    If that connection drops, the reader reconnects with backoff and subscribes
+    again to every channel in use. Until it has, claims and new subscriptions
+    fail with BrokerError: an owner whose broadcasts can't reach its relays
+    gives its sessions up, as it does when SocketBroker loses its server.
+    """
+
+    def __init__(self, url):
+        import redis.asyncio as redis  # Only needed when running across hosts
+        from redis import exceptions as errors
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+        self.channels = defaultdict(set)
+        self.reader = None
+        self.failure = None  # BrokerError while the pub/sub connection is down
+        self.connection_errors = (errors.ConnectionError, errors.TimeoutError, OSError)
+        self.claim_script = self.redis.register_script(CLAIM_SCRIPT)
+        self.release_script = self.redis.register_script(RELEASE_SCRIPT)
+
+    async def _read(self):
+        while True:
+            try:
+                async for item in self.pubsub.listen():
+                    if item["type"] == "message":
+                        for queue in self.channels.get(item["channel"], ()):
+                            queue.put_nowait(item["data"])
+                return  # Unsubscribed from everything; subscribe() starts another reader
+            except self.connection_errors as e:
+                log.warning("Lost the Redis pub/sub connection, reconnecting", extra={"error": repr(e)})
+            await self._reconnect()
+
+    async def _reconnect(self):
+        delay = RECONNECT_BACKOFF
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._resubscribe()
+            except self.connection_errors as e:
+                if self.failure is None:
+                    log.error("Could not reconnect to Redis pub/sub", extra={"error": repr(e)})
+                self.failure = BrokerError(f"Redis pub/sub connection lost: {e!r}")
+                delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+                continue
+            if self.failure is not None:
+                log.warning("Reconnected to Redis pub/sub", extra={"channels": len(self.channels)})
+            self.failure = None
+            return
+
+    async def _resubscribe(self):
+        old, self.pubsub = self.pubsub, self.redis.pubsub()
+        try:
+            await old.close()
+        except Exception:
+            pass  # It is already broken
+        if self.channels:
+            await self.pubsub.subscribe(*self.channels)
+
+    async def publish(self, channel, message):
+        await self.redis.publish(channel, message)
+
+    async def subscribe(self, channel):
+        if self.failure is not None:
+            raise self.failure
+        queue = asyncio.Queue()
+        if not self.channels[channel]:
+            await self.pubsub.subscribe(channel)
+        self.channels[channel].add(queue)
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self._read())
+        return Subscription(queue, lambda q: self._unsubscribe(channel, q))
+
+    async def _unsubscribe(self, channel, queue):
+        subscribers = self.channels.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self.channels[channel]
+            await self.pubsub.unsubscribe(channel)
+
+    async def claim(self, key, owner, ttl):
+        if self.failure is not None:
+            raise self.failure
+        return bool(await self.claim_script(keys=[key], args=[owner, int(ttl * 1000)]))
+
+    async def release(self, key, owner):
+        await self.release_script(keys=[key], args=[owner])
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+        await self.pubsub.close()
+        await self.redis.close()
+
+
+def open_broker(spec):
+    """Open a broker from a spec such as ``local``, ``socket:/tmp/vote-broker.sock`` or ``redis://host:6379/0``."""
+    if spec == "local":
+        return LocalBroker()
+    if spec.startswith("socket:"):
+        return SocketBroker(spec[len("socket:"):])
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(spec)
+    raise ValueError(f"Unknown broker: {spec!r}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a broker for vote server workers on one machine.")
+    parser.add_argument("path", help="unix socket path, e.g. /tmp/vote-broker.sock")
+    args = parser.parse_args()
+    asyncio.run(BrokerServer().serve(args.path))
@@ -0,0 +1,61 @@
+"""The server's film catalog, the source of truth for which films can be voted on.
+
+Clients download it once from /catalog and from then on sessions only exchange
+imdbIDs. The JSON body, its gzip encoding and its ETag are built once at load
+time so serving the catalog never re-serialises it.
+
+pyfi/build.py exports the catalog as typed, minified JSON with a gzipped copy.
+from_export() loads that and serves its bytes as they are; from_csv() is the
+fallback when the export hasn't been built.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+from engine import Film
+
+# The column types are shared with pyfi/build.py, which writes the export
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyfi"))
+from columns import typed_rows  # noqa: E402
+
+
+class Catalog:
+    def __init__(self, rows, body=None, gzip_body=None):
+        """``rows`` are already typed; ``body`` is their JSON, if it has been encoded already."""
+        self.films = {row["imdbID"]: Film(row) for row in rows}  # imdbID -> engine.Film
+
+        self.body = body or json.dumps([f.data for f in self.films.values()],
+                                       separators=(",", ":")).encode("utf-8")
+        self.gzip_body = gzip_body or gzip.compress(self.body, mtime=0)
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(typed_rows(path))
+
+    @classmethod
+    def from_export(cls, manifest_path):
+        """Load the export named in pyfi/build.py's manifest (data/catalog.json)."""
+        directory = os.path.dirname(manifest_path)
+        with open(manifest_path, encoding='utf-8') as f:
+            path = os.path.join(directory, json.load(f)["films"])
+        with open(path, "rb") as f:
+            body = f.read()
+        gzip_body = None
+        if os.path.exists(path + ".gz"):
+            with open(path + ".gz", "rb") as f:
+                gzip_body = f.read()
+        return cls(json.loads(body), body, gzip_body)
+
+    @classmethod
+    def load(cls, manifest_path, csv_path):
+        """From the export, unless it is missing or older than the CSV."""
+        if os.path.exists(manifest_path) and os.path.getmtime(manifest_path) >= os.path.getmtime(csv_path):
+            return cls.from_export(manifest_path)
+        return cls.from_csv(csv_path)
+
+    def __len__(self):
+        return len(self.films)
@@ -0,0 +1,229 @@
+"""Running vote sessions across several worker processes or hosts.
+
+The worker holding a session's lease (see broker.py) owns it: it runs the
+session's actor and is the only one to touch its state or the session store.
+A socket that lands on any other worker is attached to a Relay there, which
+forwards the socket's messages to the owner's inbound channel and delivers the
+owner's outbound frames back to its sockets.
+
+On the owner, each relayed socket is represented by a RemoteConn, which looks
+enough like a websocket (send_text/close) for the actor to treat local and
+remote clients alike. Broadcasts go out once per session on the outbound
+channel, not once per remote client.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+
+log = logging.getLogger("vote.cluster")
+
+# Seconds a lease lasts without renewal, and how often owners renew theirs
+LEASE_TTL = 15.0
+LEASE_RENEW = 5.0
+
+# Outbound messages are prefixed so relays can route frames without decoding them
+BROADCAST = "*"  # "*<frame>": send to every relayed socket of the session
+DIRECT = "@"     # "@<target>\n<frame>": send to one socket
+DETACH = "-"     # "-<target>": stop sending broadcasts to one socket
+CLOSE = "!"      # "!<target>": close one socket
+
+
+def lease_key(session_code):
+    return f"vote:{session_code}:owner"
+
+
+def inbound_channel(session_code):
+    return f"vote:{session_code}:in"
+
+
+def outbound_channel(session_code):
+    return f"vote:{session_code}:out"
+
+
+class RemoteConn:
+    """Stands in, on the owning worker, for a socket connected to another worker."""
+
+    __slots__ = ("broker", "channel", "target")
+
+    def __init__(self, broker, session_code, target):
+        self.broker = broker
+        self.channel = outbound_channel(session_code)
+        self.target = target  # "<worker id>/<connection id>"
+
+    async def send_text(self, frame):
+        await self.broker.publish(self.channel, f"{DIRECT}{self.target}\n{frame}")
+
+    async def detach(self):
+        await self.broker.publish(self.channel, DETACH + self.target)
+
+    async def close(self, code=1000):
+        await self.broker.publish(self.channel, CLOSE + self.target)
+
+
+class OwnerLink:
+    """Holds a session's lease and feeds messages relayed from other workers to its actor."""
+
+    def __init__(self, broker, worker_id, session_code):
+        self.broker = broker
+        self.worker_id = worker_id
+        self.session_code = session_code
+        self.remote = {}  # target -> RemoteConn
+        self.subscription = None
+        self.tasks = []
+
+    async def claim(self):
+        """Try to become the session's owner. Returns True on success."""
+        # Subscribe first so nothing a relay sends after the claim is lost
+        self.subscription = await self.broker.subscribe(inbound_channel(self.session_code))
+        if await self.broker.claim(lease_key(self.session_code), self.worker_id, LEASE_TTL):
+            return True
+        await self.subscription.close()
+        return False
+
+    def start(self, post, on_lost):
+        """Start delivering relayed messages with ``post(conn, data)``; ``on_lost()`` runs if the lease is lost."""
+        self.tasks = [
+            asyncio.create_task(self._receive(post)),
+            asyncio.create_task(self._keep_lease(on_lost)),
+        ]
+
+    async def _receive(self, post):
+        async for raw in self.subscription:
+            message = json.loads(raw)
+            target = message["target"]
+            conn = self.remote.get(target)
+            if conn is None:
+                conn = self.remote[target] = RemoteConn(self.broker, self.session_code, target)
+            if message["data"]["type"] == "disconnect":
+                del self.remote[target]
+            post(conn, message["data"])
+
+    async def _keep_lease(self, on_lost):
+        while True:
+            await asyncio.sleep(LEASE_RENEW)
+            try:
+                renewed = await self.broker.claim(lease_key(self.session_code), self.worker_id, LEASE_TTL)
+            except Exception as e:
+                # Whatever the backend, we can't tell how long the lease will last
+                # now, so give the session up rather than risk two owners
+                log.warning("Could not renew the lease on session, giving it up",
+                            extra={"session": self.session_code, "error": repr(e)})
+                on_lost()
+                return
+            if not renewed:
+                log.warning("Lost ownership of session", extra={"session": self.session_code})
+                on_lost()
+                return
+
+    async def broadcast(self, frame):
+        if self.remote:
+            await self.broker.publish(outbound_channel(self.session_code), BROADCAST + frame)
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        if self.subscription is not None:
+            await self.subscription.close()
+        try:
+            await self.broker.release(lease_key(self.session_code), self.worker_id)
+        except Exception as e:
+            # The lease expires on its own after LEASE_TTL
+            log.warning("Could not release the lease on session",
+                        extra={"session": self.session_code, "error": repr(e)})
+
+
+class Relay:
+    """Connects this worker's sockets to a session owned by another worker."""
+
+    def __init__(self, broker, worker_id, session_code, on_close):
+        self.broker = broker
+        self.worker_id = worker_id
+        self.session_code = session_code
+        self.on_close = on_close
+        self.sockets = {}     # target -> outbox.Outbox
+        self.detached = set()  # targets that no longer receive broadcasts
+        self.ids = itertools.count()
+        self.subscription = None
+        self.tasks = []
+
+    async def start(self):
+        self.subscription = await self.broker.subscribe(outbound_channel(self.session_code))
+        self.tasks = [
+            asyncio.create_task(self._deliver()),
+            asyncio.create_task(self._watch_owner()),
+        ]
+
+    async def attach(self, conn, since=None):
+        target = f"{self.worker_id}/{next(self.ids)}"
+        self.sockets[target] = conn
+        await self.forward(target, {"type": "connect", "new_session": False, "since": since})
+        return target
+
+    async def forward(self, target, data):
+        message = json.dumps({"target": target, "data": data}, separators=(",", ":"))
+        await self.broker.publish(inbound_channel(self.session_code), message)
+
+    async def detach(self, target):
+        if self.sockets.pop(target, None) is None:
+            return
+        self.detached.discard(target)
+        await self.forward(target, {"type": "disconnect"})
+        if not self.sockets:
+            await self.close()
+
+    async def _deliver(self):
+        async for message in self.subscription:
+            kind = message[0]
+            if kind == BROADCAST:
+                frame = message[1:]
+                for target, conn in self.sockets.items():
+                    if target not in self.detached:
+                        # Only the owner can build a snapshot; a client that falls
+                        # behind here drops patches and asks for one itself
+                        conn.push_state(frame)
+                continue
+            target, _, frame = message[1:].partition("\n")
+            conn = self.sockets.get(target)
+            if conn is None:
+                continue  # Another worker's socket
+            if kind == DIRECT:
+                await conn.send_text(frame)
+            elif kind == DETACH:
+                self.detached.add(target)
+            elif kind == CLOSE:
+                await conn.close(code=1011)
+
+    async def _watch_owner(self):
+        key = lease_key(self.session_code)
+        while True:
+            await asyncio.sleep(LEASE_RENEW)
+            # If we can take the lease, the owner is gone. Give it straight back and
+            # have our clients reconnect; the first one through takes over the session.
+            try:
+                owner_gone = await self.broker.claim(key, self.worker_id, LEASE_TTL)
+            except Exception as e:
+                # Can't tell; ask again next time
+                log.warning("Could not check the owner of session",
+                            extra={"session": self.session_code, "error": repr(e)})
+                continue
+            if owner_gone:
+                await self.broker.release(key, self.worker_id)
+                log.warning("Owner of session went away, reconnecting its clients",
+                            extra={"session": self.session_code})
+                await self.close()
+                return
+
+    async def close(self):
+        self.on_close()
+        current = asyncio.current_task()
+        for task in self.tasks:
+            if task is not current:
+                task.cancel()
+        if self.subscription is not None:
+            await self.subscription.close()
+        # 1012 (service restart) tells clients to reconnect
+        sockets = list(self.sockets.values())
+        self.sockets.clear()
+        await asyncio.gather(*(conn.close(code=1012) for conn in sockets))
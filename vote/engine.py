@@ -0,0 +1,408 @@
+"""Vote rules for a single film vote session, independent of any networking.
+
+The websocket layer in main.py owns the sockets; this module only knows about
+opaque connection handles. Films come from a catalog (imdbID -> Film) shared
+by every session, and clients refer to them by imdbID only. Each inbound message is passed to Session.apply(),
+which updates the session and returns the replies that should go to individual
+connections. Anything visible to the whole room is read back with state(), and
+Session.version tells the caller whether a broadcast is needed.
+
+Running this module directly plays random games to measure throughput:
+
+    python engine.py --games 2000 --players 6 --films 290
+"""
+
+import random
+import string
+import time
+
+VOTE_STYLES = ("one-by-one", "fifty-fifty", "hybrid")
+ID_ALPHABET = string.ascii_uppercase + string.digits
+
+
+class Film:
+    __slots__ = ("id", "title", "data")
+
+    def __init__(self, data):
+        self.id = data["imdbID"]  # Titles are not unique across remakes, IMDb IDs are
+        self.title = data["Title"]
+        self.data = data  # The film dict as the clients know it
+
+
+class Player:
+    __slots__ = ("id", "name", "conn")
+
+    def __init__(self, player_id, name, conn):
+        self.id = player_id
+        self.name = name
+        self.conn = conn  # None while the player is disconnected
+
+
+class Reply:
+    """A message for one connection. ``detach`` asks the caller to stop broadcasting to it."""
+
+    __slots__ = ("conn", "message", "detach")
+
+    def __init__(self, conn, message, detach=False):
+        self.conn = conn
+        self.message = message
+        self.detach = detach
+
+
+class Session:
+    __slots__ = (
+        "host_id", "host_conn", "players", "player_ids", "films_remaining",
+        "eliminated", "current_turn", "started", "winner", "vote_style",
+        "hybrid_threshold", "group_a", "group_b", "catalog", "rng", "version",
+        "_handlers",
+    )
+
+    def __init__(self, catalog, host_conn=None, seed=None):
+        self.catalog = catalog
+        self.rng = random.Random(seed)
+        self.host_id = self.generate_id()
+        self.host_conn = host_conn
+        self.players = []
+        self.player_ids = {}  # Map of player names to unique IDs
+        self.films_remaining = {}  # imdbID -> Film, in shuffled order
+        self.eliminated = []  # Films in the order they were eliminated
+        self.current_turn = 0
+        self.started = False
+        self.winner = None  # Will hold the winning film when only one remains
+        self.vote_style = "one-by-one"
+        self.hybrid_threshold = 10
+        self.group_a = []  # For 50/50 voting: first group of films
+        self.group_b = []  # For 50/50 voting: second group of films
+        self.version = 0  # Bumped whenever state() would change
+        self._handlers = {
+            "join": self._join,
+            "host_reconnect": self._host_reconnect,
+            "start": self._start,
+            "eliminate": self._eliminate,
+            "reorder": self._reorder,
+            "kick_player": self._kick_player,
+        }
+
+    def generate_id(self, length=6):
+        return "".join(self.rng.choices(ID_ALPHABET, k=length))
+
+    def apply(self, conn, action):
+        """Apply one client message sent from ``conn`` and return a list of Replies."""
+        handler = self._handlers.get(action["type"])
+        if handler is None:
+            return []
+        return handler(conn, action)
+
+    def disconnect(self, conn):
+        # Keep the player data so they can reconnect later
+        for player in self.players:
+            if player.conn is conn:
+                player.conn = None
+                self.version += 1
+        if self.host_conn is conn:
+            self.host_conn = None
+
+    def current_player(self):
+        if self.players and self.films_remaining and self.started:
+            return self.players[self.current_turn]
+        return None
+
+    def in_fifty_fifty_phase(self):
+        if self.vote_style == "fifty-fifty":
+            return True
+        return self.vote_style == "hybrid" and len(self.films_remaining) > self.hybrid_threshold
+
+    def state(self):
+        current = self.current_player()
+        return {
+            "films_remaining": list(self.films_remaining),
+            "eliminated": [f.id for f in self.eliminated],
+            "players": [p.name for p in self.players],
+            "currentPlayer": current.name if current else None,
+            "current_turn": self.current_turn,
+            "started": self.started,
+            "connected_players": [p.name for p in self.players if p.conn is not None],
+            "winner": self.winner.id if self.winner else None,
+            "has_winner": self.winner is not None,
+            "vote_style": self.vote_style,
+            "hybrid_threshold": self.hybrid_threshold,
+            "group_a": [f.id for f in self.group_a],
+            "group_b": [f.id for f in self.group_b],
+        }
+
+    # --- Persistence ---
+
+    def identify(self, conn):
+        """Describe who is behind ``conn`` in a form that survives a restart (see replay())."""
+        player_id = None
+        if conn is not None:
+            player_id = next((p.id for p in self.players if p.conn is conn), None)
+        return {"host": conn is not None and conn is self.host_conn, "player": player_id}
+
+    def replay(self, identity, action):
+        """Re-apply a logged action on behalf of ``identity``, as returned by identify()."""
+        conn = object()
+        if identity["host"]:
+            self.host_conn = conn
+        player = self._find_player(identity["player"])
+        if player is not None:
+            player.conn = conn
+        self.apply(conn, action)
+        # Nobody is connected to a session that is being rebuilt
+        self.host_conn = None
+        for player in self.players:
+            player.conn = None
+
+    def to_dict(self):
+        version, internal, gauss = self.rng.getstate()
+        return {
+            "host_id": self.host_id,
+            "players": [[p.id, p.name] for p in self.players],
+            "player_ids": self.player_ids,
+            "films_remaining": list(self.films_remaining),
+            "eliminated": [f.id for f in self.eliminated],
+            "current_turn": self.current_turn,
+            "started": self.started,
+            "winner": self.winner.id if self.winner else None,
+            "vote_style": self.vote_style,
+            "hybrid_threshold": self.hybrid_threshold,
+            "group_a": [f.id for f in self.group_a],
+            "group_b": [f.id for f in self.group_b],
+            "rng": [version, list(internal), gauss],
+            "version": self.version,
+        }
+
+    @classmethod
+    def from_dict(cls, data, catalog):
+        """Rebuild a session saved with to_dict(); every connection starts out disconnected."""
+        session = cls(catalog)
+        session.host_id = data["host_id"]
+        session.players = [Player(player_id, name, None) for player_id, name in data["players"]]
+        session.player_ids = dict(data["player_ids"])
+        session.films_remaining = {i: catalog[i] for i in data["films_remaining"]}
+        session.eliminated = [catalog[i] for i in data["eliminated"]]
+        session.current_turn = data["current_turn"]
+        session.started = data["started"]
+        session.winner = catalog[data["winner"]] if data["winner"] else None
+        session.vote_style = data["vote_style"]
+        session.hybrid_threshold = data["hybrid_threshold"]
+        session.group_a = [catalog[i] for i in data["group_a"]]
+        session.group_b = [catalog[i] for i in data["group_b"]]
+        version, internal, gauss = data["rng"]
+        session.rng.setstate((version, tuple(internal), gauss))
+        session.version = data["version"]
+        return session
+
+    # --- Handlers ---
+
+    def _find_player(self, player_id):
+        for player in self.players:
+            if player.id == player_id:
+                return player
+        return None
+
+    def _join(self, conn, action):
+        player_name = action["name"]
+        player_id = action.get("player_id")
+        known_id = bool(player_id) and player_id in self.player_ids.values()
+
+        # Only allow reconnections after the vote starts
+        if self.started and not known_id:
+            return [Reply(conn, {
+                "type": "error",
+                "message": "Cannot join after voting has started. Please wait for the host to start a new session.",
+                "vote_in_progress": True
+            })]
+
+        if known_id:
+            player = self._find_player(player_id)
+            if player is None:
+                # This can happen if the player_id exists but the player record was removed
+                return [Reply(conn, {
+                    "type": "error",
+                    "message": "Failed to reconnect. Your session may have expired."
+                })]
+            player.conn = conn
+            if player.name != player_name and player.name in self.player_ids:
+                # Player changed their name during reconnection
+                del self.player_ids[player.name]
+                self.player_ids[player_name] = player_id
+                player.name = player_name
+            self.version += 1
+            return [Reply(conn, {"type": "reconnect_success", "name": player.name})]
+
+        new_id = self.generate_id()
+        self.player_ids[player_name] = new_id
+        self.players.append(Player(new_id, player_name, conn))
+        self.version += 1
+        # Send the player their ID for future reconnections
+        return [Reply(conn, {"type": "player_id", "id": new_id})]
+
+    def _host_reconnect(self, conn, action):
+        host_id = action.get("host_id")
+        if not host_id or host_id != self.host_id:
+            return []
+        self.host_conn = conn
+        self.version += 1
+        return [Reply(conn, {"type": "reconnect_success", "is_host": True})]
+
+    def _start(self, conn, action):
+        if conn is not self.host_conn:
+            return []
+        vote_style = action.get("vote_style", "one-by-one")
+        self.vote_style = vote_style if vote_style in VOTE_STYLES else "one-by-one"
+        self.hybrid_threshold = int(action.get("hybrid_threshold", 10))
+
+        # Unknown and repeated IDs are ignored
+        catalog = self.catalog
+        films = [catalog[i] for i in dict.fromkeys(action["film_ids"]) if i in catalog]
+        self.rng.shuffle(films)
+        self.films_remaining = {f.id: f for f in films}
+        self.eliminated = []
+        self.current_turn = 0
+        self.started = True
+        self.winner = None
+        self.group_a = []
+        self.group_b = []
+        if self.vote_style in ("fifty-fifty", "hybrid"):
+            mid_point = len(films) // 2
+            self.group_a = films[:mid_point]
+            self.group_b = films[mid_point:]
+        self.version += 1
+        return []
+
+    def _eliminate(self, conn, action):
+        current = self.current_player()
+        if current is None or current.conn is not conn or self.winner is not None:
+            return []
+
+        if self.in_fifty_fifty_phase():
+            if not self._eliminate_group(action.get("group", "")):
+                return []
+        elif not self._eliminate_film(action.get("film_id")):
+            return []
+
+        if len(self.films_remaining) == 1:
+            self.winner = next(iter(self.films_remaining.values()))
+        elif len(self.films_remaining) > 1:
+            self.current_turn = (self.current_turn + 1) % len(self.players)
+        self.version += 1
+        return []
+
+    def _eliminate_film(self, film_id):
+        film = self.films_remaining.pop(film_id, None)
+        if film is None:
+            return False
+        self.eliminated.append(film)
+        return True
+
+    def _eliminate_group(self, group):
+        if group == "A":
+            eliminated = self.group_a
+        elif group == "B":
+            eliminated = self.group_b
+        else:
+            return False
+        remaining = self.films_remaining
+        for film in eliminated:
+            del remaining[film.id]
+        self.eliminated.extend(eliminated)
+        self._split_groups()
+        return True
+
+    def _split_groups(self):
+        films = list(self.films_remaining.values())
+        if not self.in_fifty_fifty_phase() or len(films) < 2:
+            # Hybrid mode has dropped to one-by-one, or there is a winner
+            self.group_a = []
+            self.group_b = []
+            return
+        if len(films) > 2:
+            self.rng.shuffle(films)
+            # Keep the index in the same order as the groups
+            self.films_remaining = {f.id: f for f in films}
+        mid_point = len(films) // 2
+        self.group_a = films[:mid_point]
+        self.group_b = films[mid_point:]
+
+    def _reorder(self, conn, action):
+        # Preserve connections and player IDs based on name
+        by_name = {p.name: p for p in self.players}
+        self.players = [by_name[name] for name in action["order"] if name in by_name]
+        self.current_turn = 0  # reset to first in new order
+        self.version += 1
+        return []
+
+    def _kick_player(self, conn, action):
+        if conn is not self.host_conn:
+            return []
+        name = action["player"]
+        for i, player in enumerate(self.players):
+            if player.name == name:
+                break
+        else:
+            return []
+
+        del self.players[i]
+        self.player_ids.pop(name, None)
+        # If the kicked player held the turn (or was last in line), pass it on
+        if i < self.current_turn:
+            self.current_turn -= 1
+        if self.current_turn >= len(self.players):
+            self.current_turn = 0
+        self.version += 1
+
+        if player.conn is None:
+            return []
+        return [Reply(player.conn, {
+            "type": "kicked",
+            "message": "You have been removed from the session by the host.",
+            "can_rejoin": True  # They can rejoin with a different name
+        }, detach=True)]
+
+
+def make_catalog(films):
+    catalog = (Film({"Title": f"Film {i}", "imdbID": f"tt{i:07d}"}) for i in range(films))
+    return {film.id: film for film in catalog}
+
+
+def simulate(seed, catalog, players=6, vote_style="hybrid", hybrid_threshold=10):
+    """Play one complete game with random choices and return the number of actions applied."""
+    rng = random.Random(seed)
+    host = object()
+    session = Session(catalog, host, seed=seed)
+    conns = [host] + [object() for _ in range(players - 1)]
+    for i, conn in enumerate(conns):
+        session.apply(conn, {"type": "join", "name": f"P{i}"})
+    session.apply(host, {"type": "start", "film_ids": list(catalog), "vote_style": vote_style,
+                         "hybrid_threshold": hybrid_threshold})
+    actions = players + 1
+    while session.winner is None and len(session.films_remaining) > 1:
+        conn = session.current_player().conn
+        if session.in_fifty_fifty_phase():
+            action = {"type": "eliminate", "group": rng.choice("AB")}
+        else:
+            # Either end of the index, so picking a film stays O(1)
+            films = session.films_remaining
+            film_id = next(iter(films)) if rng.random() < 0.5 else next(reversed(films))
+            action = {"type": "eliminate", "film_id": film_id}
+        session.apply(conn, action)
+        actions += 1
+    return actions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the vote engine with random games.")
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--films", type=int, default=290)
+    parser.add_argument("--style", choices=VOTE_STYLES, default="hybrid")
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.films)
+    start = time.perf_counter()
+    total = sum(simulate(seed, catalog, args.players, args.style) for seed in range(args.games))
+    elapsed = time.perf_counter() - start
+    print(f"{total} actions in {elapsed:.3f}s ({total / elapsed:,.0f} actions/s)")
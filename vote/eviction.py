@@ -0,0 +1,78 @@
+"""Deciding which vote sessions to drop from memory, and keeping a record of them.
+
+main.py runs a background sweeper that asks pick_evictions() which sessions
+have finished or gone idle, optionally archives their results, and retires them.
+Sizes are rough (sys.getsizeof over the containers a session owns, not the
+catalog films it shares with every other session) but good enough to see which
+sessions are heavy and how memory grows.
+"""
+
+import json
+import sys
+from datetime import datetime, timezone
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes held by ``obj`` and the lists/dicts/strings inside it."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def session_sizeof(session):
+    """Approximate bytes held by an engine.Session, not counting shared catalog films."""
+    size = sys.getsizeof(session) + sys.getsizeof(session.rng) + deep_sizeof(session.player_ids)
+    size += sys.getsizeof(session.players)
+    size += sum(sys.getsizeof(p) + sys.getsizeof(p.name) + sys.getsizeof(p.id) for p in session.players)
+    # Film lists only hold references into the catalog
+    for films in (session.films_remaining, session.eliminated, session.group_a, session.group_b):
+        size += sys.getsizeof(films)
+    return size
+
+
+def pick_evictions(actors, now, idle_ttl, completed_ttl, max_sessions):
+    """Return the codes of sessions to evict, given ``actors`` in least-recently-used order.
+
+    Sessions with connected clients are never picked. Beyond that, a session goes
+    once it has had a winner for ``completed_ttl`` seconds, or seen no messages
+    for ``idle_ttl`` seconds, and the least recently used ones go until at most
+    ``max_sessions`` remain.
+    """
+    evict = []
+    idle = []
+    for code, actor in actors.items():
+        if actor.clients:
+            continue
+        quiet_for = now - actor.last_active
+        if quiet_for >= idle_ttl or (actor.session.winner is not None and quiet_for >= completed_ttl):
+            evict.append(code)
+        else:
+            idle.append(code)
+    excess = len(actors) - len(evict) - max_sessions
+    if excess > 0:
+        evict.extend(idle[:excess])
+    return evict
+
+
+def archive_result(path, code, session):
+    """Append one JSON line describing a session's outcome to ``path``."""
+    record = {
+        "code": code,
+        "archived_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "vote_style": session.vote_style,
+        "players": [p.name for p in session.players],
+        "winner": session.winner.id if session.winner else None,
+        "winner_title": session.winner.title if session.winner else None,
+        "eliminated": [f.id for f in session.eliminated],
+        "films_remaining": list(session.films_remaining),
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
@@ -23,6 +23,7 @@ function initializeApp() {
     }
 
     const backendUrl = "wss://meow.suprdory.com:8006/ws";
+    StateStream.useBackend(backendUrl);
 
     // Extract session code and host ID from URL only
     const urlParams = new URLSearchParams(window.location.search);
@@ -30,6 +31,7 @@ function initializeApp() {
     let hostId = urlParams.get("hid");
 
     let ws;
+    let stateStream;
     let wsReady = false;
     let reconnectAttempts = 0;
     const MAX_RECONNECT_ATTEMPTS = 5;
@@ -377,7 +379,11 @@ function initializeApp() {
         }
         
         try {
-            ws = new WebSocket(`${backendUrl}/${sessionCode}`);
+            // One stream for the page, so a reconnect only fetches the patches we missed
+            if (!stateStream) {
+                stateStream = new StateStream(() => Wire.send(ws, { type: "resync" }));
+            }
+            ws = Wire.open(`${backendUrl}/${sessionCode}${stateStream.resumeQuery()}`);
 
             // Update UI to show connecting state
             const statusElement = document.createElement('div');
@@ -412,16 +418,21 @@ function initializeApp() {
                 // Try to reconnect as host if we have an ID
                 if (hostId) {
                     log(`Attempting to reconnect as host with ID: ${hostId}`);
-                    ws.send(JSON.stringify({ 
+                    Wire.send(ws, { 
                         type: "host_reconnect", 
                         host_id: hostId 
-                    }));
+                    });
                 }
             };
 
             ws.onmessage = (event) => {
                 try {
-                    const data = JSON.parse(event.data);
+                    const data = Wire.decode(event.data);
+                    // Heartbeat: the server drops clients that stop answering
+                    if (data.type === "ping") {
+                        Wire.send(ws, { type: "pong" });
+                        return;
+                    }
                     log("📩 Message from server:", data);
                     
                     // Debug DOM state
@@ -487,12 +498,17 @@ function initializeApp() {
                                 // The host's player-specific ID is handled by `hostPlayerListener` for the "Open Player View" button.
                                 console.log(`Received player ID (id: ${data.id}, name: ${data.name || 'N/A'}, is_host: ${data.is_host}). Not updating session hostId ('${hostId || 'not set'}').`);
                             }
-                        } else if (data.type === "state_update") {
-                            // Always attempt to render regardless of DOM state
-                            // The renderPlayers function will handle any DOM readiness issues
-                            log("Received state update with players:", data.players?.length || 0, "players");
-                            renderPlayers(data.players, data.connected_players || []);
-                            updateVoteStatus(data);
+                        } else if (data.type === "state_snapshot" || data.type === "state_patch") {
+                            const pending = stateStream.handle(data);
+                            if (pending) {
+                                pending.then(state => {
+                                    // Always attempt to render regardless of DOM state
+                                    // The renderPlayers function will handle any DOM readiness issues
+                                    log("Received state update with players:", state.players?.length || 0, "players");
+                                    renderPlayers(state.players, state.connected_players || []);
+                                    updateVoteStatus(state);
+                                }).catch(error => console.error("Error applying state update", error));
+                            }
                         }
                     } else {
                         // For backward compatibility with older messages without a type
@@ -601,70 +617,35 @@ function initializeApp() {
     // No copy link buttons are needed as URLs can be copied directly from the browser
 
     // --- Fetch Films and Watched Status ---
+    // The picker lists the server's catalog (the same one the state stream resolves
+    // films from), and marks the films in its watch dates as watched
+    const watchDatesUrl = StateStream.url.replace(/\/catalog$/, "/watch_dates");
     Promise.all([
-        fetch('../scifi_data.csv').then(res => {
-            if (!res.ok) throw new Error('Failed to load scifi_data.csv');
-            return res.text();
-        }),
-        fetch('../watched_films.csv').then(res => {
+        StateStream.loadCatalog(),
+        fetch(watchDatesUrl).then(res => {
             if (!res.ok) {
-                console.warn('Failed to load watched_films.csv. Proceeding without watched status.');
+                console.warn('Failed to load watch dates. Proceeding without watched status.');
                 return null;
             }
-            return res.text();
+            return res.json();
         }).catch(error => {
-            console.warn('Error fetching watched_films.csv:', error.message, '. Proceeding without watched status.');
+            console.warn('Error fetching watch dates:', error.message, '. Proceeding without watched status.');
             return null;
         })
     ])
-    .then(([filmsCsvText, watchedCsvText]) => {
-        let filmsData = [];
-        
-        // Parse films CSV using PapaParse
-        if (filmsCsvText) {
-            const parseResult = Papa.parse(filmsCsvText, {
-                header: true,
-                skipEmptyLines: true,
-                dynamicTyping: true
-            });
-            filmsData = parseResult.data;
-            console.log('Films data loaded:', filmsData.length, 'films');
-        }
-        
-        if (!filmsData || filmsData.length === 0) {
-             console.error("filmsData is empty after parsing. This indicates a problem with loading scifi_data.csv.");
+    .then(([catalog, watchDates]) => {
+        const filmsData = Array.from(catalog.values());
+        console.log('Films data loaded:', filmsData.length, 'films');
+
+        if (filmsData.length === 0) {
+             console.error("The catalog is empty. This indicates a problem with the server's catalog.");
              allFilms = [];
              setupSeasonsAndDisplay();
              return;
         }
 
-        const watchedImdbIds = new Set();
-        if (watchedCsvText) {
-            try {
-                const lines = watchedCsvText.trim().split(/\r\n|\n/);
-                if (lines.length > 1) {
-                    const header = lines[0].split(',').map(h => h.trim().toLowerCase());
-                    const imdbIDIndex = header.indexOf('imdbid');
-
-                    if (imdbIDIndex !== -1) {
-                        for (let i = 1; i < lines.length; i++) {
-                            const values = lines[i].split(',');
-                            if (values[imdbIDIndex]) {
-                                watchedImdbIds.add(String(values[imdbIDIndex].trim()));
-                            }
-                        }
-                        console.log("Successfully parsed watched_films.csv and extracted", watchedImdbIds.size, "watched IMDb IDs.");
-                    } else {
-                        console.warn("Could not find 'imdbID' column in watched_films.csv header. Proceeding as if no films are watched.");
-                    }
-                } else {
-                    console.warn("watched_films.csv is empty or has no data rows. Proceeding as if no films are watched.");
-                }
-            } catch (e) {
-                console.error("Error manually parsing watched_films.csv:", e.message);
-                // Proceed with empty watchedImdbIds
-            }
-        }
+        const watchedImdbIds = new Set(watchDates ? watchDates.films.map(film => film.imdbID) : []);
+        console.log("Loaded watch dates for", watchedImdbIds.size, "watched IMDb IDs.");
 
         allFilms = filmsData.map(film => ({
             ...film,
@@ -777,7 +758,7 @@ function initializeApp() {
             newUrl.searchParams.set("name", name);
             window.history.replaceState({}, '', newUrl);
             
-            ws.send(JSON.stringify({ type: 'join', name }));
+            Wire.send(ws, { type: 'join', name });
             nameInput.disabled = true;
             joinBtn.disabled = true;
             
@@ -800,7 +781,7 @@ function initializeApp() {
                 // Listen for player_id messages to get the host's player ID for linking
                 const hostPlayerListener = (event) => {
                     try {
-                        const data = JSON.parse(event.data);
+                        const data = Wire.decode(event.data);
                         if (data.type === "player_id" && !data.is_host) {
                             // This is the host's player ID (not host ID)
                             // Include name in URL for better user experience
@@ -1017,7 +998,7 @@ function initializeApp() {
             
             if (wsReady) {
                 console.log("Sending reorder message to server");
-                ws.send(JSON.stringify({ type: 'reorder', order: items }));
+                Wire.send(ws, { type: 'reorder', order: items });
             } else {
                 console.warn("WebSocket not ready, can't send reorder message");
             }
@@ -1049,10 +1030,10 @@ function initializeApp() {
                 document.body.appendChild(feedbackToast);
             
                 // Send the kick message
-                ws.send(JSON.stringify({
+                Wire.send(ws, {
                     type: 'kick_player',
                     player: playerName
-                }));
+                });
                 
                 // Update toast after a successful kick (assuming it worked if we sent it)
                 setTimeout(() => {
@@ -1117,13 +1098,13 @@ function initializeApp() {
             console.log(`Starting vote with ${selectedFilms.length} films, style: ${voteStyle}` + 
                   (voteStyle === 'hybrid' ? `, threshold: ${threshold}` : ''));
             
-            // Send start command with films and voting style
-            ws.send(JSON.stringify({ 
+            // Send start command with film IDs and voting style; the server has the full catalog
+            Wire.send(ws, { 
                 type: 'start', 
-                films: selectedFilms,
+                film_ids: selectedFilms.map(film => film.imdbID),
                 vote_style: voteStyle,
                 hybrid_threshold: threshold
-            }));
+            });
         });
     } else {
         console.warn("Start vote button not available");
@@ -0,0 +1,375 @@
+"""Load test and latency benchmark for the vote server.
+
+Plays N sessions of M players concurrently: everyone joins, the host reorders
+the players and starts a vote (cycling through the voting styles), players
+eliminate films until there is a winner, every player drops off and reconnects
+at once part-way through (a reconnect storm), and the host finally kicks a
+player. Latency is measured from sending an action to the sender receiving
+the state update it caused (or reconnect_success, for reconnects).
+
+By default the server runs in this process: each simulated socket is handed
+straight to main.websocket_endpoint, so everything from message decoding to
+fan-out is exercised without HTTP in the way. With --url it drives a running
+server instead (needs the ``websockets`` package):
+
+    uvicorn main:app --port 8000 &
+    python loadtest.py --url ws://localhost:8000/ws --sessions 50 --players 8
+
+Results, with p50/p95/p99 per action, are written as JSON (--out) so runs from
+different versions can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+
+VOTE_STYLES = ("one-by-one", "fifty-fifty", "hybrid")
+STATE_TYPES = ("state_snapshot", "state_patch")
+
+
+class LoopbackSocket:
+    """The server's side of an in-process socket, shaped like the Starlette WebSocket main.py uses."""
+
+    def __init__(self, query_params):
+        self.scope = {"subprotocols": ["vote.json"]}
+        self.query_params = query_params
+        self.inbound = asyncio.Queue()   # ASGI receive events from the client
+        self.outbound = asyncio.Queue()  # Frames for the client; None once closed
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def receive(self):
+        return await self.inbound.get()
+
+    async def send_text(self, text):
+        self.outbound.put_nowait(text)
+
+    async def send_bytes(self, data):
+        self.outbound.put_nowait(data)
+
+    async def close(self, code=1000):
+        self.outbound.put_nowait(None)
+
+
+class InProcessTransport:
+    def __init__(self, main, session_code, since):
+        self.socket = LoopbackSocket({"since": since} if since else {})
+        self.task = asyncio.create_task(main.websocket_endpoint(self.socket, session_code))
+
+    async def send(self, message):
+        self.socket.inbound.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def recv(self):
+        frame = await self.socket.outbound.get()
+        return None if frame is None else json.loads(frame)
+
+    async def close(self):
+        self.socket.inbound.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+
+class RemoteTransport:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @classmethod
+    async def connect(cls, url, session_code, since):
+        import websockets  # Only needed to test a running server
+
+        query = f"?since={since}" if since else ""
+        return cls(await websockets.connect(f"{url}/{session_code}{query}", subprotocols=["vote.json"],
+                                            max_queue=None))
+
+    async def send(self, message):
+        await self.connection.send(json.dumps(message))
+
+    async def recv(self):
+        try:
+            return json.loads(await self.connection.recv())
+        except Exception:
+            return None  # Closed
+
+    async def close(self):
+        await self.connection.close()
+
+
+class Client:
+    """One simulated browser tab: keeps the session state up to date and times its actions."""
+
+    def __init__(self, bench, session_code, name):
+        self.bench = bench
+        self.session_code = session_code
+        self.name = name
+        self.player_id = None
+        self.host_id = None
+        self.state = None
+        self.seq = None
+        self.epoch = None
+        self.transport = None
+        self.reader = None
+        self.waiters = []  # (predicate, future)
+
+    async def connect(self, resume=False):
+        since = f"{self.epoch}.{self.seq}" if resume and self.epoch else None
+        self.transport = await self.bench.open(self.session_code, since)
+        self.reader = asyncio.create_task(self._read())
+
+    async def disconnect(self):
+        await self.transport.close()
+        self.reader.cancel()
+
+    async def _read(self):
+        while True:
+            message = await self.transport.recv()
+            if message is None:
+                return
+            message_type = message["type"]
+            if message_type == "ping":
+                await self.transport.send({"type": "pong"})
+                continue
+            if message_type == "state_snapshot":
+                self.state, self.seq, self.epoch = dict(message["state"]), message["seq"], message["epoch"]
+            elif message_type == "state_patch":
+                if self.state is None or message["seq"] != self.seq + 1:
+                    self.bench.errors["out_of_sequence"] += 1
+                    await self.transport.send({"type": "resync"})
+                else:
+                    self.apply_patch(message)
+            elif message_type == "player_id":
+                self.player_id = message["id"]
+            elif message_type == "error":
+                self.bench.errors[message.get("message", "error")] += 1
+            for waiter in list(self.waiters):
+                if waiter[0](message):
+                    self.waiters.remove(waiter)
+                    if not waiter[1].done():
+                        waiter[1].set_result(message)
+
+    def apply_patch(self, message):
+        state = self.state
+        for key, value in message.get("set", {}).items():
+            state[key] = value
+        for key, removed in message.get("remove", {}).items():
+            removed = set(removed)
+            state[key] = [i for i in state.get(key, []) if i not in removed]
+        for key, added in message.get("append", {}).items():
+            state[key] = state.get(key, []) + added
+        self.seq = message["seq"]
+
+    def expect(self, predicate):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((predicate, future))
+        return future
+
+    async def act(self, label, message, predicate=lambda m: m["type"] in STATE_TYPES):
+        """Send ``message`` and record how long until a reply matching ``predicate`` arrives."""
+        reply = self.expect(predicate)
+        start = time.perf_counter()
+        await self.transport.send(message)
+        try:
+            await asyncio.wait_for(reply, self.bench.timeout)
+        except asyncio.TimeoutError:
+            self.bench.errors[f"{label}_timeout"] += 1
+            return
+        self.bench.record(label, time.perf_counter() - start)
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.timeout = args.timeout
+        self.latencies = defaultdict(list)  # action label -> seconds
+        self.errors = defaultdict(int)
+        self.main = None
+        # Sessions that have yet to reach the reconnect storm (or finish without it)
+        self.storm_pending = args.sessions
+        self.storm = asyncio.Event()
+        self.storm_sessions = []  # (clients, event set once they have reconnected)
+
+    async def open(self, session_code, since):
+        if self.args.url:
+            return await RemoteTransport.connect(self.args.url, session_code, since)
+        return InProcessTransport(self.main, session_code, since)
+
+    def record(self, label, seconds):
+        self.latencies[label].append(seconds)
+
+    async def run(self):
+        if not self.args.url:
+            self.main = load_server()
+            await self.main.start_sweeper()
+        run_id = uuid.uuid4().hex[:6]
+        codes = [f"LT{run_id}{i}" for i in range(self.args.sessions)]
+        start = time.perf_counter()
+        storm_task = asyncio.create_task(self.reconnect_storm())
+        await asyncio.gather(*(self.play(code, VOTE_STYLES[i % len(VOTE_STYLES)])
+                               for i, code in enumerate(codes)))
+        storm_task.cancel()
+        elapsed = time.perf_counter() - start
+        if self.main is not None:
+            await self.main.shutdown()
+        return self.report(elapsed)
+
+    def arrive_at_storm(self, entry=None):
+        if entry is not None:
+            self.storm_sessions.append(entry)
+        self.storm_pending -= 1
+        if self.storm_pending == 0:
+            self.storm.set()
+
+    async def play(self, session_code, vote_style):
+        host = Client(self, session_code, "P0")
+        await host.connect()
+        players = [host] + [Client(self, session_code, f"P{i}") for i in range(1, self.args.players)]
+        await host.expect(lambda m: m["type"] == "state_snapshot")
+        # The first connection gets the host's ID; joining later gives the host a player ID too
+        host.host_id = host.player_id
+        for player in players:
+            if player is not host:
+                await player.connect()
+                await player.expect(lambda m: m["type"] in STATE_TYPES)
+            await player.act("join", {"type": "join", "name": player.name})
+
+        names = [p.name for p in reversed(players)]
+        await host.act("reorder", {"type": "reorder", "order": names})
+        film_ids = self.film_ids()
+        await host.act(f"start:{vote_style}", {"type": "start", "film_ids": film_ids, "vote_style": vote_style,
+                                               "hybrid_threshold": self.args.hybrid_threshold})
+
+        by_name = {p.name: p for p in players}
+        eliminations = 0
+        stormed = False
+        while host.state is not None and not host.state.get("has_winner"):
+            if eliminations == self.args.storm_after:
+                # Wait until every session has got this far, then all reconnect at once
+                stormed = True
+                reconnected = asyncio.Event()
+                self.arrive_at_storm((players, reconnected))
+                await reconnected.wait()
+            player = by_name[host.state["currentPlayer"]]
+            await self.catch_up(player, host.seq)
+            if player.state["group_a"]:
+                action = {"type": "eliminate", "group": "A"}
+            else:
+                action = {"type": "eliminate", "film_id": player.state["films_remaining"][0]}
+            await player.act("eliminate", action)
+            eliminations += 1
+            # The host decides who goes next, so it must have seen the turn pass
+            await self.catch_up(host, player.seq)
+        if not stormed:
+            self.arrive_at_storm()
+
+        if len(players) > 1:
+            await host.act("kick_player", {"type": "kick_player", "player": players[-1].name})
+        for player in players:
+            await player.disconnect()
+
+    async def catch_up(self, client, seq):
+        """Wait until ``client`` has applied state update ``seq``."""
+        if client.seq < seq:
+            await asyncio.wait_for(client.expect(lambda m: m.get("seq") == seq), self.timeout)
+
+    async def reconnect_storm(self):
+        await self.storm.wait()
+        clients = [client for players, _ in self.storm_sessions for client in players]
+
+        async def reconnect(client):
+            await client.disconnect()
+            await client.connect(resume=True)
+            if client.host_id:
+                await client.act("reconnect", {"type": "host_reconnect", "host_id": client.host_id},
+                                 lambda m: m["type"] == "reconnect_success")
+            await client.act("reconnect", {"type": "join", "name": client.name, "player_id": client.player_id},
+                             lambda m: m["type"] == "reconnect_success")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(reconnect(c) for c in clients))
+        self.record("reconnect_storm_total", time.perf_counter() - start)
+        for _, reconnected in self.storm_sessions:
+            reconnected.set()
+
+    def film_ids(self):
+        if self.main is not None:
+            ids = list(self.main.catalog.films)
+        else:
+            import csv
+
+            with open(os.path.join(os.path.dirname(__file__), "..", "scifi_data.csv"), encoding="utf-8") as f:
+                ids = [row["imdbID"] for row in csv.DictReader(f)]
+        return ids[:self.args.films]
+
+    def report(self, elapsed):
+        actions = sum(len(v) for k, v in self.latencies.items() if k != "reconnect_storm_total")
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_revision(),
+            "python": platform.python_version(),
+            "target": self.args.url or "in-process",
+            "params": {k: v for k, v in vars(self.args).items() if k != "out"},
+            "elapsed_s": round(elapsed, 3),
+            "actions": actions,
+            "throughput_actions_per_s": round(actions / elapsed, 1) if elapsed else None,
+            "latency_ms": {label: summarize(samples) for label, samples in sorted(self.latencies.items())},
+            "errors": dict(self.errors),
+        }
+        return results
+
+
+def summarize(samples):
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) == 1:
+        return {"count": 1, "p50": round(ms[0], 3), "p95": round(ms[0], 3), "p99": round(ms[0], 3),
+                "max": round(ms[0], 3)}
+    cuts = statistics.quantiles(ms, n=100, method="inclusive")
+    return {"count": len(ms), "p50": round(cuts[49], 3), "p95": round(cuts[94], 3),
+            "p99": round(cuts[98], 3), "max": round(ms[-1], 3)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_server():
+    # Keep the in-process server from touching sessions.db or flooding the terminal
+    os.environ.setdefault("VOTE_STORE", "memory")
+    os.environ.setdefault("VOTE_LOG_LEVEL", "WARNING")
+    import main
+
+    return main
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the vote server and report action latency.")
+    parser.add_argument("--url", help="websocket base URL of a running server, e.g. ws://localhost:8000/ws "
+                                      "(default: run the server in this process)")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--films", type=int, default=40)
+    parser.add_argument("--hybrid-threshold", type=int, default=10)
+    parser.add_argument("--storm-after", type=int, default=5,
+                        help="eliminations before every client reconnects at once")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for each reply")
+    parser.add_argument("--out", default="loadtest_results.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(Benchmark(args).run())
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    for label, summary in results["latency_ms"].items():
+        print(f"{label:>24}: n={summary['count']:<6} p50={summary['p50']:.2f}ms "
+              f"p95={summary['p95']:.2f}ms p99={summary['p99']:.2f}ms")
+    print(f"{results['actions']} actions in {results['elapsed_s']}s "
+          f"({results['throughput_actions_per_s']} actions/s), errors: {results['errors'] or 'none'}")
+    print(f"Results written to {args.out}")
@@ -0,0 +1,110 @@
+"""Structured logging for the vote server, written off the event loop.
+
+start() sends everything logged under "vote" through a QueueHandler; a
+QueueListener thread formats the records and writes them to stderr, so a slow
+terminal or log collector never stalls message handling. Fields passed with
+``extra`` (session code, seq, ...) stay structured: VOTE_LOG_FORMAT=json writes
+one JSON object per line, the default text format appends them as key=value.
+
+Loggers from session_logger() tag every record with the session's code.
+Events that happen on every message or broadcast go through a Sampler, which
+lets one in VOTE_LOG_SAMPLE through at INFO; the rest only show at DEBUG.
+Full session dumps are off unless VOTE_LOG_SESSION_DUMPS is set and the
+level is DEBUG.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_LEVEL = os.environ.get("VOTE_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("VOTE_LOG_FORMAT", "text")
+LOG_SAMPLE = int(os.environ.get("VOTE_LOG_SAMPLE", 100))
+SESSION_DUMPS = bool(os.environ.get("VOTE_LOG_SESSION_DUMPS"))
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+STANDARD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def record_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in STANDARD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record),
+        }
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = " ".join(f"{k}={v}" for k, v in record_fields(record).items())
+        return f"{line} {fields}" if fields else line
+
+
+class SessionLogger(logging.LoggerAdapter):
+    """Adds the session code to every record, keeping any other ``extra`` fields."""
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+
+def session_logger(name, session_code):
+    return SessionLogger(logging.getLogger(name), {"session": session_code})
+
+
+class Sampler:
+    """Returns True once every ``every`` calls, for events too frequent to log each time."""
+
+    __slots__ = ("every", "count")
+
+    def __init__(self, every=LOG_SAMPLE):
+        self.every = max(1, every)
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        if self.count >= self.every:
+            self.count = 0
+            return True
+        return False
+
+
+_listener = None
+
+
+def start():
+    """Route the "vote" loggers through a background thread. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    records = queue.SimpleQueue()
+    logger = logging.getLogger("vote")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop():
+    """Flush what is queued and stop the background thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,348 +1,671 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import hashlib
+import hmac
 import json
-import random
-import string  # For generating short IDs
-import csv
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from broker import open_broker
+from catalog import Catalog
+from cluster import OwnerLink, Relay, RemoteConn
+import logs
+import metrics
+from engine import Session
+from outbox import Outbox
+from profiler import Capture, CaptureInProgress
+from protocol import ProtocolError, decode, negotiate
+from spectators import Gallery, sse_events, watch_socket
+from eviction import archive_result, deep_sizeof, pick_evictions, session_sizeof
+from store import DURABLE_ACTIONS, open_store
 
 # from fastapi.staticfiles import StaticFiles
 # from fastapi.responses import HTMLResponse
 # import uvicorn
 
+logs.start()
+log = logging.getLogger("vote.main")
+
 app = FastAPI()
 # app.mount("/static", StaticFiles(directory="static"), name="static")
+# The vote pages are served from a different origin and fetch the catalog from here
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET"], expose_headers=["ETag"])
 
-# Function to generate a 6-character random ID
-def generate_short_id(length=6):
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+# Load all available films, from pyfi/build.py's export if it is up to date, else
+# from the CSV; sessions and clients refer to them by imdbID
+catalog = Catalog.load("../data/catalog.json", "../scifi_data.csv")
 
-# Load all available films from CSV
-with open("../scifi_data.csv", newline='', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    all_films = list(reader)
+# Clients may cache the catalog for an hour, then revalidate with its ETag
+CATALOG_MAX_AGE = 3600
 
-# Global dictionary to manage sessions by code
+# Observed and estimated watch dates, as pyfi/watch_dates.py caches them next to
+# watched_films.csv; served as they are, so clients never estimate them themselves
+WATCH_DATES_PATH = "../watch_dates.json"
+watch_dates = None
+if os.path.exists(WATCH_DATES_PATH):
+    with open(WATCH_DATES_PATH, "rb") as f:
+        watch_dates = f.read()
+    watch_dates_etag = '"' + hashlib.sha1(watch_dates).hexdigest() + '"'
+
+# Global dictionary to manage vote sessions (engine.Session) by code.
+# Only sessions owned by this worker are here; see cluster.py
 sessions = {}
+# Actor running each session, keyed by the same code, least recently used first
+actors = OrderedDict()
+# Sessions owned by other workers that some of our sockets belong to
+relays = {}
+# Sessions whose ownership is being settled, so concurrent connections wait for one answer
+opening = {}
+# Spectators of each session watched from this worker, see spectators.py
+galleries = {}
+
+# Where sessions are persisted so a restart can pick up votes in progress:
+# "sqlite:<path>" for the SQLite event log, or "memory" to keep nothing
+# With several workers, they all need the same sqlite file (or a shared backend)
+store = open_store(os.environ.get("VOTE_STORE", "sqlite:sessions.db"))
+
+# How workers find each other's sessions: "local" for a single worker,
+# "socket:<path>" for workers on one machine, or a redis:// URL
+broker = open_broker(os.environ.get("VOTE_BROKER", "local"))
+WORKER_ID = uuid.uuid4().hex[:12]
+
+# Seconds a single client may take to accept a message before it is dropped
+SEND_TIMEOUT = 5.0
+
+# Recent state patches kept per session, so a client that briefly dropped off
+# can catch up on what it missed instead of downloading a fresh snapshot
+RESUME_HISTORY = 64
+
+# Sessions nobody is connected to are dropped from memory (and the store) once
+# they have been quiet this long, or sooner once they have a winner
+SESSION_IDLE_TTL = float(os.environ.get("VOTE_SESSION_IDLE_TTL", 6 * 3600))
+SESSION_COMPLETED_TTL = float(os.environ.get("VOTE_SESSION_COMPLETED_TTL", 600))
+# Beyond this many sessions, the least recently used idle ones are dropped
+MAX_SESSIONS = int(os.environ.get("VOTE_MAX_SESSIONS", 1000))
+SWEEP_INTERVAL = 60.0
+# Optional JSON-lines file recording the outcome of every dropped session
+ARCHIVE_PATH = os.environ.get("VOTE_ARCHIVE")
+# Approximate bytes held by sessions, as of the last sweep
+sessions_size = 0
+
+# Admin endpoints (profiling) are only served to requests bearing this token
+ADMIN_TOKEN = os.environ.get("VOTE_ADMIN_TOKEN")
+
+# Served at /metrics; see metrics.py for the ones updated by outboxes and the protocol
+metrics.Gauge("vote_sessions", "Sessions owned by this worker", lambda: len(actors))
+metrics.Gauge("vote_relayed_sessions", "Sessions owned elsewhere that this worker relays to", lambda: len(relays))
+metrics.Gauge("vote_clients", "Clients connected to sessions owned by this worker",
+              lambda: sum(len(actor.clients) for actor in actors.values()))
+metrics.Gauge("vote_spectators", "Spectators connected to this worker",
+              lambda: sum(gallery.viewers for gallery in galleries.values()))
+metrics.Gauge("vote_players", "Players in sessions owned by this worker",
+              lambda: sum(len(session.players) for session in sessions.values()))
+metrics.Gauge("vote_sessions_approx_bytes", "Approximate memory held by sessions, as of the last sweep",
+              lambda: sessions_size)
+messages_handled = metrics.Counter("vote_messages_total", "Messages handled by session actors", ("type",))
+handler_seconds = metrics.Histogram("vote_handler_seconds", "Time to handle one message", ("type",))
+broadcast_seconds = metrics.Histogram("vote_broadcast_seconds", "Time to diff, encode and fan out one state update")
+broadcast_bytes = metrics.Counter("vote_broadcast_bytes_total",
+                                  "Bytes of state updates queued for clients, summed over recipients")
+sessions_evicted = metrics.Counter("vote_sessions_evicted_total", "Sessions dropped by the sweeper")
+
+@app.on_event("startup")
+async def start_sweeper():
+    app.state.sweeper = asyncio.create_task(sweep_sessions())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.sweeper.cancel()
+    # Hand our sessions back so another worker can pick them up from the store
+    for session_code in list(actors):
+        await retire_session(session_code)
+    for relay in list(relays.values()):
+        await relay.close()
+    await broker.close()
+    store.close()
+    logs.stop()
+
+
+@app.get("/catalog")
+async def get_catalog(request: Request):
+    headers = {
+        "ETag": catalog.etag,
+        "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    if request.headers.get("if-none-match") == catalog.etag:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(catalog.gzip_body, media_type="application/json",
+                        headers={**headers, "Content-Encoding": "gzip"})
+    return Response(catalog.body, media_type="application/json", headers=headers)
+
+
+@app.get("/watch_dates")
+async def get_watch_dates(request: Request):
+    if watch_dates is None:
+        return Response(status_code=404)
+    headers = {"ETag": watch_dates_etag, "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if request.headers.get("if-none-match") == watch_dates_etag:
+        return Response(status_code=304, headers=headers)
+    return Response(watch_dates, media_type="application/json", headers=headers)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/admin/profile")
+async def capture_profile(request: Request, seconds: float = 10.0, cpu: bool = True, targets: str = ""):
+    """Profile this worker for ``seconds`` and return the report, see profiler.py.
+
+    ``targets`` is a comma-separated list of PROFILE_TARGETS to time call by call.
+    """
+    if not ADMIN_TOKEN:
+        return Response(status_code=404)
+    token = request.headers.get("authorization", "").encode()
+    if not hmac.compare_digest(token, f"Bearer {ADMIN_TOKEN}".encode()):
+        return Response(status_code=403)
+    names = [name for name in targets.split(",") if name]
+    unknown = [name for name in names if name not in PROFILE_TARGETS]
+    if unknown:
+        return JSONResponse({"error": f"Unknown targets: {', '.join(unknown)}",
+                             "targets": list(PROFILE_TARGETS)}, status_code=400)
+    capture = Capture(seconds, cpu, [(name, *PROFILE_TARGETS[name]) for name in names])
+    try:
+        report = await capture.run()
+    except CaptureInProgress as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+    log.info("Captured profile", extra={"file": report["report_file"], "seconds": capture.seconds,
+                                        "lag_max_ms": report["loop_lag_ms"].get("max")})
+    return report
+
 
 @app.websocket("/ws/{session_code}")
 async def websocket_endpoint(websocket: WebSocket, session_code: str):
-    await websocket.accept()
-
-    # Create session if it doesn't exist
-    if session_code not in sessions:
-        print(sessions)
-        host_id = generate_short_id()
-        sessions[session_code] = {
-            "host": {"ws": websocket, "id": host_id},  # Give the host a short ID
-            "clients": [],
-            "players": [],
-            "films_remaining": [],
-            "eliminated_films": [],
-            "current_turn": 0,
-            "started": False,
-            "player_ids": {},  # Map of player names to unique IDs
-            "winner": None,    # Will hold the winning film when only one remains
-            "vote_style": "one-by-one",  # Default voting style
-            "hybrid_threshold": 10,      # Default threshold for hybrid mode
-            "group_a": [],     # For 50/50 voting: first group of films
-            "group_b": []      # For 50/50 voting: second group of films
-        }
-        # Send the host their ID immediately
-        await websocket.send_json({"type": "player_id", "id": host_id})
+    # JSON unless the client asked for the compact binary format, see protocol.py
+    subprotocol, to_binary = negotiate(websocket.scope.get("subprotocols", ()))
+    await websocket.accept(subprotocol=subprotocol)
+    # Everything sent to this client goes through its own queue, see outbox.py
+    conn = Outbox(websocket, SEND_TIMEOUT, to_binary, log=logs.session_logger("vote.outbox", session_code))
 
-    session = sessions[session_code]
-    session["clients"].append(websocket)
+    new_session = await find_session(session_code, conn)
+
+    relay = relays.get(session_code)
+    if relay is not None:
+        await relay_socket(relay, websocket, conn)
+        return
+
+    # All session changes go through the actor so they are applied one at a time, in order
+    actor = actors[session_code]
+    conn.on_close = lambda: actor.post(conn, {"type": "disconnect"})
+    # "since" is the last state the client saw, if it is reconnecting, see SessionActor.missed_frames
+    actor.post(conn, {"type": "connect", "new_session": new_session,
+                      "since": websocket.query_params.get("since")})
 
     try:
-        while True:
-            data = await websocket.receive_json()
-
-            if data["type"] == "join":
-                # Check if this is a reconnection
-                player_name = data["name"]
-                player_id = data.get("player_id")
-                
-                # Check if vote has already started - only allow reconnections after vote starts
-                if session["started"] and not (player_id and player_id in session["player_ids"].values()):
-                    # New player trying to join after vote started - reject with clear message
-                    await websocket.send_json({
-                        "type": "error", 
-                        "message": "Cannot join after voting has started. Please wait for the host to start a new session.",
-                        "vote_in_progress": True  # Add a flag to differentiate this error type
-                    })
-                    
-                    print(f"Rejected new player join attempt during active vote. Session: {session_code}")
-                elif player_id and player_id in session["player_ids"].values():
-                    # This is a reconnection
-                    # Update the player's websocket
-                    player_found = False
-                    for player in session["players"]:
-                        if player.get("id") == player_id:
-                            player_found = True
-                            player["ws"] = websocket
-                            # Update player name in player_ids if needed
-                            old_name = player["name"]
-                            if old_name != player_name and old_name in session["player_ids"]:
-                                # Player changed their name during reconnection
-                                del session["player_ids"][old_name]
-                                session["player_ids"][player_name] = player_id
-                                player["name"] = player_name
-                                
-                            # Send confirmation of reconnection
-                            await websocket.send_json({
-                                "type": "reconnect_success", 
-                                "name": player["name"]
-                            })
-                            
-                            # Log successful reconnection
-                            print(f"Player reconnected: {player_name} (ID: {player_id})")
-                            break
-                            
-                    if not player_found:
-                        # This case can happen if player_id exists but player record was removed
-                        # Send an error to the client
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Failed to reconnect. Your session may have expired."
-                        })
-                else:
-                    # New player joining
-                    new_id = generate_short_id()
-                    session["player_ids"][player_name] = new_id
-                    session["players"].append({
-                        "name": player_name, 
-                        "ws": websocket,
-                        "id": new_id
-                    })
-                    # Send the player their ID for future reconnections
-                    await websocket.send_json({"type": "player_id", "id": new_id})
-                
-                await broadcast_state(session_code)
-
-            elif data["type"] == "host_reconnect":
-                # Host reconnection using their ID
-                host_id = data.get("host_id")
-                if host_id and host_id == session["host"]["id"]:
-                    session["host"]["ws"] = websocket
-                    await websocket.send_json({"type": "reconnect_success", "is_host": True})
-                    await broadcast_state(session_code)
-                
-            elif data["type"] == "start":
-                if websocket == session["host"]["ws"]:  # Updated host reference
-                    # Get voting style settings from the data
-                    vote_style = data.get("vote_style", "one-by-one")
-                    hybrid_threshold = int(data.get("hybrid_threshold", 10))
-                    
-                    # Update session with voting style settings
-                    session["vote_style"] = vote_style
-                    session["hybrid_threshold"] = hybrid_threshold
-                    
-                    # Shuffle films and start session
-                    all_films = random.sample(data["films"], len(data["films"]))
-                    session["films_remaining"] = all_films
-                    session["eliminated_films"] = []
-                    session["current_turn"] = 0
-                    session["started"] = True
-                    
-                    # If using 50/50 or hybrid voting style, split films into two groups initially
-                    if vote_style in ["fifty-fifty", "hybrid"]:
-                        mid_point = len(all_films) // 2
-                        session["group_a"] = all_films[:mid_point]
-                        session["group_b"] = all_films[mid_point:]
-                    
-                    print(f"Starting vote with style: {vote_style}" + 
-                          (f", threshold: {hybrid_threshold}" if vote_style == "hybrid" else ""))
-                    
-                    await broadcast_state(session_code)
-
-            elif data["type"] == "eliminate":
-                if session["started"] and session["players"][session["current_turn"]]["ws"] == websocket:
-                    vote_style = session["vote_style"]
-                    
-                    # Handle one-by-one elimination style
-                    if vote_style == "one-by-one" or (vote_style == "hybrid" and len(session["films_remaining"]) <= session["hybrid_threshold"]):
-                        film_to_remove = data["film"]
-                        session["films_remaining"] = [
-                            f for f in session["films_remaining"] if f["Title"] != film_to_remove]
-                        session["eliminated_films"].append(film_to_remove)
-                        
-                    # Handle 50/50 elimination style
-                    elif vote_style == "fifty-fifty" or (vote_style == "hybrid" and len(session["films_remaining"]) > session["hybrid_threshold"]):
-                        # Get which group to eliminate (A or B)
-                        group_to_eliminate = data.get("group", "")
-                        
-                        if group_to_eliminate == "A":
-                            # Add all Group A films to eliminated list
-                            for film in session["group_a"]:
-                                session["eliminated_films"].append(film)
-                            # Keep only Group B films
-                            session["films_remaining"] = session["group_b"]
-                        elif group_to_eliminate == "B":
-                            # Add all Group B films to eliminated list
-                            for film in session["group_b"]:
-                                session["eliminated_films"].append(film)
-                            # Keep only Group A films
-                            session["films_remaining"] = session["group_a"]
-                        
-                        # If in hybrid mode and now below threshold, transition to one-by-one style
-                        if vote_style == "hybrid" and len(session["films_remaining"]) <= session["hybrid_threshold"]:
-                            print(f"Hybrid mode transitioning to one-by-one elimination with {len(session['films_remaining'])} films remaining")
-                            # When transitioning to one-by-one, clear groups so client doesn't try to use stale ones
-                            session["group_a"] = []
-                            session["group_b"] = []
-                        # Otherwise, prepare new 50/50 groups for next round if applicable
-                        # This covers pure "fifty-fifty" mode and "hybrid" mode still in 50/50 phase
-                        elif vote_style == "fifty-fifty" or (vote_style == "hybrid" and len(session["films_remaining"]) > session["hybrid_threshold"]):
-                            if len(session["films_remaining"]) > 2:  # More than 2 films, split normally
-                                random.shuffle(session["films_remaining"])
-                                mid_point = len(session["films_remaining"]) // 2
-                                session["group_a"] = session["films_remaining"][:mid_point]
-                                session["group_b"] = session["films_remaining"][mid_point:]
-                            elif len(session["films_remaining"]) == 2: # Exactly 2 films, split into 1v1 groups
-                                # random.shuffle(session["films_remaining"]) # Optional: shuffle if order matters
-                                session["group_a"] = [session["films_remaining"][0]]
-                                session["group_b"] = [session["films_remaining"][1]]
-                            else: # 0 or 1 film remaining (winner state or empty), groups should be empty
-                                session["group_a"] = []
-                                session["group_b"] = []
-                    
-                    # Check if we have a winner (only one film left)
-                    if len(session["films_remaining"]) == 1:
-                        session["winner"] = session["films_remaining"][0]
-                        print(f"We have a winner: {session['winner']['Title']}")
-                    elif len(session["films_remaining"]) > 1:
-                        # Advance to next player regardless of voting style
-                        session["current_turn"] = (
-                            session["current_turn"] + 1) % len(session["players"])
-                    
-                    await broadcast_state(session_code)
-                    
-            elif data["type"] == "reorder":
-                new_order = data["order"]
-                reordered_players = []
-
-                # Preserve websocket associations and player IDs based on name
-                name_to_player = {p["name"]: p for p in session["players"]}
-                for name in new_order:
-                    if name in name_to_player:
-                        reordered_players.append(name_to_player[name])
-
-                session["players"] = reordered_players
-                session["current_turn"] = 0  # reset to first in new order
-                await broadcast_state(session_code)
-                
-            elif data["type"] == "kick_player":
-                # Only the host can kick players
-                if websocket == session["host"]["ws"]:
-                    player_to_kick = data["player"]
-                    
-                    # Find the player and their websocket
-                    kicked_player_ws = None
-                    for i, player in enumerate(session["players"]):
-                        if player["name"] == player_to_kick:
-                            kicked_player_ws = player["ws"]
-                            
-                            # Remove from player_ids dict
-                            if player["name"] in session["player_ids"]:
-                                del session["player_ids"][player["name"]]
-                            
-                            # Remove from players list
-                            session["players"].pop(i)
-                            
-                            break
-                    
-                    # Send notification to the kicked player
-                    if kicked_player_ws:
-                        try:
-                            await kicked_player_ws.send_json({
-                                "type": "kicked",
-                                "message": "You have been removed from the session by the host.",
-                                "can_rejoin": True  # Indicate that they can rejoin with a different name
-                            })
-                            
-                            # Log the kick action
-                            print(f"Player '{player_to_kick}' was kicked from session {session_code}")
-                            
-                            # Remove from clients
-                            if kicked_player_ws in session["clients"]:
-                                session["clients"].remove(kicked_player_ws)
-                        except Exception as e:
-                            print(f"Error sending kick notification: {e}")
-                            # Player might already be disconnected
-                    
-                    # Check if the kicked player was the current player
-                    was_current_player = False
-                    if session["players"] and session["started"]:
-                        if session["current_turn"] >= len(session["players"]):
-                            # The current player was removed, adjust turn index and mark for broadcast
-                            was_current_player = True
-                            session["current_turn"] = 0
-                    
-                    # Broadcast updated state
-                    await broadcast_state(session_code)
-                    
-                    # If this was the current player's turn, immediately send a follow-up
-                    # state update to ensure all clients are properly notified about the new current player
-                    if was_current_player and session["started"]:
-                        # Small delay to ensure clients process messages in order
-                        import asyncio
-                        await asyncio.sleep(0.2)
-                        await broadcast_state(session_code)
+        async for data in receive_messages(websocket, conn):
+            actor.post(conn, data)
+    except WebSocketDisconnect:
+        conn.disconnected()
+
+
+@app.websocket("/watch/{session_code}")
+async def watch_endpoint(websocket: WebSocket, session_code: str):
+    subprotocol, to_binary = negotiate(websocket.scope.get("subprotocols", ()))
+    await websocket.accept(subprotocol=subprotocol)
+    gallery = await open_gallery(session_code)
+    if gallery is None:
+        await send_frame(websocket, encode_message({"type": "error", "message": "No such session"}), "error", to_binary)
+        await websocket.close(code=1008)
+        return
+    await watch_socket(websocket, gallery, to_binary, SEND_TIMEOUT)
+
+
+@app.get("/watch/{session_code}/events")
+async def watch_events(session_code: str):
+    gallery = await open_gallery(session_code)
+    if gallery is None:
+        return Response(status_code=404)
+    return StreamingResponse(sse_events(gallery), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def find_session(session_code, conn=None):
+    """Make sure the session is running here or relayed to its owner, if it exists.
+
+    With ``conn``, a session that doesn't exist yet is created with it as host,
+    and True is returned. Without, nothing is created.
+    """
+    while session_code not in actors and session_code not in relays:
+        task = opening.get(session_code)
+        if task is None:
+            task = opening[session_code] = asyncio.create_task(open_session(session_code, conn))
+            task.add_done_callback(lambda _: opening.pop(session_code, None))
+            # Only the connection that created the session becomes its host
+            return await task
+        await task
+        if conn is None:
+            break
+    return False
+
+
+async def open_gallery(session_code):
+    """Return the session's Gallery on this worker, attaching a new one if needed; None if there is no session."""
+    gallery = galleries.get(session_code)
+    if gallery is not None and not gallery.closed:
+        return gallery
+    await find_session(session_code)
+    gallery = galleries.get(session_code)
+    if gallery is not None and not gallery.closed:
+        return gallery  # Another spectator got there first
+
+    gallery = Gallery(session_code)
+
+    def forget():
+        if galleries.get(session_code) is gallery:
+            del galleries[session_code]
+
+    gallery.on_close = forget
+    actor = actors.get(session_code)
+    relay = relays.get(session_code)
+    if actor is not None:
+        # The gallery is one more client as far as the session is concerned
+        gallery.resync = lambda: actor.post(gallery, {"type": "resync"})
+        gallery.detach = lambda: actor.post(gallery, {"type": "disconnect"})
+        actor.post(gallery, {"type": "connect", "new_session": False, "since": None})
+    elif relay is not None:
+        galleries[session_code] = gallery
+        target = await relay.attach(gallery)
+        gallery.resync = lambda: asyncio.create_task(relay.forward(target, {"type": "resync"}))
+        gallery.detach = lambda: asyncio.create_task(relay.detach(target))
+    else:
+        return None
+    galleries[session_code] = gallery
+    return gallery
+
+
+async def open_session(session_code, conn):
+    """Take ownership of a session, restoring or creating it, or relay to its owner.
+
+    Returns True if a brand new session was created with ``conn`` as host. With
+    no ``conn``, a session that isn't in the store is left alone.
+    """
+    link = OwnerLink(broker, WORKER_ID, session_code)
+    if not await link.claim():
+        relays[session_code] = Relay(broker, WORKER_ID, session_code,
+                                     on_close=lambda: relays.pop(session_code, None))
+        await relays[session_code].start()
+        return False
+
+    session = await store.load(session_code, catalog.films)
+    if session is None and conn is None:
+        await link.close()
+        return False
+    new_session = session is None
+    if new_session:
+        # Create session if it doesn't exist, with this connection as its host
+        session = Session(catalog.films, host_conn=conn)
+        await store.save_snapshot(session_code, session)
+        log.info("Created session", extra={"session": session_code, "sessions": len(sessions) + 1})
+        if logs.SESSION_DUMPS and log.isEnabledFor(logging.DEBUG):
+            log.debug("Session dump", extra={"session": session_code, "dump": session.to_dict()})
+    else:
+        log.info("Restored session from the session store", extra={"session": session_code})
+    sessions[session_code] = session
+    actors[session_code] = SessionActor(session_code, link)
+    link.start(actors[session_code].post, lambda: asyncio.create_task(retire_session(session_code)))
+    return new_session
+
+
+async def retire_session(session_code):
+    """Stop running a session here, e.g. because another worker now owns it."""
+    actor = actors.pop(session_code, None)
+    sessions.pop(session_code, None)
+    if actor is None:
+        return
+    actor.task.cancel()
+    await actor.link.close()
+    # 1012 (service restart) makes clients reconnect, to whichever worker owns it now
+    await asyncio.gather(*(c.close(code=1012) for c in actor.clients if isinstance(c, LOCAL_CLIENTS)),
+                         return_exceptions=True)
+
+
+async def sweep_sessions():
+    """Periodically drop finished and idle sessions, without holding up the event loop."""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            await sweep_once()
+        except Exception:
+            log.exception("Error sweeping sessions")
+
+
+async def sweep_once():
+    evict = pick_evictions(actors, time.monotonic(), SESSION_IDLE_TTL,
+                           SESSION_COMPLETED_TTL, MAX_SESSIONS)
+    for session_code in evict:
+        actor = actors.get(session_code)
+        if actor is None or actor.clients:
+            continue  # Someone came back while we were busy
+        if ARCHIVE_PATH:
+            await asyncio.to_thread(archive_result, ARCHIVE_PATH, session_code, actor.session)
+        await retire_session(session_code)
+        await store.delete(session_code)
+        sessions_evicted.inc()
+        log.info("Evicted session", extra={"session": session_code})
 
+    global sessions_size
+    total = 0
+    for i, actor in enumerate(list(actors.values())):
+        total += actor.approx_size()
+        if i % 100 == 99:
+            await asyncio.sleep(0)  # Let other work in between
+    sessions_size = total
+    log.info("Swept sessions", extra={"active": len(actors), "approx_kib": round(total / 1024), "evicted": len(evict)})
+
+
+async def relay_socket(relay, websocket, conn):
+    target = await relay.attach(conn, websocket.query_params.get("since"))
+    conn.on_close = lambda: asyncio.create_task(relay.detach(target))
+    try:
+        async for data in receive_messages(websocket, conn):
+            await relay.forward(target, data)
     except WebSocketDisconnect:
+        conn.disconnected()
+
+
+async def receive_messages(websocket, conn):
+    """Yield a client's valid messages; malformed ones are answered with an error and skipped."""
+    # Stop listening if the Outbox gives up on the client first
+    while not conn.closed:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        conn.touch()
+        try:
+            data = decode(message["text"] if message.get("text") is not None else message.get("bytes") or b"")
+        except ProtocolError as e:
+            metrics.messages_rejected.inc()
+            await send_to(conn, {"type": "error", "message": str(e)})
+            continue
+        if data["type"] != "pong" and not conn.closed:
+            yield data
+
+
+class SessionActor:
+    """Owns one session's connections: applies its messages in arrival order and coalesces broadcasts.
+
+    The vote rules live in engine.Session; the actor feeds it messages and sends a
+    single state update once the current burst of messages is drained, if the
+    session's version moved.
+    """
+
+    def __init__(self, session_code, link):
+        self.session_code = session_code
+        self.session = sessions[session_code]
+        self.link = link  # Connects clients on other workers, see cluster.py
+        self.log = logs.session_logger("vote.main", session_code)
+        self.broadcast_sample = logs.Sampler()
+        self.clients = set()      # Outboxes of local clients, RemoteConns for relayed ones
+        self.seq = 0              # Sequence number of the last broadcast state
+        self.last_state = None    # Last broadcast state, used to compute patches
+        # Sequence numbers restart whenever a session is (re)loaded, so clients
+        # resuming from an older run of it must not trust their seq
+        self.epoch = uuid.uuid4().hex[:8]
+        self.history = deque(maxlen=RESUME_HISTORY)  # (seq, frame) of recent patches
+        self.broadcast_version = self.session.version
+        self.last_active = time.monotonic()
+        self.size = None          # (version, approx bytes), see approx_size()
+        self.inbox = asyncio.Queue()
+        # Messages the actor handles itself; everything else goes to the session
+        self._handlers = {
+            "connect": self.on_connect,
+            "disconnect": self.on_disconnect,
+            "resync": self.on_resync,
+        }
+        self.task = asyncio.create_task(self.run())
+
+    def post(self, websocket, data):
+        self.inbox.put_nowait((websocket, data))
+        self.last_active = time.monotonic()
+        if self.session_code in actors:
+            actors.move_to_end(self.session_code)
+
+    def approx_size(self):
+        """Approximate bytes held by this session, recomputed only when its state has changed."""
+        if self.size is None or self.size[0] != self.session.version:
+            size = session_sizeof(self.session) + deep_sizeof(self.last_state)
+            size += sum(len(frame) for _, frame in self.history)
+            self.size = (self.session.version, size)
+        return self.size[1]
+
+    async def run(self):
+        while True:
+            await self.apply(*await self.inbox.get())
+            # Let any messages already sent this tick arrive, then apply them too
+            await asyncio.sleep(0)
+            while not self.inbox.empty():
+                await self.apply(*self.inbox.get_nowait())
+            while self.session.version != self.broadcast_version:
+                self.broadcast_version = self.session.version
+                await broadcast_state(self.session_code)
+
+    async def apply(self, websocket, data):
+        message_type = data.get("type")
+        messages_handled.inc(message_type)
+        try:
+            with handler_seconds.time(message_type):
+                await self.handle(websocket, data)
+        except Exception:
+            # A bad message must not take down the whole session
+            self.log.exception("Error handling message", extra={"type": message_type})
+
+    async def handle(self, websocket, data):
+        await self._handlers.get(data["type"], self.on_action)(websocket, data)
+
+    async def on_connect(self, websocket, data):
+        self.clients.add(websocket)
+        if data.get("new_session"):
+            # Send the host their ID immediately
+            await send_to(websocket, {"type": "player_id", "id": self.session.host_id})
+        # A reconnecting client only needs the patches it missed; everyone
+        # else starts from a full snapshot. Later changes arrive as patches.
+        missed = self.missed_frames(data.get("since"))
+        if missed is None:
+            await self.send_snapshot(websocket)
+        for frame in missed or ():
+            await self.send_state(websocket, frame)
+
+    async def on_disconnect(self, websocket, data):
+        self.drop_client(websocket)
+
+    async def on_resync(self, websocket, data):
+        # Client detected a gap in the patch sequence
+        await self.send_snapshot(websocket)
+
+    async def on_action(self, websocket, data):
+        session = self.session
+        winner = session.winner
+        version = session.version
+        identity = session.identify(websocket)
+        replies = session.apply(websocket, data)
+        if session.version != version and data["type"] in DURABLE_ACTIONS:
+            await store.record(self.session_code, session, identity, data)
+        for reply in replies:
+            await send_to(reply.conn, reply.message)
+            if reply.detach:
+                self.clients.discard(reply.conn)
+                if isinstance(reply.conn, RemoteConn):
+                    await reply.conn.detach()
+            log_reply(self.log, data, reply)
+        if data["type"] == "start" and session.started:
+            self.log.info("Starting vote", extra={"vote_style": session.vote_style,
+                                                  "threshold": session.hybrid_threshold,
+                                                  "films": len(session.films_remaining)})
+        if session.winner is not None and winner is None:
+            self.log.info("We have a winner", extra={"winner": session.winner.id, "title": session.winner.title})
+
+    def drop_client(self, websocket):
         # Remove client but don't remove players (they can reconnect)
-        session["clients"].remove(websocket)
-        # Only mark the websocket as disconnected, but keep the player data
-        for player in session["players"]:
-            if player["ws"] == websocket:
-                player["ws"] = None  # Mark as disconnected
-        
-        # If the host disconnected, mark their websocket as None
-        if session["host"]["ws"] == websocket:
-            session["host"]["ws"] = None
-            
-        await broadcast_state(session_code)
+        self.clients.discard(websocket)
+        self.session.disconnect(websocket)
+
+    def missed_frames(self, since):
+        """Return the patches broadcast after ``since`` ("<epoch>.<seq>"), or None if a snapshot is needed."""
+        epoch, _, seq = (since or "").partition(".")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        seq = int(seq)
+        if seq == self.seq:
+            return []
+        if not self.history or self.history[0][0] > seq + 1:
+            # The buffer has already rolled past what the client saw last
+            return None
+        return [frame for s, frame in self.history if s > seq]
+
+    def snapshot_frame(self):
+        if self.last_state is None:
+            self.last_state = self.session.state()
+        return encode_message({
+            "type": "state_snapshot",
+            "seq": self.seq,
+            "epoch": self.epoch,
+            "state": self.last_state
+        })
+
+    async def send_snapshot(self, websocket):
+        await send_frame(websocket, self.snapshot_frame(), "state_snapshot")
+
+    async def send_state(self, websocket, frame):
+        if isinstance(websocket, LOCAL_CLIENTS):
+            # Lets a client that has fallen behind skip straight to the latest state
+            websocket.push_state(frame, self.snapshot_frame)
+        else:
+            await send_frame(websocket, frame)
+
+
+def log_reply(log, data, reply):
+    message_type = reply.message["type"]
+    if message_type == "kicked":
+        log.info("Player was kicked", extra={"player": data["player"]})
+    elif message_type == "reconnect_success" and not reply.message.get("is_host"):
+        log.info("Player reconnected", extra={"player": reply.message["name"], "player_id": data.get("player_id")})
+    elif message_type == "error" and reply.message.get("vote_in_progress"):
+        log.info("Rejected new player join attempt during active vote")
+
+
+# Clients on this worker, which take state updates with push_state(); the rest are RemoteConns
+LOCAL_CLIENTS = (Outbox, Gallery)
+
+
+# State fields holding lists of imdbIDs, patched by removing IDs rather than resending the list
+FILM_LIST_FIELDS = ("films_remaining", "group_a", "group_b")
+# State fields that only ever grow, patched by appending the new entries
+APPEND_ONLY_FIELDS = ("eliminated",)
+
+
+def diff_state(old, new):
+    """Return a patch turning ``old`` into ``new``, or None if nothing changed."""
+    patch = {"set": {}, "remove": {}, "append": {}}
+    for key, value in new.items():
+        previous = old.get(key)
+        if value == previous:
+            continue
+        if key in FILM_LIST_FIELDS and previous:
+            # Send only the removed IDs if the new list is the old one with some films dropped
+            kept = set(value)
+            if len(kept) == len(value) and [i for i in previous if i in kept] == value:
+                patch["remove"][key] = [i for i in previous if i not in kept]
+                continue
+        if key in APPEND_ONLY_FIELDS and previous is not None and value[:len(previous)] == previous:
+            patch["append"][key] = value[len(previous):]
+            continue
+        patch["set"][key] = value
+    patch = {op: fields for op, fields in patch.items() if fields}
+    return patch or None
+
+
+def encode_message(message):
+    # Compact separators keep frames small; the text is built once per broadcast
+    return json.dumps(message, separators=(",", ":"))
+
+
+async def send_to(websocket, message):
+    await send_frame(websocket, encode_message(message), message.get("type"))
+
+
+async def send_frame(websocket, frame, kind="state_patch", to_binary=None):
+    # Direct replies run inside the session actor, so they get the same bound as broadcasts.
+    # ``to_binary`` is for raw sockets that negotiated MessagePack; an Outbox converts by itself
+    try:
+        send = websocket.send_bytes(to_binary(frame)) if to_binary is not None else websocket.send_text(frame)
+        await asyncio.wait_for(send, SEND_TIMEOUT)
+    except Exception as e:
+        log.warning("Error sending to client", extra={"type": kind, "error": repr(e)})
 
 
 async def broadcast_state(session_code):
+    with broadcast_seconds.time():
+        await fan_out_state(session_code)
+
+
+async def fan_out_state(session_code):
+    actor = actors[session_code]
     session = sessions[session_code]
-    
-    # Validate the current turn index to prevent out of bounds errors
-    # This can happen if players are kicked or leave
-    if session["players"] and session["started"]:
-        if session["current_turn"] >= len(session["players"]):
-            session["current_turn"] = 0
-    
-    # Determine the current player safely
-    current_player = None
-    if session["players"] and session["films_remaining"] and session["started"]:
-        current_player = session["players"][session["current_turn"]]["name"]
-    
-    state = {
-        "type": "state_update",  # Add a type field to distinguish from other message types
-        "filmsRemaining": session["films_remaining"],
-        "films_remaining": session["films_remaining"],  # Explicit for host status panel
-        "eliminated": session["eliminated_films"],
-        "players": [p["name"] for p in session["players"]],
-        "currentPlayer": current_player,
-        "current_turn": session["current_turn"],  # Include current turn index
-        "started": session["started"],
-        "connected_players": [p["name"] for p in session["players"] if p["ws"] is not None],
-        "winner": session.get("winner"),  # Include winner information if available
-        "has_winner": session.get("winner") is not None,
-        "vote_style": session.get("vote_style", "one-by-one"),  # Voting style
-        "hybrid_threshold": session.get("hybrid_threshold", 10),  # Hybrid threshold
-        "group_a": session.get("group_a", []),  # Group A films for 50/50 voting
-        "group_b": session.get("group_b", [])   # Group B films for 50/50 voting
-    }
-    
-    # Log state for debugging
-    print(f"Broadcasting state: Vote started={session['started']}, " 
-          f"Players={len(session['players'])}, Current turn={session['current_turn']}, "
-          f"Current player={current_player}")
-    
-    for client in session["clients"]:
-        try:
-            await client.send_json(state)
-        except Exception as e:
-            print(f"Error sending to client: {e}")
-            # Client might be disconnected, but we continue with others
+
+    state = session.state()
+    previous = actor.last_state
+    if previous is None:
+        patch = {"set": state}
+    else:
+        patch = diff_state(previous, state)
+        if patch is None:
+            # Nothing visible changed, so there is nothing to send
+            return
+
+    actor.seq += 1
+    actor.last_state = state
+    message = {"type": "state_patch", "seq": actor.seq, **patch}
+
+    # One broadcast in LOG_SAMPLE is logged at INFO; all of them at DEBUG
+    sampled = actor.broadcast_sample()
+    if sampled or actor.log.isEnabledFor(logging.DEBUG):
+        actor.log.log(logging.INFO if sampled else logging.DEBUG, "Broadcasting state", extra={
+            "seq": actor.seq, "started": session.started, "players": len(session.players),
+            "current_turn": session.current_turn, "current_player": state["currentPlayer"],
+        })
+
+    # Encode once and queue the same frame for every client; each client's
+    # Outbox sends it at that client's pace, so one slow phone can't hold up the room
+    frame = encode_message(message)
+    actor.history.append((actor.seq, frame))
+    recipients = 0
+    for client in actor.clients:
+        if isinstance(client, LOCAL_CLIENTS):
+            client.push_state(frame, actor.snapshot_frame)
+            recipients += 1
+    if actor.link.remote:
+        recipients += 1  # One copy for all the relays
+    broadcast_bytes.inc(amount=len(frame) * recipients)
+    # Clients on other workers get one copy between them, see cluster.Relay
+    try:
+        await asyncio.wait_for(actor.link.broadcast(frame), SEND_TIMEOUT)
+    except Exception as e:
+        actor.log.warning("Error relaying state to other workers", extra={"error": repr(e)})
+
+
+# Functions an admin can time call by call during a profile: (namespace, attribute, label)
+PROFILE_TARGETS = {
+    # Every message a session handles, split by message type
+    "handlers": (SessionActor, "handle", lambda actor, websocket, data: data["type"]),
+    # Diffing, encoding and queuing one state update for a session's clients
+    "broadcast": (globals(), "broadcast_state", None),
+}
@@ -0,0 +1,121 @@
+"""Counters and histograms for the vote server, served at /metrics.
+
+A deliberately small take on the Prometheus client: metrics live in this
+worker's memory, are updated from the event loop without locks, and render()
+writes them in the Prometheus text exposition format. Each worker process
+serves its own numbers; Prometheus adds them up across workers.
+"""
+
+import bisect
+import time
+
+# Seconds; fine enough to tell a fast handler from one waiting on the store
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+REGISTRY = []
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {} if labels else {(): 0}  # label values -> count
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *label_values):
+        """Context manager observing how long its block took."""
+        return Timer(self, label_values)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in self.values.items():
+            names = self.labels + ("le",)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(names, label_values + (bound,))} {cumulative}"
+            labels = format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {series[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """A value read when metrics are scraped, e.g. the number of open sessions."""
+
+    def __init__(self, name, description, read):
+        self.name = name
+        self.description = description
+        self.read = read
+        REGISTRY.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+class Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Metrics updated outside main.py; main.py defines the ones about sessions
+messages_rejected = Counter("vote_messages_rejected_total", "Client messages that failed to decode or validate")
+bytes_sent = Counter("vote_sent_bytes_total", "Bytes written to client sockets (characters for text frames)")
+send_failures = Counter("vote_send_failures_total", "Sends to a client that failed or timed out")
+clients_dropped = Counter("vote_clients_dropped_total", "Clients closed by the server, by reason", ("reason",))
+state_collapses = Counter("vote_state_collapses_total",
+                          "Times a lagging client's queued patches were collapsed into one snapshot")
+spectators_joined = Counter("vote_spectators_joined_total", "Spectators that started watching, by transport",
+                            ("transport",))
@@ -0,0 +1,154 @@
+"""Per-client send queues, so one slow or dead phone never holds up its room.
+
+Each websocket is wrapped in an Outbox with its own writer task. Sessions and
+relays hand it frames without waiting on the network; the writer sends them
+in order, with a bounded queue:
+
+- State patches pile up while a client is behind. Past MAX_QUEUED_PATCHES they
+  collapse into a single snapshot of the latest state, taken when it is sent.
+- Anything else (direct replies) counts against MAX_QUEUED_FRAMES; a client
+  that lets that many back up is closed and can reconnect and resume.
+
+Frames are JSON text; for clients that negotiated a binary format the writer
+converts each one with ``to_binary`` just before sending it.
+
+The writer also sends a ping every PING_INTERVAL seconds, and drops the client
+if nothing (pong or otherwise) has come back from it in PING_TIMEOUT seconds.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import metrics
+
+PING_INTERVAL = 20.0
+PING_TIMEOUT = 60.0
+PING = '{"type":"ping"}'
+
+MAX_QUEUED_PATCHES = 8
+MAX_QUEUED_FRAMES = 64
+
+DIRECT, PATCH, SNAPSHOT = range(3)
+
+
+class Outbox:
+    """Wraps a websocket; sessions treat it as the client's connection."""
+
+    __slots__ = ("websocket", "send_timeout", "to_binary", "on_close", "log", "queue", "patches",
+                 "snapshot_queued", "last_seen", "ready", "closed", "task")
+
+    def __init__(self, websocket, send_timeout, to_binary=None, on_close=None, log=None):
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.to_binary = to_binary  # e.g. protocol.to_msgpack, or None to send text
+        self.on_close = on_close  # Called once when the client goes away, for whatever reason
+        self.log = log or logging.getLogger("vote.outbox")
+        self.queue = deque()      # (DIRECT | PATCH, frame) or (SNAPSHOT, callable returning a frame)
+        self.patches = 0
+        self.snapshot_queued = False
+        self.last_seen = time.monotonic()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task = asyncio.create_task(self._write())
+
+    def touch(self):
+        """Record that the client is still there, e.g. because it sent a message."""
+        self.last_seen = time.monotonic()
+
+    async def send_text(self, frame):
+        if self.closed:
+            return
+        if len(self.queue) >= MAX_QUEUED_FRAMES:
+            self.log.warning("Closing client with too many unsent messages", extra={"queued": len(self.queue)})
+            metrics.clients_dropped.inc("backlog")
+            await self.close(code=1011)
+            return
+        self._enqueue(DIRECT, frame)
+
+    def push_state(self, frame, snapshot=None):
+        """Queue a state patch; ``snapshot()`` must return a snapshot frame of the latest state.
+
+        Without ``snapshot``, a client that falls behind just loses the queued
+        patches, notices the gap and asks for a resync itself.
+        """
+        if self.closed or self.snapshot_queued:
+            return  # A queued snapshot will already include this change
+        if self.patches >= MAX_QUEUED_PATCHES:
+            self.queue = deque(item for item in self.queue if item[0] != PATCH)
+            self.patches = 0
+            metrics.state_collapses.inc()
+            if snapshot is not None:
+                self.snapshot_queued = True
+                self._enqueue(SNAPSHOT, snapshot)
+                return
+        self.patches += 1
+        self._enqueue(PATCH, frame)
+
+    def _enqueue(self, kind, payload):
+        self.queue.append((kind, payload))
+        self.ready.set()
+
+    async def _write(self):
+        next_ping = time.monotonic() + PING_INTERVAL
+        while True:
+            if not self.queue:
+                self.ready.clear()
+                try:
+                    await asyncio.wait_for(self.ready.wait(), max(0.0, next_ping - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+            now = time.monotonic()
+            if now >= next_ping:
+                if now - self.last_seen > PING_TIMEOUT:
+                    self.log.info("Closing client that stopped answering pings",
+                                  extra={"silent_for": round(now - self.last_seen)})
+                    metrics.clients_dropped.inc("heartbeat")
+                    asyncio.create_task(self.close(code=1011))
+                    return
+                self.queue.append((DIRECT, PING))
+                next_ping = now + PING_INTERVAL
+            if not self.queue:
+                continue
+
+            kind, payload = self.queue.popleft()
+            if kind == PATCH:
+                self.patches -= 1
+            elif kind == SNAPSHOT:
+                self.snapshot_queued = False
+                payload = payload()
+            try:
+                if self.to_binary is not None:
+                    payload = self.to_binary(payload)
+                    send = self.websocket.send_bytes(payload)
+                else:
+                    send = self.websocket.send_text(payload)
+                await asyncio.wait_for(send, self.send_timeout)
+                metrics.bytes_sent.inc(amount=len(payload))
+            except Exception as e:
+                self.log.info("Closing client that could not be sent to", extra={"error": repr(e)})
+                metrics.send_failures.inc()
+                metrics.clients_dropped.inc("send_failed")
+                asyncio.create_task(self.close(code=1011))
+                return
+
+    def disconnected(self):
+        """Stop sending; the socket is already gone."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+        if self.on_close is not None:
+            self.on_close()
+
+    async def close(self, code=1000):
+        if self.closed:
+            return
+        self.disconnected()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass  # The socket is already unusable
@@ -9,7 +9,9 @@ let playerId = urlParams.get("pid");
 const nameFromUrl = urlParams.get("name");
 
 const backendUrl = "wss://meow.suprdory.com:8006/ws";
+StateStream.useBackend(backendUrl);
 let ws;
+let stateStream;
 let reconnectAttempts = 0;
 const MAX_RECONNECT_ATTEMPTS = 5;
 
@@ -34,7 +36,11 @@ let isFilmDetailsViewCurrentlyActive = false;
 
 // Initialize WebSocket connection
 function initWebSocket() {
-  ws = new WebSocket(`${backendUrl}/${sessionCode}`);
+  // One stream for the page, so a reconnect only fetches the patches we missed
+  if (!stateStream) {
+    stateStream = new StateStream(() => Wire.send(ws, { type: "resync" }));
+  }
+  ws = Wire.open(`${backendUrl}/${sessionCode}${stateStream.resumeQuery()}`);
   
   ws.onopen = () => {
     log("WebSocket connection established");
@@ -50,11 +56,11 @@ function initWebSocket() {
     // If we have a player ID from the URL, attempt to reconnect
     if (playerId) {
       log("Auto-reconnecting with player ID:", playerId, playerName ? `and name: ${playerName}` : "");
-      ws.send(JSON.stringify({ 
+      Wire.send(ws, { 
         type: "join", 
         name: playerName || "", // Send current name if available
         player_id: playerId 
-      }));
+      });
       votingSection.style.display = "block";
       hideJoinElements();
     }
@@ -83,7 +89,12 @@ function initWebSocket() {
   
   // Listen for messages from the server
   ws.onmessage = (event) => {
-    const data = JSON.parse(event.data);
+    const data = Wire.decode(event.data);
+    // Heartbeat: the server drops clients that stop answering
+    if (data.type === "ping") {
+      Wire.send(ws, { type: "pong" });
+      return;
+    }
     log("Received data:", data);
     
     if (data.type) {
@@ -205,15 +216,21 @@ function initWebSocket() {
         }, 5000);
         
         return;
-      } else if (data.type === "state_update") {
-        // Handle regular game state update
-        films = data.filmsRemaining;
-        currentPlayer = data.currentPlayer;
-        
-        // Update UI with white styling (default)
-        playerHeader.textContent = `Welcome, ${playerName}`;
-        // Let CSS handle the color (white)
-        updateFilmList(data);
+      } else if (data.type === "state_snapshot" || data.type === "state_patch") {
+        const pending = stateStream.handle(data);
+        if (!pending) {
+          return;
+        }
+        pending.then(state => {
+          // Handle regular game state update
+          films = state.filmsRemaining;
+          currentPlayer = state.currentPlayer;
+          
+          // Update UI with white styling (default)
+          playerHeader.textContent = `Welcome, ${playerName}`;
+          // Let CSS handle the color (white)
+          updateFilmList(state);
+        }).catch(error => console.error("Error applying state update", error));
       }
     }
   };
@@ -255,11 +272,11 @@ joinBtn.addEventListener("click", () => {
     window.history.replaceState({}, '', newUrl);
     
     // Send join request to server
-    ws.send(JSON.stringify({ 
+    Wire.send(ws, { 
       type: "join", 
       name: playerName,
       player_id: playerId // Include ID if we have one from a previous session
-    }));
+    });
     
     // Show "Joining session..." with default white styling
     status.textContent = "Joining session...";
@@ -471,7 +488,7 @@ function show5050Groups(state) {
     eliminateABtn.className = "eliminate-group";
     eliminateABtn.textContent = "Eliminate Group A";
     eliminateABtn.addEventListener("click", () => {
-      ws.send(JSON.stringify({ type: "eliminate", group: "A" }));
+      Wire.send(ws, { type: "eliminate", group: "A" });
     });
     groupA.appendChild(eliminateABtn);
     
@@ -480,7 +497,7 @@ function show5050Groups(state) {
     eliminateBBtn.className = "eliminate-group";
     eliminateBBtn.textContent = "Eliminate Group B";
     eliminateBBtn.addEventListener("click", () => {
-      ws.send(JSON.stringify({ type: "eliminate", group: "B" }));
+      Wire.send(ws, { type: "eliminate", group: "B" });
     });
     groupB.appendChild(eliminateBBtn);
   }
@@ -704,7 +721,7 @@ function showFilmDetails(film, state) {
     const eliminateButton = details.querySelector(".eliminate");
     if (eliminateButton) {
       eliminateButton.addEventListener("click", () => {
-        ws.send(JSON.stringify({ type: "eliminate", film: film.Title }));
+        Wire.send(ws, { type: "eliminate", film_id: film.imdbID });
       });
     }
   }
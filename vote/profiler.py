@@ -0,0 +1,147 @@
+"""On-demand profiling of a running vote server, for when a live session feels slow.
+
+A Capture runs for a fixed number of seconds and can record:
+
+- a cProfile of everything the event loop runs (the whole server runs on it);
+- event-loop lag: how late a task that sleeps LAG_INTERVAL at a time wakes
+  up, i.e. how long something else held the loop;
+- wall time per call of chosen functions, e.g. each message type's handler.
+
+Nothing is installed until a capture starts, and everything is taken out again
+when it ends: functions are timed by swapping a wrapper in for them and
+swapping the original back, so when no capture is running the server runs
+exactly the code it would without this module.
+
+The report is written as JSON next to a .pstats file (load it with pstats or
+snakeviz) in PROFILE_DIR, and returned to the caller.
+"""
+
+import asyncio
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import statistics
+import time
+
+PROFILE_DIR = os.environ.get("VOTE_PROFILE_DIR", "profiles")
+MAX_SECONDS = 120.0
+LAG_INTERVAL = 0.01
+# Functions listed in the report, by cumulative time
+TOP_FUNCTIONS = 40
+
+
+class CaptureInProgress(RuntimeError):
+    pass
+
+
+def percentiles(samples):
+    """count/p50/p99/max of ``samples`` (seconds), in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ms = sorted(s * 1000 for s in samples)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else [ms[0]] * 99
+    return {"count": len(ms), "p50": round(cuts[49], 3), "p99": round(cuts[98], 3), "max": round(ms[-1], 3)}
+
+
+class Capture:
+    """One time-bounded profiling run. At most one can run at a time."""
+
+    running = None
+
+    def __init__(self, seconds, cpu=True, targets=()):
+        """``targets`` are (name, namespace, attribute, label) tuples naming the functions to time.
+
+        ``namespace`` is a class or a module's globals(); ``label(*args)``, if
+        given, splits a function's timings by its arguments, e.g. by message type.
+        """
+        self.seconds = min(max(seconds, 0.1), MAX_SECONDS)
+        self.profile = cProfile.Profile() if cpu else None
+        self.targets = targets
+        self.lag = []
+        self.timings = {}  # "name" or "name:label" -> seconds per call
+        self.originals = []
+
+    async def run(self):
+        if Capture.running is not None:
+            raise CaptureInProgress("A profile is already being captured")
+        Capture.running = self
+        started = time.time()
+        lag_task = asyncio.create_task(self.measure_lag())
+        self.install()
+        try:
+            if self.profile is not None:
+                self.profile.enable()
+            await asyncio.sleep(self.seconds)
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+            self.uninstall()
+            lag_task.cancel()
+            Capture.running = None
+        return await asyncio.to_thread(self.write_report, started)
+
+    async def measure_lag(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+    def install(self):
+        for name, namespace, attribute, label in self.targets:
+            original = get(namespace, attribute)
+            self.originals.append((namespace, attribute, original))
+            put(namespace, attribute, self.timed(name, original, label))
+
+    def uninstall(self):
+        for namespace, attribute, original in reversed(self.originals):
+            put(namespace, attribute, original)
+        self.originals = []
+
+    def timed(self, name, function, label):
+        timings = self.timings
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            key = f"{name}:{label(*args)}" if label is not None else name
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                timings.setdefault(key, []).append(time.perf_counter() - start)
+
+        return wrapper
+
+    def write_report(self, started):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"profile-{stamp}-{os.getpid()}")
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "seconds": self.seconds,
+            "loop_lag_ms": percentiles(self.lag),
+            "calls_ms": {key: percentiles(samples) for key, samples in sorted(self.timings.items())},
+        }
+        if self.profile is not None:
+            self.profile.dump_stats(base + ".pstats")
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            report["pstats_file"] = base + ".pstats"
+            report["top_functions"] = out.getvalue()
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        report["report_file"] = base + ".json"
+        return report
+
+
+def get(namespace, attribute):
+    return namespace[attribute] if isinstance(namespace, dict) else getattr(namespace, attribute)
+
+
+def put(namespace, attribute, value):
+    if isinstance(namespace, dict):
+        namespace[attribute] = value
+    else:
+        setattr(namespace, attribute, value)
@@ -0,0 +1,161 @@
+"""What clients may send over the websocket, checked before it reaches a session.
+
+Each message type has a schema of its fields. The schemas are compiled once,
+at import, into plain validator functions, so checking a message costs one JSON
+parse plus a handful of isinstance() calls. decode() raises ProtocolError for
+anything malformed; the message says what was wrong and is safe to send back.
+
+Fields that are missing or null fall back to the engine's defaults, unless they
+are required. Unknown fields are ignored.
+
+Wire formats are negotiated with websocket subprotocols. Clients that offer
+"vote.msgpack" (and a server with msgpack installed) exchange binary
+MessagePack frames whose map keys are small integers (FIELD_TAGS) instead of
+names like "connected_players". Everyone else, including old clients that offer
+nothing, gets JSON text. The server builds every frame as JSON text either way;
+binary clients get it converted once per frame, see to_msgpack().
+"""
+
+import json
+from functools import lru_cache
+
+try:
+    import msgpack
+except ImportError:  # The compact format is optional; every client can fall back to JSON
+    msgpack = None
+
+# Large enough for the whole catalog, small enough that nobody can make us chew on megabytes
+MAX_LIST = 1000
+MAX_STRING = 200
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def is_str(value):
+    return isinstance(value, str) and len(value) <= MAX_STRING
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_str_list(value):
+    return isinstance(value, list) and len(value) <= MAX_LIST and all(map(is_str, value))
+
+
+def is_group(value):
+    return value in ("A", "B")
+
+
+# type -> {field: (check, required)}
+SCHEMAS = {
+    "join": {"name": (is_str, True), "player_id": (is_str, False)},
+    "host_reconnect": {"host_id": (is_str, False)},
+    "start": {"film_ids": (is_str_list, True), "vote_style": (is_str, False),
+              "hybrid_threshold": (is_int, False)},
+    "eliminate": {"film_id": (is_str, False), "group": (is_group, False)},
+    "reorder": {"order": (is_str_list, True)},
+    "kick_player": {"player": (is_str, True)},
+    "resync": {},
+    "pong": {},
+}
+
+
+def compile_schema(fields):
+    checks = tuple((name, check, required) for name, (check, required) in fields.items())
+
+    def validate(data):
+        for name, check, required in checks:
+            value = data.get(name)
+            if value is None:
+                if required:
+                    raise ProtocolError(f"Missing field: {name}")
+            elif not check(value):
+                raise ProtocolError(f"Invalid field: {name}")
+
+    return validate
+
+
+VALIDATORS = {message_type: compile_schema(fields) for message_type, fields in SCHEMAS.items()}
+
+_decode = json.JSONDecoder().decode
+
+JSON_SUBPROTOCOL = "vote.json"
+MSGPACK_SUBPROTOCOL = "vote.msgpack"
+
+# Map keys sent as integers in MessagePack frames, by position. Only ever append
+# to this: clients have their own copy (wire.js) and rely on the positions.
+FIELD_TAGS = (
+    "type", "seq", "epoch", "state", "set", "remove", "append",
+    "films_remaining", "eliminated", "players", "currentPlayer", "current_turn",
+    "started", "connected_players", "winner", "has_winner", "vote_style",
+    "hybrid_threshold", "group_a", "group_b",
+    "id", "name", "message", "is_host", "can_rejoin", "vote_in_progress",
+    "player_id", "host_id", "film_ids", "film_id", "group", "order", "player",
+)
+TAG_OF = {name: tag for tag, name in enumerate(FIELD_TAGS)}
+
+
+def tag_keys(value):
+    if isinstance(value, dict):
+        return {TAG_OF.get(k, k): tag_keys(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [tag_keys(v) for v in value]
+    return value
+
+
+def untag_keys(value):
+    if isinstance(value, dict):
+        return {(FIELD_TAGS[k] if isinstance(k, int) and 0 <= k < len(FIELD_TAGS) else k): untag_keys(v)
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [untag_keys(v) for v in value]
+    return value
+
+
+@lru_cache(maxsize=256)
+def to_msgpack(frame):
+    """Convert a JSON text frame to tagged MessagePack.
+
+    A broadcast hands the same frame to every client, so it is only converted once.
+    """
+    return msgpack.packb(tag_keys(_decode(frame)))
+
+
+def negotiate(offered):
+    """Pick a subprotocol from those the client offered, in its order of preference.
+
+    Returns (subprotocol to accept with, or None; frame converter for binary clients, or None).
+    """
+    for subprotocol in offered:
+        if subprotocol == MSGPACK_SUBPROTOCOL and msgpack is not None:
+            return subprotocol, to_msgpack
+        if subprotocol == JSON_SUBPROTOCOL:
+            return subprotocol, None
+    return None, None
+
+
+def decode(payload):
+    """Parse and validate one client message (JSON text or MessagePack bytes), returning it as a dict."""
+    if isinstance(payload, bytes):
+        if msgpack is None:
+            raise ProtocolError("Binary messages are not supported")
+        try:
+            data = untag_keys(msgpack.unpackb(payload, strict_map_key=False))
+        except Exception:  # msgpack raises several unrelated types for bad input
+            raise ProtocolError("Message is not valid MessagePack") from None
+    else:
+        try:
+            data = _decode(payload)
+        except ValueError:
+            raise ProtocolError("Message is not valid JSON") from None
+    if not isinstance(data, dict):
+        raise ProtocolError("Message must be an object")
+    message_type = data.get("type")
+    validate = VALIDATORS.get(message_type) if isinstance(message_type, str) else None
+    if validate is None:
+        raise ProtocolError(f"Unknown message type: {message_type!r:.40}")
+    validate(data)
+    return data
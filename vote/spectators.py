@@ -0,0 +1,214 @@
+"""Read-only viewers of a session, e.g. a projector or a remote audience.
+
+Spectators never join a session's clients one by one. Each session has at most
+one Gallery per worker, which the session (or the worker's Relay, see
+cluster.py) treats as a single client: a broadcast costs one push_state() no
+matter how many people are watching. The gallery keeps the latest state as one
+pre-encoded state_snapshot frame, built at most once per update and only if
+someone is watching, and every viewer sends that same frame at its own pace. A
+viewer that falls behind skips straight to the latest state; there is no
+backlog to collapse and nothing a slow viewer can hold up.
+
+Viewers connect with a websocket (/watch/<code>, JSON or MessagePack like the
+player sockets, anything they send is ignored) or with Server-Sent Events
+(/watch/<code>/events). Either way every message is a full state_snapshot, so
+a page can feed them to a StateStream as is.
+"""
+
+import asyncio
+import json
+import logging
+
+import metrics
+
+log = logging.getLogger("vote.spectators")
+
+# Seconds between keepalives while the state is not changing
+KEEPALIVE_INTERVAL = 20.0
+PING = '{"type":"ping"}'
+
+
+def apply_patch(state, patch):
+    """Apply a state_patch message to ``state`` in place, like StateStream.handle() does."""
+    state.update(patch.get("set", {}))
+    for key, removed in patch.get("remove", {}).items():
+        removed = set(removed)
+        state[key] = [i for i in state.get(key) or () if i not in removed]
+    for key, added in patch.get("append", {}).items():
+        state[key] = (state.get(key) or []) + added
+
+
+class Gallery:
+    """All of one session's spectators on this worker, attached to the session as one client.
+
+    Whoever attaches it sets ``resync`` (ask the session for a fresh snapshot),
+    ``detach`` (stop receiving updates) and ``on_close`` (forget this gallery).
+    """
+
+    __slots__ = ("session_code", "resync", "detach", "on_close", "state", "seq", "epoch", "snapshot",
+                 "frame", "sse", "version", "changed", "viewers", "closed", "close_code")
+
+    def __init__(self, session_code):
+        self.session_code = session_code
+        self.resync = self.detach = self.on_close = lambda: None
+        self.state = None      # Rebuilt from patches when the session is on another worker
+        self.seq = None
+        self.epoch = None
+        self.snapshot = None   # Callable returning the session's latest snapshot frame, on its own worker
+        self.frame = None      # Latest state_snapshot frame, built on first use after each update
+        self.sse = None        # The same as a Server-Sent Event
+        self.version = 0
+        self.changed = asyncio.get_running_loop().create_future()
+        self.viewers = 0
+        self.closed = False
+        self.close_code = 1000
+
+    # The session's side: the same calls it makes on an Outbox
+
+    async def send_text(self, frame):
+        if frame.startswith('{"type":"state_snapshot"'):
+            message = json.loads(frame)
+            self.state, self.seq, self.epoch = message["state"], message["seq"], message["epoch"]
+            self.snapshot = None
+            self._publish(frame)
+        # Nothing else sent directly to a client concerns spectators
+
+    def push_state(self, frame, snapshot=None):
+        if snapshot is not None:
+            # The owner can build a snapshot whenever we need one, so skip the patch entirely
+            self.snapshot = snapshot
+            self._publish(None)
+            return
+        if self.state is None:
+            return  # Still waiting for the first snapshot
+        patch = json.loads(frame)
+        if patch["seq"] != self.seq + 1:
+            self.state = None
+            self.resync()
+            return
+        apply_patch(self.state, patch)
+        self.seq = patch["seq"]
+        self._publish(None)
+
+    async def close(self, code=1000):
+        """Disconnect every viewer, e.g. because the session moved to another worker."""
+        self.shut(code)
+
+    def shut(self, code=1000):
+        if self.closed:
+            return
+        self.closed = True
+        self.close_code = code
+        self._wake()
+        self.on_close()
+        self.detach()
+
+    def _publish(self, frame):
+        self.frame = frame
+        self.sse = None
+        self.version += 1
+        self._wake()
+
+    def _wake(self):
+        changed, self.changed = self.changed, asyncio.get_running_loop().create_future()
+        changed.set_result(None)
+
+    # The viewers' side
+
+    def latest(self):
+        """The latest state as a state_snapshot frame, encoded once however many viewers ask."""
+        if self.frame is None:
+            if self.snapshot is not None:
+                self.frame = self.snapshot()
+            elif self.state is not None:
+                self.frame = json.dumps({"type": "state_snapshot", "seq": self.seq, "epoch": self.epoch,
+                                         "state": self.state}, separators=(",", ":"))
+        return self.frame
+
+    def join(self):
+        self.viewers += 1
+
+    def leave(self):
+        self.viewers -= 1
+        if self.viewers == 0:
+            # Nobody is watching; stop costing the session anything
+            self.shut()
+
+    async def updates(self):
+        """Yield the latest frame each time the state changes, or None every KEEPALIVE_INTERVAL without a change.
+
+        Updates that arrive while the viewer is still sending are skipped.
+        """
+        seen = None
+        while not self.closed:
+            if seen == self.version or self.latest() is None:
+                try:
+                    # Shielded: the future is shared by every viewer
+                    await asyncio.wait_for(asyncio.shield(self.changed), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield None
+                continue
+            seen = self.version
+            yield self.latest()
+
+
+async def watch_socket(websocket, gallery, to_binary, send_timeout):
+    """Stream state to a spectator's websocket until either side goes away."""
+    sender = asyncio.create_task(send_updates(websocket, gallery, to_binary, send_timeout))
+    receiver = asyncio.create_task(drain(websocket))
+    gallery.join()
+    metrics.spectators_joined.inc("websocket")
+    try:
+        done, _ = await asyncio.wait((sender, receiver), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        gallery.leave()
+    if receiver not in done:
+        # The gallery closed or the viewer stopped taking frames; the viewer is still there
+        try:
+            await asyncio.wait_for(websocket.close(code=gallery.close_code), send_timeout)
+        except Exception:
+            pass  # The socket is already unusable
+
+
+async def send_updates(websocket, gallery, to_binary, send_timeout):
+    async for frame in gallery.updates():
+        payload = PING if frame is None else frame
+        try:
+            if to_binary is not None:
+                payload = to_binary(payload)  # Cached, so encoded once for all binary viewers
+                send = websocket.send_bytes(payload)
+            else:
+                send = websocket.send_text(payload)
+            await asyncio.wait_for(send, send_timeout)
+            metrics.bytes_sent.inc(amount=len(payload))
+        except Exception as e:
+            log.info("Dropping spectator that could not be sent to",
+                     extra={"session": gallery.session_code, "error": repr(e)})
+            metrics.send_failures.inc()
+            metrics.clients_dropped.inc("send_failed")
+            return
+
+
+async def drain(websocket):
+    # Spectators have nothing to say; read only to notice when they leave
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+async def sse_events(gallery):
+    """Server-Sent Events for one spectator: a "state" event per update, comments as keepalives."""
+    gallery.join()
+    metrics.spectators_joined.inc("sse")
+    try:
+        async for frame in gallery.updates():
+            if frame is None:
+                yield b": keepalive\n\n"
+                continue
+            if gallery.sse is None:
+                gallery.sse = f"event: state\ndata: {frame}\n\n".encode()
+            metrics.bytes_sent.inc(amount=len(gallery.sse))
+            yield gallery.sse
+    finally:
+        gallery.leave()
@@ -0,0 +1,115 @@
+// static/state_stream.js
+// Rebuilds the full vote state from the server's versioned state stream.
+// The server sends one state_snapshot when a socket connects, then state_patch
+// messages tagged with a sequence number. If a patch arrives out of sequence
+// we ask the server for a fresh snapshot and ignore patches until it arrives.
+// A page keeps one stream across reconnects: the new socket's URL carries the
+// last state seen (resumeQuery), so the server can send just the missed patches.
+// Films are referenced by imdbID and looked up in the server's catalog, which
+// is fetched once per page load (and cached by the browser via its ETag).
+
+// State fields holding imdbIDs that the UI expects as film objects
+const FILM_LIST_FIELDS = ["films_remaining", "eliminated", "group_a", "group_b"];
+
+class StateStream {
+  constructor(requestResync) {
+    this.requestResync = requestResync;
+    this.seq = null;
+    this.epoch = null;
+    this.state = null;
+    this.awaitingResync = false;
+  }
+
+  // The catalog is served over HTTP(S) next to the websocket endpoint;
+  // start fetching it as soon as the page knows where the backend is
+  static useBackend(backendUrl) {
+    StateStream.url = backendUrl.replace(/^ws/, "http").replace(/\/ws$/, "/catalog");
+    StateStream.loadCatalog().catch(error => console.error(error.message));
+  }
+
+  // Fetch the catalog once; every stream resolves films through the same promise
+  static loadCatalog() {
+    if (!StateStream.catalog) {
+      StateStream.catalog = fetch(StateStream.url)
+        .then(res => {
+          if (!res.ok) throw new Error(`Failed to load catalog: ${res.status}`);
+          return res.json();
+        })
+        .then(films => new Map(films.map(film => [film.imdbID, film])))
+        .catch(error => {
+          // Let the next state update try again
+          StateStream.catalog = null;
+          throw error;
+        });
+    }
+    return StateStream.catalog;
+  }
+
+  // Query string for a new socket's URL, asking to resume after the last state seen
+  resumeQuery() {
+    if (this.state === null || this.awaitingResync || !this.epoch) {
+      return "";
+    }
+    return `?since=${encodeURIComponent(`${this.epoch}.${this.seq}`)}`;
+  }
+
+  // Returns a promise of the rebuilt state for snapshot/patch messages, or null
+  // if the message is not part of the state stream or could not be applied.
+  handle(message) {
+    if (message.type === "state_snapshot") {
+      this.seq = message.seq;
+      this.epoch = message.epoch;
+      this.state = { ...message.state };
+      this.awaitingResync = false;
+      return this.view();
+    }
+
+    if (message.type !== "state_patch") {
+      return null;
+    }
+
+    if (this.awaitingResync) {
+      return null;
+    }
+
+    if (this.state === null || message.seq !== this.seq + 1) {
+      console.warn(`State patch ${message.seq} does not follow ${this.seq}, requesting resync`);
+      this.awaitingResync = true;
+      this.requestResync();
+      return null;
+    }
+
+    const state = { ...this.state };
+    Object.entries(message.set || {}).forEach(([key, value]) => {
+      state[key] = value;
+    });
+    Object.entries(message.remove || {}).forEach(([key, removed]) => {
+      const removedIds = new Set(removed);
+      state[key] = (state[key] || []).filter(id => !removedIds.has(id));
+    });
+    Object.entries(message.append || {}).forEach(([key, added]) => {
+      state[key] = (state[key] || []).concat(added);
+    });
+
+    this.seq = message.seq;
+    this.state = state;
+    return this.view();
+  }
+
+  // Resolve imdbIDs to fresh film lists, so UI code can sort them in place
+  // without corrupting the stream
+  view() {
+    const ids = this.state;
+    const seq = this.seq;
+    return StateStream.loadCatalog().then(catalog => {
+      const state = { ...ids, type: "state_update", seq };
+      FILM_LIST_FIELDS.forEach(key => {
+        state[key] = (ids[key] || []).map(id => catalog.get(id)).filter(Boolean);
+      });
+      state.winner = ids.winner ? catalog.get(ids.winner) || null : null;
+      // Player UI reads the camelCase name
+      state.filmsRemaining = state.films_remaining;
+      return state;
+    });
+  }
+}
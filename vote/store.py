@@ -0,0 +1,194 @@
+"""Durable storage for vote sessions, so a restart doesn't wipe votes in progress.
+
+A store sees every session twice over: a snapshot (engine.Session.to_dict())
+whenever a session is created or compacted, and an event for each action that
+changed it, tagged with who sent it (engine.Session.identify()). Loading a
+session restores its latest snapshot and replays the events logged since, which
+reproduces the same IDs and shuffles because the session's RNG state is part
+of the snapshot.
+
+The methods are coroutines, called from the session actors on the event loop;
+a backend that touches the disk does so off the loop (see SqliteSessionStore).
+
+Backends:
+    MemorySessionStore  - keeps everything in dicts; survives nothing, for tests
+    SqliteSessionStore  - append-only event log plus compacted snapshots
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import Session
+
+log = logging.getLogger("vote.store")
+
+# Actions that change what a session would look like after a restart
+DURABLE_ACTIONS = frozenset(("join", "start", "eliminate", "reorder", "kick_player"))
+
+# Events logged for one session before it is compacted into a fresh snapshot
+SNAPSHOT_EVERY = 50
+
+# Seconds a write waits for another worker's lock on the sqlite file before failing
+BUSY_TIMEOUT = 2.0
+
+
+class SessionStore(abc.ABC):
+    """Interface shared by the storage backends."""
+
+    @abc.abstractmethod
+    async def load(self, code, catalog):
+        """Return the stored engine.Session for ``code``, or None if there isn't one."""
+
+    @abc.abstractmethod
+    async def save_snapshot(self, code, session):
+        pass
+
+    @abc.abstractmethod
+    async def record(self, code, session, identity, action):
+        """Log ``action``, already applied to ``session`` on behalf of ``identity``."""
+
+    @abc.abstractmethod
+    async def delete(self, code):
+        pass
+
+    def close(self):
+        pass
+
+
+def rebuild(snapshot, events, catalog):
+    session = Session.from_dict(snapshot, catalog)
+    for identity, action in events:
+        session.replay(identity, action)
+    return session
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        self.snapshots = {}  # code -> snapshot dict
+        self.events = {}     # code -> [(identity, action)] since the snapshot
+
+    async def load(self, code, catalog):
+        if code not in self.snapshots:
+            return None
+        return rebuild(self.snapshots[code], self.events.get(code, []), catalog)
+
+    async def save_snapshot(self, code, session):
+        self.snapshots[code] = session.to_dict()
+        self.events[code] = []
+
+    async def record(self, code, session, identity, action):
+        events = self.events.setdefault(code, [])
+        events.append((identity, action))
+        if len(events) >= SNAPSHOT_EVERY:
+            await self.save_snapshot(code, session)
+
+    async def delete(self, code):
+        self.snapshots.pop(code, None)
+        self.events.pop(code, None)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in a sqlite file, which all of a machine's workers can share.
+
+    Every query runs on one writer thread, in the order the actors asked for
+    them, so a commit waiting on the disk (or on another worker's lock) holds
+    up only the actor that made it, not the event loop. Sessions and actions
+    are encoded before they are handed over, as the actor goes on changing them.
+    """
+
+    def __init__(self, path):
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vote-store")
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # WAL with synchronous=NORMAL keeps each append cheap while staying crash-safe
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                code TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT NOT NULL,
+                identity TEXT NOT NULL,
+                action TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_by_code ON events (code, id);
+        """)
+        self.pending = {}  # code -> events logged since the last snapshot
+
+    def run(self, query, *args):
+        """Run ``query(*args)`` on the writer thread."""
+        return asyncio.wrap_future(self.writer.submit(query, *args))
+
+    async def load(self, code, catalog):
+        stored = await self.run(self.read, code)
+        if stored is None:
+            return None
+        snapshot, rows = stored
+        events = [(json.loads(identity), json.loads(action)) for identity, action in rows]
+        try:
+            session = rebuild(json.loads(snapshot), events, catalog)
+        except (KeyError, ValueError) as e:
+            # e.g. a film that has since left the catalog
+            log.warning("Could not restore session", extra={"session": code, "error": repr(e)})
+            return None
+        self.pending[code] = len(events)
+        return session
+
+    def read(self, code):
+        row = self.db.execute("SELECT data FROM snapshots WHERE code = ?", (code,)).fetchone()
+        if row is None:
+            return None
+        rows = self.db.execute(
+            "SELECT identity, action FROM events WHERE code = ? ORDER BY id", (code,)
+        ).fetchall()
+        return row[0], rows
+
+    async def save_snapshot(self, code, session):
+        self.pending[code] = 0
+        await self.run(self.write_snapshot, code, json.dumps(session.to_dict(), separators=(",", ":")))
+
+    def write_snapshot(self, code, data):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO snapshots (code, data) VALUES (?, ?)", (code, data))
+            self.db.execute("DELETE FROM events WHERE code = ?", (code,))
+
+    async def record(self, code, session, identity, action):
+        self.pending[code] = self.pending.get(code, 0) + 1
+        await self.run(self.write_event, code, json.dumps(identity), json.dumps(action, separators=(",", ":")))
+        if self.pending[code] >= SNAPSHOT_EVERY:
+            await self.save_snapshot(code, session)
+
+    def write_event(self, code, identity, action):
+        with self.db:
+            self.db.execute(
+                "INSERT INTO events (code, identity, action) VALUES (?, ?, ?)", (code, identity, action)
+            )
+
+    async def delete(self, code):
+        self.pending.pop(code, None)
+        await self.run(self.write_delete, code)
+
+    def write_delete(self, code):
+        with self.db:
+            self.db.execute("DELETE FROM snapshots WHERE code = ?", (code,))
+            self.db.execute("DELETE FROM events WHERE code = ?", (code,))
+
+    def close(self):
+        # Let the writes already queued finish first
+        self.writer.shutdown(wait=True)
+        self.db.close()
+
+
+def open_store(spec):
+    """Open a store from a spec such as ``memory`` or ``sqlite:sessions.db``."""
+    if spec == "memory":
+        return MemorySessionStore()
+    if spec.startswith("sqlite:"):
+        return SqliteSessionStore(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown session store: {spec!r}")
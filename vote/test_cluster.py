@@ -0,0 +1,299 @@
+"""Relays, leases and brokers, on the in-process broker, a local unix socket and a fake Redis.
+
+    cd vote && python -m pytest test_cluster.py
+"""
+
+import asyncio
+import sys
+import types
+
+import pytest
+
+import broker as brokers
+import cluster
+from broker import BrokerError, BrokerServer, LocalBroker, RedisBroker, SocketBroker
+from cluster import OwnerLink, Relay
+
+
+@pytest.fixture(autouse=True)
+def fast_leases(monkeypatch):
+    monkeypatch.setattr(cluster, "LEASE_RENEW", 0.01)
+    monkeypatch.setattr(cluster, "LEASE_TTL", 0.5)
+
+
+class FakeSocket:
+    """What a Relay needs of a client's outbox."""
+
+    def __init__(self):
+        self.states = []
+        self.texts = []
+        self.closed = None
+
+    def push_state(self, frame, snapshot=None):
+        self.states.append(frame)
+
+    async def send_text(self, frame):
+        self.texts.append(frame)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+async def until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+def test_relay_carries_messages_both_ways():
+    async def main():
+        broker = LocalBroker()
+        owner = OwnerLink(broker, "A", "S1")
+        assert await owner.claim()
+        posted = []
+        owner.start(lambda conn, data: posted.append((conn, data)), lambda: None)
+        # The session is taken, so worker B relays to A
+        assert not await OwnerLink(broker, "B", "S1").claim()
+        relay = Relay(broker, "B", "S1", on_close=lambda: None)
+        await relay.start()
+        socket = FakeSocket()
+        target = await relay.attach(socket, since="e.3")
+
+        await until(lambda: posted)
+        conn, data = posted[0]
+        assert conn.target == target
+        assert data == {"type": "connect", "new_session": False, "since": "e.3"}
+
+        await owner.broadcast("frame 1")
+        await conn.send_text("just for you")
+        await until(lambda: socket.states and socket.texts)
+        assert socket.states == ["frame 1"] and socket.texts == ["just for you"]
+
+        await relay.detach(target)
+        await until(lambda: len(posted) == 2)
+        assert posted[1][1] == {"type": "disconnect"} and not owner.remote
+        await owner.close()
+
+    asyncio.run(main())
+
+
+def test_relay_hands_over_when_the_owner_goes():
+    async def main():
+        broker = LocalBroker()
+        owner = OwnerLink(broker, "A", "S1")
+        assert await owner.claim()
+        owner.start(lambda conn, data: None, lambda: None)
+        closed = []
+        relay = Relay(broker, "B", "S1", on_close=lambda: closed.append(True))
+        await relay.start()
+        socket = FakeSocket()
+        await relay.attach(socket)
+
+        await asyncio.sleep(0.05)
+        assert socket.closed is None  # The owner keeps renewing its lease
+        await owner.close()
+        # The relay notices, gives the lease back and has its clients reconnect
+        await until(lambda: socket.closed is not None)
+        assert socket.closed == 1012 and closed
+        assert await OwnerLink(broker, "B", "S1").claim()
+
+    asyncio.run(main())
+
+
+def test_a_broker_error_loses_the_lease():
+    class FailingBroker(LocalBroker):
+        failing = False
+
+        async def claim(self, key, owner, ttl):
+            if self.failing:
+                raise BrokerError("broker went away")
+            return await super().claim(key, owner, ttl)
+
+        async def release(self, key, owner):
+            if self.failing:
+                raise BrokerError("broker went away")
+            await super().release(key, owner)
+
+    async def main():
+        broker = FailingBroker()
+        owner = OwnerLink(broker, "A", "S1")
+        assert await owner.claim()
+        lost = asyncio.Event()
+        owner.start(lambda conn, data: None, lost.set)
+        broker.failing = True
+        await asyncio.wait_for(lost.wait(), 2)
+        await owner.close()  # Even though the release fails too
+
+    asyncio.run(main())
+
+
+def test_socket_broker(tmp_path):
+    async def main():
+        path = str(tmp_path / "broker.sock")
+        server = asyncio.create_task(BrokerServer().serve(path))
+        await until(lambda: (tmp_path / "broker.sock").exists())
+        a, b = SocketBroker(path), SocketBroker(path)
+        assert await a.claim("k", "A", 10)
+        assert not await b.claim("k", "B", 10)
+        await a.release("k", "A")
+        assert await b.claim("k", "B", 10)
+
+        subscription = await a.subscribe("ch")
+        await asyncio.sleep(0.05)  # Until the server has the subscription
+        await b.publish("ch", "hello")
+        assert await asyncio.wait_for(subscription.queue.get(), 2) == "hello"
+        await a.close()
+        await b.close()
+        server.cancel()
+
+    asyncio.run(main())
+
+
+def serve_once(path, answer):
+    """A server that reads one request and then calls ``answer(writer)``."""
+    async def handle(reader, writer):
+        await reader.readline()
+        await answer(writer)
+
+    return asyncio.start_unix_server(handle, path=path)
+
+
+def test_socket_broker_calls_fail_when_the_connection_closes(tmp_path):
+    async def hang_up(writer):
+        writer.close()
+
+    async def main():
+        path = str(tmp_path / "broker.sock")
+        async with await serve_once(path, hang_up):
+            broker = SocketBroker(path)
+            with pytest.raises(BrokerError, match="closed"):
+                await broker.claim("k", "A", 10)
+            assert not broker.requests
+            # The next call connects again
+            with pytest.raises(BrokerError, match="closed"):
+                await broker.claim("k", "A", 10)
+
+    asyncio.run(main())
+
+
+def test_socket_broker_calls_time_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(brokers, "CALL_TIMEOUT", 0.05)
+
+    async def say_nothing(writer):
+        await asyncio.sleep(10)
+
+    async def main():
+        path = str(tmp_path / "broker.sock")
+        async with await serve_once(path, say_nothing):
+            broker = SocketBroker(path)
+            with pytest.raises(BrokerError, match="No answer"):
+                await broker.claim("k", "A", 10)
+            assert not broker.requests
+            await broker.close()
+
+    asyncio.run(main())
+
+
+def test_socket_broker_without_a_server(tmp_path):
+    async def main():
+        broker = SocketBroker(str(tmp_path / "nobody.sock"))
+        with pytest.raises(BrokerError, match="connect"):
+            await broker.claim("k", "A", 10)
+
+    asyncio.run(main())
+
+
+class FakeRedisError(Exception):
+    pass
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.channels = set()
+        self.items = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        if self.server.down:
+            raise FakeRedisError("connection refused")
+        self.channels.update(channels)
+        self.server.pubsubs.add(self)
+
+    async def unsubscribe(self, channel):
+        self.channels.discard(channel)
+
+    async def listen(self):
+        while self.channels:
+            item = await self.items.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def close(self):
+        self.server.pubsubs.discard(self)
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for RedisBroker, with a pub/sub connection that can drop."""
+
+    def __init__(self):
+        self.down = False
+        self.pubsubs = set()
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def register_script(self, script):
+        async def run(keys, args):
+            return 1
+        return run
+
+    async def publish(self, channel, message):
+        for pubsub in self.pubsubs:
+            if channel in pubsub.channels:
+                pubsub.items.put_nowait({"type": "message", "channel": channel, "data": message})
+
+    def drop(self):
+        self.down = True
+        for pubsub in self.pubsubs:
+            pubsub.items.put_nowait(FakeRedisError("connection reset"))
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = FakeRedis()
+    exceptions = types.SimpleNamespace(ConnectionError=FakeRedisError, TimeoutError=asyncio.TimeoutError)
+    aio = types.SimpleNamespace(from_url=lambda url, decode_responses: server)
+    monkeypatch.setitem(sys.modules, "redis", types.SimpleNamespace(asyncio=aio, exceptions=exceptions))
+    monkeypatch.setitem(sys.modules, "redis.asyncio", aio)
+    monkeypatch.setattr(brokers, "RECONNECT_BACKOFF", 0.01)
+    monkeypatch.setattr(brokers, "RECONNECT_BACKOFF_MAX", 0.02)
+    return server
+
+
+def test_redis_broker_resubscribes_after_the_connection_drops(fake_redis):
+    async def main():
+        broker = RedisBroker("redis://fake")
+        a, b = await broker.subscribe("a"), await broker.subscribe("b")
+        await broker.publish("a", "before")
+        assert await asyncio.wait_for(a.queue.get(), 2) == "before"
+
+        fake_redis.drop()
+        # While it can't reconnect, leases and new subscriptions fail
+        await until(lambda: broker.failure is not None)
+        with pytest.raises(BrokerError):
+            await broker.claim("k", "A", 10)
+        with pytest.raises(BrokerError):
+            await broker.subscribe("c")
+
+        fake_redis.down = False
+        await until(lambda: broker.failure is None)
+        assert await broker.claim("k", "A", 10)
+        await broker.publish("a", "after")
+        await broker.publish("b", "after")
+        assert await asyncio.wait_for(a.queue.get(), 2) == "after"
+        assert await asyncio.wait_for(b.queue.get(), 2) == "after"
+        broker.reader.cancel()
+
+    asyncio.run(main())
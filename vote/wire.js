@@ -0,0 +1,222 @@
+// static/wire.js
+// Encodes and decodes vote messages for the websocket. Sockets opened with
+// Wire.open() offer the compact MessagePack format first and JSON second; the
+// server picks one (ws.protocol), and servers without MessagePack support, or
+// older ones that ignore subprotocols, simply keep talking JSON.
+// In MessagePack frames, map keys listed in FIELD_TAGS travel as their index
+// instead of their name. Keep the list in sync with FIELD_TAGS in protocol.py.
+
+const FIELD_TAGS = [
+  "type", "seq", "epoch", "state", "set", "remove", "append",
+  "films_remaining", "eliminated", "players", "currentPlayer", "current_turn",
+  "started", "connected_players", "winner", "has_winner", "vote_style",
+  "hybrid_threshold", "group_a", "group_b",
+  "id", "name", "message", "is_host", "can_rejoin", "vote_in_progress",
+  "player_id", "host_id", "film_ids", "film_id", "group", "order", "player",
+];
+const TAG_OF = new Map(FIELD_TAGS.map((name, tag) => [name, tag]));
+const TEXT_ENCODER = new TextEncoder();
+const TEXT_DECODER = new TextDecoder();
+
+const MSGPACK_PROTOCOL = "vote.msgpack";
+const JSON_PROTOCOL = "vote.json";
+
+class Wire {
+  static open(url) {
+    const ws = new WebSocket(url, [MSGPACK_PROTOCOL, JSON_PROTOCOL]);
+    ws.binaryType = "arraybuffer";
+    return ws;
+  }
+
+  static send(ws, message) {
+    if (ws.protocol === MSGPACK_PROTOCOL) {
+      ws.send(Wire.pack(message));
+    } else {
+      ws.send(JSON.stringify(message));
+    }
+  }
+
+  // Decode a message event's data, whichever format it arrived in
+  static decode(data) {
+    if (typeof data === "string") {
+      return JSON.parse(data);
+    }
+    return new Unpacker(new Uint8Array(data)).read();
+  }
+
+  static pack(message) {
+    const packer = new Packer();
+    packer.write(message);
+    return packer.bytes();
+  }
+}
+
+// Minimal MessagePack writer covering what JSON can express
+class Packer {
+  constructor() {
+    this.buffer = new Uint8Array(256);
+    this.view = new DataView(this.buffer.buffer);
+    this.length = 0;
+  }
+
+  bytes() {
+    return this.buffer.slice(0, this.length);
+  }
+
+  reserve(n) {
+    if (this.length + n <= this.buffer.length) return;
+    const grown = new Uint8Array(Math.max(this.buffer.length * 2, this.length + n));
+    grown.set(this.buffer);
+    this.buffer = grown;
+    this.view = new DataView(grown.buffer);
+  }
+
+  byte(b) {
+    this.reserve(1);
+    this.buffer[this.length++] = b;
+  }
+
+  header(small, fix, n) {
+    // fix* formats for short lengths, then the 16- and 32-bit forms
+    if (n < small) {
+      this.byte(fix | n);
+    } else if (n < 0x10000) {
+      this.byte(fix === 0xa0 ? 0xda : fix === 0x90 ? 0xdc : 0xde);
+      this.reserve(2);
+      this.view.setUint16(this.length, n);
+      this.length += 2;
+    } else {
+      this.byte(fix === 0xa0 ? 0xdb : fix === 0x90 ? 0xdd : 0xdf);
+      this.reserve(4);
+      this.view.setUint32(this.length, n);
+      this.length += 4;
+    }
+  }
+
+  write(value) {
+    if (value === null || value === undefined) {
+      this.byte(0xc0);
+    } else if (value === false || value === true) {
+      this.byte(value ? 0xc3 : 0xc2);
+    } else if (typeof value === "number") {
+      this.number(value);
+    } else if (typeof value === "string") {
+      const encoded = TEXT_ENCODER.encode(value);
+      this.header(32, 0xa0, encoded.length);
+      this.reserve(encoded.length);
+      this.buffer.set(encoded, this.length);
+      this.length += encoded.length;
+    } else if (Array.isArray(value)) {
+      this.header(16, 0x90, value.length);
+      value.forEach(item => this.write(item));
+    } else {
+      const entries = Object.entries(value).filter(([, v]) => v !== undefined);
+      this.header(16, 0x80, entries.length);
+      entries.forEach(([key, v]) => {
+        this.write(TAG_OF.has(key) ? TAG_OF.get(key) : key);
+        this.write(v);
+      });
+    }
+  }
+
+  number(n) {
+    if (Number.isInteger(n) && n >= 0 && n < 0x80) {
+      this.byte(n);
+    } else if (Number.isInteger(n) && n < 0 && n >= -32) {
+      this.byte(n & 0xff);
+    } else if (Number.isInteger(n) && n >= -0x80000000 && n <= 0xffffffff) {
+      this.byte(n < 0 ? 0xd2 : 0xce);
+      this.reserve(4);
+      if (n < 0) this.view.setInt32(this.length, n);
+      else this.view.setUint32(this.length, n);
+      this.length += 4;
+    } else {
+      this.byte(0xcb);
+      this.reserve(8);
+      this.view.setFloat64(this.length, n);
+      this.length += 8;
+    }
+  }
+}
+
+// Minimal MessagePack reader; maps come back as plain objects with tags resolved
+class Unpacker {
+  constructor(bytes) {
+    this.bytes = bytes;
+    this.view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    this.offset = 0;
+  }
+
+  read() {
+    const b = this.bytes[this.offset++];
+    if (b < 0x80) return b;
+    if (b < 0x90) return this.map(b & 0x0f);
+    if (b < 0xa0) return this.array(b & 0x0f);
+    if (b < 0xc0) return this.str(b & 0x1f);
+    if (b >= 0xe0) return b - 0x100;
+    switch (b) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return this.bin(this.uint(1));
+      case 0xc5: return this.bin(this.uint(2));
+      case 0xc6: return this.bin(this.uint(4));
+      case 0xca: return this.take(4, () => this.view.getFloat32(this.offset));
+      case 0xcb: return this.take(8, () => this.view.getFloat64(this.offset));
+      case 0xcc: return this.uint(1);
+      case 0xcd: return this.uint(2);
+      case 0xce: return this.uint(4);
+      case 0xcf: return this.take(8, () => Number(this.view.getBigUint64(this.offset)));
+      case 0xd0: return this.take(1, () => this.view.getInt8(this.offset));
+      case 0xd1: return this.take(2, () => this.view.getInt16(this.offset));
+      case 0xd2: return this.take(4, () => this.view.getInt32(this.offset));
+      case 0xd3: return this.take(8, () => Number(this.view.getBigInt64(this.offset)));
+      case 0xd9: return this.str(this.uint(1));
+      case 0xda: return this.str(this.uint(2));
+      case 0xdb: return this.str(this.uint(4));
+      case 0xdc: return this.array(this.uint(2));
+      case 0xdd: return this.array(this.uint(4));
+      case 0xde: return this.map(this.uint(2));
+      case 0xdf: return this.map(this.uint(4));
+      default: throw new Error(`Unsupported MessagePack type 0x${b.toString(16)}`);
+    }
+  }
+
+  take(n, get) {
+    const value = get();
+    this.offset += n;
+    return value;
+  }
+
+  uint(n) {
+    return this.take(n, () => n === 1 ? this.view.getUint8(this.offset)
+      : n === 2 ? this.view.getUint16(this.offset) : this.view.getUint32(this.offset));
+  }
+
+  str(n) {
+    const value = TEXT_DECODER.decode(this.bytes.subarray(this.offset, this.offset + n));
+    this.offset += n;
+    return value;
+  }
+
+  bin(n) {
+    const value = this.bytes.slice(this.offset, this.offset + n);
+    this.offset += n;
+    return value;
+  }
+
+  array(n) {
+    const value = new Array(n);
+    for (let i = 0; i < n; i++) value[i] = this.read();
+    return value;
+  }
+
+  map(n) {
+    const value = {};
+    for (let i = 0; i < n; i++) {
+      const key = this.read();
+      value[typeof key === "number" && key < FIELD_TAGS.length ? FIELD_TAGS[key] : key] = this.read();
+    }
+    return value;
+  }
+}